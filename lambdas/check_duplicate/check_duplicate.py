@@ -1,13 +1,15 @@
 import os
 import boto3
 import numpy as np
-from numpy.linalg import norm
 from botocore.client import Config
-from utils import create_hash_list
+from utils import create_hash_list, encode_signature, decode_signature
+from lsh_index import LSHIndex, DEFAULT_BANDS, DEFAULT_ROWS
+from lsh_store import get_store
 from notification_email import send_email
 from pandas import DataFrame
-from bs4 import BeautifulSoup
-from typedb.client import TransactionType, SessionType, TypeDB
+from orpml_reader import read_orpml
+from typedb.client import TransactionType
+from typedb_connection import get_connection
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.logging.logger import Logger
 
@@ -17,6 +19,12 @@ search_keys = {'document_uid', 'status',
                'regulatory_topic', 'document_type', 'node_id'}
 return_vals = ['regulatory_topic', 'document_type', 'status']
 SIMILARITY_SCORE_CUTOFF = 0.95
+TOP_K_MATCHES = 5
+LSH_BANDS = int(os.environ.get('LSH_BANDS', DEFAULT_BANDS))
+LSH_ROWS = int(os.environ.get('LSH_ROWS', DEFAULT_ROWS))
+# Regex metacharacters matched as one character classes, the rest escaped with a backslash
+REGEX_CLASS_ESCAPED = set('$.|?*+(){}')
+REGEX_BACKSLASH_ESCAPED = set('\\^[]')
 
 
 def validate_env_variable(env_var_name):
@@ -36,20 +44,20 @@ def download_document(s3_client, document_uid, bucket):
     document = s3_client.get_object(
         Bucket=bucket,
         Key=f'processed/{document_uid}.orpml'
-    )['Body'].read().decode('utf-8')
+    )['Body'].read()
 
     logger.info('Downloaded text')
 
     return document
 
 
-def extract_metadata(document: str) -> dict:
-    soup = BeautifulSoup(document, features='xml')
-    title = soup.metadata.dublinCore.title.text
-    status = soup.metadata.orp.status.text
-    regulatory_topic = soup.metadata.orp.regulatoryTopic.text.split(', ')
-    document_type = soup.metadata.dublinCore.type.text
-    date_created = soup.metadata.dublinCore.created.text
+def extract_metadata(header: dict) -> dict:
+    '''Picks the metadata used for duplicate detection out of the ORPML header'''
+    title = header['dublinCore']['title']
+    status = header['orp']['status']
+    regulatory_topic = header['orp']['regulatoryTopic'].split(', ')
+    document_type = header['dublinCore']['type']
+    date_created = header['dublinCore']['created']
     return {
         'status': status,
         'document_type': document_type,
@@ -59,13 +67,13 @@ def extract_metadata(document: str) -> dict:
     }
 
 
-def extract_text(document: str) -> str:
-    soup = BeautifulSoup(document, features='xml')
-    body_tag = soup.find('body')
-
-    # Extract all the text content from inside the <body> tag
-    text_content = body_tag.get_text(strip=True)
-    return text_content
+def extract_header_and_text(document: bytes) -> tuple:
+    '''
+    Reads the ORPML header and the body text in a single streaming parse
+    The body text is every string inside the <body> tag, stripped and joined
+    '''
+    header, text_content = read_orpml(document)
+    return extract_metadata(header), text_content
 
 
 def group_attributes(attr):
@@ -79,26 +87,57 @@ def getUniqueResult(results):
     return group_attributes(res)
 
 
-def read_transaction(session, hash_list):
+def build_lsh_index(session, bands=LSH_BANDS, rows=LSH_ROWS):
     '''
     params: session: TypeDB session opened
-    params: hash_list: list of integers in hash list
-        returns: matching_hash_list: list of hashes from the database that matched an integer in the hash_list
-                metadata_dict: dictionary of the metadata of all the shortlisted documents
+        returns: lsh_index: LSH index of every live document hash in the graph
+    Only used to bootstrap the index the first time it is missing
     '''
-    logger.info(f'Incoming document hash: {"_".join(hash_list)}')
-    window_size = 6
-    hl = [hash_list[i:i + window_size]
-          for i in range(0, len(hash_list) + 1, window_size)]
-    contains = ' or '.join(['{$h contains \'%s\';}' % "_".join(hash) for hash in hl])
+    query = '''
+    match
+        $u isa regulatoryDocument,
+        has document_uid $document_uid,
+        has hash_text $h;
+        not {$u has status "archive";};
+        get $document_uid, $h;
+    '''
+    lsh_index = LSHIndex(bands=bands, rows=rows)
+    with session.transaction(TransactionType.READ) as read_transaction:
+        for ans in read_transaction.query().match(query):
+            lsh_index.insert(ans.get('document_uid').get_value(),
+                             decode_signature(ans.get('h').get_value()))
+
+    logger.info(f'Built LSH index from graph with {len(lsh_index)} documents')
+    return lsh_index
+
+
+def uid_regex(uids) -> str:
+    '''
+    A TypeQL string literal of a regex matching exactly one of the uids, each taken literally
+    e.g. ['a.b', 'c'] -> "^(a[.]b|c)$"
+    '''
+    def literal(uid):
+        return ''.join(
+            f'[{c}]' if c in REGEX_CLASS_ESCAPED else f'\\{c}' if c in REGEX_BACKSLASH_ESCAPED else c
+            for c in str(uid))
+    regex = '^(' + '|'.join(literal(uid) for uid in uids) + ')$'
+    return '"' + regex.replace('\\', '\\\\').replace('"', '\\"') + '"'
 
+
+def read_transaction(session, candidate_uids):
+    '''
+    params: session: TypeDB session opened
+    params: candidate_uids: list of document UIDs returned by the LSH index
+        returns: matching_hash_list: list of hashes of the candidate documents
+                metadata_dict: dictionary of the metadata of all the shortlisted documents
+    '''
     query = f'''
     match
         $u isa regulatoryDocument,
         {''.join([f'has {i} ${i},' for i in search_keys])}
         has hash_text $h;
         not {{$u has status "archive";}};
-        {contains}; group $u;
+        $document_uid like {uid_regex(candidate_uids)}; group $u;
     '''
 
     logger.info(f"Query:\n {query}")
@@ -113,9 +152,7 @@ def read_transaction(session, hash_list):
                      for a in ans_list]
 
     matching_hash_list = [
-        np.array(
-            hash['hash_text'].split('_'),
-            dtype='uint64') for hash in metadata_dict]
+        decode_signature(hash['hash_text']) for hash in metadata_dict]
 
     # Node IDs
     node_id_list = [node['node_id'] for node in metadata_dict]
@@ -125,27 +162,44 @@ def read_transaction(session, hash_list):
     return matching_hash_list, metadata_dict, node_id_list
 
 
+def score_candidates(hash_np, matching_hash_list, top_k=TOP_K_MATCHES):
+    '''
+    params: hash_np: numpy hash of the incoming document
+    params: matching_hash_list: list of candidate hashes from the database
+    params: top_k: number of best matches to return
+        returns: top_matches: list of (index, score) tuples ordered best first. The score is the
+        MinHash estimate of the Jaccard similarity, i.e. the fraction of equal hash slots
+    '''
+    positions = [i for i, v in enumerate(matching_hash_list) if v.shape == hash_np.shape]
+    if len(positions) < len(matching_hash_list):
+        logger.warning(
+            f"Skipping {len(matching_hash_list) - len(positions)} hashes whose size doesn't match incoming hash.")
+    if not positions:
+        return []
+
+    # One contiguous (candidates x slots) matrix compared against the incoming hash in a single pass
+    signatures = np.vstack([matching_hash_list[i] for i in positions]).astype(np.uint64, copy=False)
+    scores = np.count_nonzero(signatures == hash_np.astype(np.uint64), axis=1) / hash_np.size
+
+    k = min(top_k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return [(positions[i], float(scores[i])) for i in best]
+
+
 def get_similarity_score(hash_np, matching_hash_list):
     '''
     params: hash_np: numpy hash of the incoming document
     params: matching_hash_list: list of hashes from the database that matched an integer in the hash_list
         returns: index or None: index is returned if an exact duplicate is found, otherwise None is returned
     '''
-    scores = []
-    for v in matching_hash_list:
-        if v.shape == hash_np.shape:
-            cosine = np.dot(hash_np, v) / (norm(hash_np) * norm(v))
-            scores.append(cosine)
-        else:
-            logger.warn("Skipping: matching hash size doesn't match incoming hash.")
-
-    max_score = max(scores)
+    top_matches = score_candidates(hash_np=hash_np, matching_hash_list=matching_hash_list)
     logger.info(f"Incoming hash: {hash_np}")
-    logger.info(f"Max score: {max_score}")
-    if (len(scores) > 0) and (max_score >= SIMILARITY_SCORE_CUTOFF):
+    logger.info(f"Top matches (index, score): {top_matches}")
+
+    if top_matches and (top_matches[0][1] >= SIMILARITY_SCORE_CUTOFF):
         logger.info('Possible duplicate text detected')
-        index = scores.index(max(scores))
-        return index
+        return top_matches[0][0]
     else:
         logger.info('New document')
         return None
@@ -180,17 +234,24 @@ def is_duplicate(index, incoming_metadata, complete_existing_metadata,
         return False, existing_dict
 
 
-def search_module(session, hash_np, hash_list, incoming_metadata):
+def search_module(session, hash_np, lsh_store, incoming_metadata):
     '''
     params: session: TypeDB session
     params: hash_np: numpy hash of incoming document text
-    params: hash_list: list of candidate matching hashes in the database
+    params: lsh_store: LSH index of the hashes of existing documents
     params: incoming_metadata: metadata of the incoming document
         returns: is_duplicate_results / False: if is_duplicate_results is returned, the incoming document is a
-        version or duplicate of the incoming document. Otherwise, the document is new.
+        version or duplicate of the incoming document, followed by the node ID and the uid of the
+        existing document. Otherwise, the document is new.
     '''
+    candidate_uids = lsh_store.query(hash_np)
+    logger.info(f'Number of LSH candidates: {len(candidate_uids)}')
+    if not candidate_uids:
+        logger.info("No LSH candidates - no similar documents")
+        return False
+
     matching_hash_list, complete_existing_metadata, node_id_list = read_transaction(
-        session, hash_list)
+        session, candidate_uids)
     index = get_similarity_score(
         hash_np=hash_np,
         matching_hash_list=matching_hash_list) if matching_hash_list else None
@@ -203,7 +264,8 @@ def search_module(session, hash_np, hash_list, incoming_metadata):
         logger.info(f"Index returned: {index}")
         is_duplicate_results = is_duplicate(index=index, incoming_metadata=incoming_metadata,
                                             complete_existing_metadata=complete_existing_metadata)
-        return is_duplicate_results + (node_id_list[index],)
+        return is_duplicate_results + (node_id_list[index],
+                                       complete_existing_metadata[index]['document_uid'])
 
     # No index returned, hence there are no similar documents
     else:
@@ -228,9 +290,8 @@ def handler(event, context: LambdaContext):
     COGNITO_USER_POOL = validate_env_variable('COGNITO_USER_POOL')
     SENDER_EMAIL_ADDRESS = validate_env_variable('SENDER_EMAIL_ADDRESS')
 
-    # Open TypeDB session
-    client = TypeDB.core_client(TYPEDB_SERVER_IP + ':' + TYPEDB_SERVER_PORT)
-    session = client.session(TYPEDB_DATABASE_NAME, SessionType.DATA)
+    # TypeDB session shared with the next invocations of this container
+    connection = get_connection(TYPEDB_SERVER_IP + ':' + TYPEDB_SERVER_PORT, TYPEDB_DATABASE_NAME)
 
     # Call S3 and download processed text
     config = Config(connect_timeout=5, retries={'max_attempts': 0})
@@ -241,29 +302,42 @@ def handler(event, context: LambdaContext):
         bucket=SOURCE_BUCKET
     )
 
-    doc_metadata = extract_metadata(document=document)
+    doc_metadata, text = extract_header_and_text(document=document)
     metadata = {**doc_metadata, **key_metadata}
-    text = extract_text(document=document)
 
     # Get incoming metadata
     incoming_metadata = dict(
         zip(return_vals, [metadata[val] for val in return_vals]))
     user_id = metadata['user_id']
 
+    # The LSH index of existing hashes is kept by the container, only the changes made since
+    # the last invocation are read. It is bootstrapped from the graph the first time
+    lsh_store = get_store(s3_client=s3_client, bucket=SOURCE_BUCKET)
+    lsh_store.sync(bootstrap=lambda: connection.run(build_lsh_index))
+
     # If search module returns a True i.e. duplicate text with different metadata, then replace existing metadata
     # The returned dictionary is the existing document's metadata
     hash_np, hash_list = create_hash_list(text)
-    is_duplicate_results = search_module(session, hash_np, hash_list, incoming_metadata)
-
-    # Close TypeDB session and define handler response
-    session.close()
-    client.close()
+    logger.info(f'Incoming document hash: {"_".join(hash_list)}')
+    is_duplicate_results = connection.run(
+        lambda session: search_module(session, hash_np, lsh_store, incoming_metadata))
+    logger.info({'typedb_connection': connection.stats()})
+
+    # Anything that is not a complete duplicate will be ingested, so index its hash
+    if is_duplicate_results is False or is_duplicate_results[0] is False:
+        lsh_store.insert(document_uid, hash_np)
+    # A new version archives the document it replaces
+    if is_duplicate_results is not False and is_duplicate_results[0] is False:
+        existing_uid = is_duplicate_results[3]
+        if existing_uid != document_uid:
+            lsh_store.remove(existing_uid)
+    logger.info({'lsh_index': lsh_store.stats()})
 
     handler_response = metadata
     handler_response['text'] = text
 
     # ========== 1. If it is not a duplicate, insert hash and pass the document
-    handler_response['hash_text'] = '_'.join(map(str, hash_np.tolist()))
+    handler_response['hash_text'] = encode_signature(hash_np)
     if is_duplicate_results is False:
         logger.info('New document!')
         return handler_response
@@ -0,0 +1,150 @@
+import struct
+import hashlib
+from collections import defaultdict, Counter
+import numpy as np
+
+
+# File layout (all little-endian):
+#   header  | magic, format version, bands, rows, number of documents
+#   digests | uint64 matrix of shape (documents, bands)
+#   lengths | uint16 byte length of every document key
+#   keys    | utf-8 document keys, concatenated
+MAGIC = b'ORPLSH'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<6sBHHI')
+
+DEFAULT_BANDS = 16
+DEFAULT_ROWS = 16
+
+
+class LSHIndex:
+    '''
+    Banded locality sensitive hashing index over MinHash signatures
+
+    The signature is split into `bands` bands of `rows` slots and every band
+    is reduced to a 64-bit digest. Two documents become candidates when at
+    least one band digest collides, so a lookup costs one dictionary access
+    per band regardless of how many documents are indexed.
+    '''
+
+    def __init__(self, bands: int = DEFAULT_BANDS, rows: int = DEFAULT_ROWS):
+        if bands < 1 or rows < 1:
+            raise ValueError('LSH index needs at least one band and one row')
+        self.bands = bands
+        self.rows = rows
+        self.entries = {}
+        self.tables = [defaultdict(list) for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    @property
+    def threshold(self) -> float:
+        '''Approximate Jaccard similarity at which documents become candidates'''
+        return (1 / self.bands) ** (1 / self.rows)
+
+    def band_digests(self, signature) -> np.ndarray:
+        '''Reduces each band of a MinHash signature to a 64-bit digest'''
+        signature = np.ascontiguousarray(signature, dtype='<u8')
+        width = self.bands * self.rows
+        if signature.size < width:
+            raise ValueError(
+                f'Signature has {signature.size} slots, index needs {width}')
+
+        bands = signature[:width].reshape(self.bands, self.rows)
+        return np.fromiter(
+            (int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), 'little')
+             for band in bands),
+            dtype='<u8',
+            count=self.bands)
+
+    def _add_digests(self, key: str, digests: np.ndarray) -> None:
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = digests
+        for table, digest in zip(self.tables, digests.tolist()):
+            table[digest].append(key)
+
+    def insert(self, key: str, signature) -> None:
+        '''Adds (or replaces) a document signature in the index'''
+        self._add_digests(key, self.band_digests(signature))
+
+    def merge(self, other: 'LSHIndex') -> None:
+        '''Adds (or replaces) every document of another index with the same bands and rows'''
+        if (other.bands, other.rows) != (self.bands, self.rows):
+            raise ValueError('Cannot merge LSH indexes with different bands or rows')
+        for key, digests in other.entries.items():
+            self._add_digests(key, digests)
+
+    def remove(self, key: str) -> None:
+        '''Removes a document from the index if it is present'''
+        digests = self.entries.pop(key, None)
+        if digests is None:
+            return
+        for table, digest in zip(self.tables, digests.tolist()):
+            bucket = table[digest]
+            bucket.remove(key)
+            if not bucket:
+                del table[digest]
+
+    def query(self, signature) -> list:
+        '''
+        param: signature: MinHash signature of the incoming document
+            returns: keys of all indexed documents sharing at least one band,
+            ordered by the number of colliding bands (most similar first)
+        '''
+        collisions = Counter()
+        for table, digest in zip(self.tables, self.band_digests(signature).tolist()):
+            collisions.update(table.get(digest, ()))
+        return [key for key, _ in collisions.most_common()]
+
+    def to_bytes(self) -> bytes:
+        '''Serialises the index to its compact binary representation'''
+        keys = [key.encode('utf-8') for key in self.entries]
+        digests = (np.vstack(list(self.entries.values())) if keys
+                   else np.empty((0, self.bands), dtype='<u8'))
+        lengths = np.array([len(key) for key in keys], dtype='<u2')
+
+        return b''.join([
+            HEADER.pack(MAGIC, FORMAT_VERSION, self.bands, self.rows, len(keys)),
+            digests.astype('<u8', copy=False).tobytes(),
+            lengths.tobytes(),
+            *keys
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'LSHIndex':
+        '''Rebuilds an index from the output of `to_bytes`'''
+        magic, version, bands, rows, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError('Not an LSH index file')
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Unsupported LSH index format version {version}')
+
+        offset = HEADER.size
+        digests = np.frombuffer(
+            data, dtype='<u8', count=count * bands, offset=offset).reshape(count, bands)
+        offset += digests.nbytes
+        lengths = np.frombuffer(data, dtype='<u2', count=count, offset=offset)
+        offset += lengths.nbytes
+
+        index = cls(bands=bands, rows=rows)
+        for row, length in zip(digests, lengths.tolist()):
+            key = data[offset: offset + length].decode('utf-8')
+            offset += length
+            index._add_digests(key, row)
+        return index
+
+    def save(self, path: str) -> None:
+        '''Writes the index to a local file'''
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> 'LSHIndex':
+        '''Reads an index from a local file'''
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
@@ -0,0 +1,245 @@
+import os
+import time
+import threading
+from lsh_index import LSHIndex
+from aws_lambda_powertools.logging.logger import Logger
+
+
+logger = Logger(child=True)
+
+# Layout under the prefix, every write is a new object so concurrent invocations never
+# overwrite each other's changes:
+#   journal/<time ns>-<document uid>.insert   one document LSH index (LSHIndex.to_bytes)
+#   journal/<time ns>-<document uid>.remove   empty, the document was archived or deleted
+#   snapshots/<journal position>.lsh          the index with every journal entry up to
+#                                             and including that position applied
+LSH_INDEX_PREFIX = os.environ.get('LSH_INDEX_PREFIX', 'lsh-index/')
+# The single object the index used to be kept in, read once to seed the first snapshot
+LEGACY_INDEX_KEY = os.environ.get('LSH_INDEX_KEY', 'lsh-index/check_duplicate.lsh')
+# Journal entries younger than this are kept aside rather than folded into the index, so
+# that an entry stamped by a container with a slightly late clock is never skipped
+SETTLE_SECONDS = int(os.environ.get('LSH_SETTLE_SECONDS', 120))
+# Settled journal entries after which a new snapshot is written
+COMPACT_AFTER = int(os.environ.get('LSH_COMPACT_AFTER', 500))
+
+INSERT = 'insert'
+REMOVE = 'remove'
+START = '0' * 20
+
+_stores = {}
+_lock = threading.Lock()
+
+
+def journal_key(document_uid: str, operation: str, prefix: str = LSH_INDEX_PREFIX) -> str:
+    '''The key of a new journal entry, ordered by the time it is written'''
+    return f'{prefix}journal/{time.time_ns():020d}-{document_uid}.{operation}'
+
+
+def entry_time_ns(key: str) -> int:
+    return int(key.rsplit('/', 1)[-1][:20])
+
+
+def snapshot_position(key: str) -> str:
+    '''The name of the last journal entry a snapshot includes'''
+    return key.rsplit('/', 1)[-1][: -len('.lsh')]
+
+
+def parse_entry(key: str) -> tuple:
+    '''returns: (document uid, operation) of a journal entry'''
+    name, operation = key.rsplit('/', 1)[-1].rsplit('.', 1)
+    return name[21:], operation
+
+
+class LSHStore:
+    '''
+    The LSH index of a bucket, kept in memory for the life of the container
+
+    Each invocation only reads the journal entries written since the previous one, and
+    only writes the entry of its own change. Entries are folded into the in-memory index
+    once they are older than SETTLE_SECONDS, younger ones are applied over it at query time.
+    '''
+
+    def __init__(self, s3_client, bucket: str, prefix: str = LSH_INDEX_PREFIX):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.index = None
+        # Key of the last journal entry folded into the index
+        self.position = START
+        self.snapshot_position = START
+        self.folded_since_snapshot = 0
+        # Unsettled entries, by key, with the index of an insert
+        self.pending = {}
+        self.metrics = {'journal_reads': 0, 'snapshots_written': 0}
+
+    def _journal_start(self) -> str:
+        return f'{self.prefix}journal/{self.position}'
+
+    def _list(self, prefix: str, start_after: str = None) -> list:
+        keys = []
+        kwargs = {'Bucket': self.bucket, 'Prefix': prefix}
+        if start_after:
+            kwargs['StartAfter'] = start_after
+        while True:
+            response = self.s3_client.list_objects_v2(**kwargs)
+            keys.extend(item['Key'] for item in response.get('Contents', []))
+            if not response.get('IsTruncated'):
+                return keys
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+    def _read(self, key: str) -> bytes:
+        return self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def _read_entry(self, key: str):
+        '''returns: (document uid, operation, index of an insert or None)'''
+        document_uid, operation = parse_entry(key)
+        self.metrics['journal_reads'] += 1
+        return document_uid, operation, LSHIndex.from_bytes(self._read(key)) if operation == INSERT else None
+
+    def _apply(self, document_uid: str, operation: str, entry) -> None:
+        if operation == REMOVE:
+            self.index.remove(document_uid)
+        else:
+            self.index.merge(entry)
+
+    def load(self, bootstrap) -> None:
+        '''
+        Reads the latest snapshot, or seeds the first one from the legacy index or the graph
+        param: bootstrap: callable returning an LSHIndex of every live document in the graph
+        '''
+        snapshots = sorted(self._list(f'{self.prefix}snapshots/'))
+        if snapshots:
+            self.index = LSHIndex.from_bytes(self._read(snapshots[-1]))
+            self.position = snapshot_position(snapshots[-1])
+            logger.info(f'Loaded LSH snapshot {snapshots[-1]} with {len(self.index)} documents')
+        else:
+            try:
+                self.index = LSHIndex.from_bytes(self._read(LEGACY_INDEX_KEY))
+                logger.info(f'Seeding the LSH snapshots from {LEGACY_INDEX_KEY}')
+            except self.s3_client.exceptions.NoSuchKey:
+                self.index = bootstrap()
+            # The whole journal is replayed over the seed, which only repeats what it already has
+            self.position = START
+            self._write_snapshot()
+        self.snapshot_position = self.position
+        self.folded_since_snapshot = 0
+        self.pending = {}
+
+    def sync(self, bootstrap) -> None:
+        '''Applies the journal entries written since the last invocation'''
+        if self.index is None:
+            self.load(bootstrap)
+
+        journal = self._list(f'{self.prefix}journal/', start_after=self._journal_start())
+        if self._behind_compaction():
+            # The entries between the position and the oldest snapshot are gone, so the
+            # journal alone can no longer bring the index up to date
+            logger.warning(f'LSH journal after {self.position} was compacted by another container, reloading')
+            self.load(bootstrap)
+            journal = self._list(f'{self.prefix}journal/', start_after=self._journal_start())
+
+        settled_before = time.time_ns() - SETTLE_SECONDS * 10 ** 9
+        pending = {}
+        for key in journal:
+            entry = self.pending.get(key) or self._read_entry(key)
+            if entry_time_ns(key) < settled_before:
+                self._apply(*entry)
+                self.position = key.rsplit('/', 1)[-1]
+                self.folded_since_snapshot += 1
+            else:
+                pending[key] = entry
+        self.pending = pending
+
+        if self.folded_since_snapshot >= COMPACT_AFTER:
+            self.compact()
+
+    def _behind_compaction(self) -> bool:
+        '''
+        Whether the position is older than the oldest snapshot still stored. Compaction
+        deletes the snapshots before it ahead of the journal, so listing the snapshots
+        after the journal catches a compaction that deleted entries the listing missed
+        '''
+        snapshots = self._list(f'{self.prefix}snapshots/')
+        return bool(snapshots) and self.position < min(snapshot_position(key) for key in snapshots)
+
+    def query(self, signature) -> list:
+        '''Candidate document uids, including the unsettled changes'''
+        overlay = LSHIndex(bands=self.index.bands, rows=self.index.rows)
+        removed = set()
+        for key in sorted(self.pending):
+            document_uid, operation, entry = self.pending[key]
+            if operation == REMOVE:
+                overlay.remove(document_uid)
+                removed.add(document_uid)
+            else:
+                overlay.merge(entry)
+                removed.discard(document_uid)
+
+        recent = overlay.query(signature) if len(overlay) else []
+        changed = removed | set(overlay.entries)
+        return recent + [key for key in self.index.query(signature) if key not in changed]
+
+    def _write_entry(self, document_uid: str, operation: str, body: bytes = b'') -> None:
+        key = journal_key(document_uid, operation, self.prefix)
+        self.s3_client.put_object(Body=body, Bucket=self.bucket, Key=key)
+        entry = (document_uid, operation,
+                 LSHIndex.from_bytes(body) if operation == INSERT else None)
+        self.pending[key] = entry
+        logger.info(f'Wrote LSH journal entry {key}')
+
+    def insert(self, document_uid: str, signature) -> None:
+        entry = LSHIndex(bands=self.index.bands, rows=self.index.rows)
+        entry.insert(document_uid, signature)
+        self._write_entry(document_uid, INSERT, entry.to_bytes())
+
+    def remove(self, document_uid: str) -> None:
+        self._write_entry(document_uid, REMOVE)
+
+    def _write_snapshot(self) -> None:
+        key = f'{self.prefix}snapshots/{self.position}.lsh'
+        self.s3_client.put_object(Body=self.index.to_bytes(), Bucket=self.bucket, Key=key)
+        self.metrics['snapshots_written'] += 1
+        logger.info(f'Wrote LSH snapshot {key} with {len(self.index)} documents')
+
+    def compact(self) -> None:
+        '''
+        Writes a snapshot at the current position, then deletes what the previous snapshot
+        already covered. One generation is kept so a container that has just read the
+        previous snapshot can still read the journal after it
+        '''
+        previous = self.snapshot_position
+        self._write_snapshot()
+        self.snapshot_position = self.position
+        self.folded_since_snapshot = 0
+
+        # The snapshots go first, so that a container still behind them sees the journal
+        # it needs is being deleted (see _behind_compaction)
+        snapshots = [key for key in self._list(f'{self.prefix}snapshots/')
+                     if snapshot_position(key) < previous]
+        self._delete(snapshots)
+        journal = [key for key in self._list(f'{self.prefix}journal/')
+                   if key.rsplit('/', 1)[-1] <= previous]
+        self._delete(journal)
+        logger.info(f'Compacted LSH index, deleted {len(snapshots) + len(journal)} objects covered by {previous}')
+
+    def _delete(self, keys: list) -> None:
+        for start in range(0, len(keys), 1000):
+            self.s3_client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in keys[start: start + 1000]], 'Quiet': True})
+
+    def stats(self) -> dict:
+        return {
+            'documents': len(self.index) if self.index is not None else 0,
+            'pending': len(self.pending),
+            'position': self.position,
+            **self.metrics
+        }
+
+
+def get_store(s3_client, bucket: str) -> LSHStore:
+    '''The container's LSH store of a bucket, created on first use'''
+    with _lock:
+        if bucket not in _stores:
+            _stores[bucket] = LSHStore(s3_client, bucket)
+        return _stores[bucket]
@@ -1,8 +1,7 @@
 import kshingle as ks
 from nltk.tokenize import word_tokenize
-from datasketch import MinHash, MinHashLSH
-
-lsh = MinHashLSH()
+from datasketch import MinHash
+from hash_signature import encode_signature, decode_signature  # noqa: F401
 
 stopwords = open('./stopwords.txt', 'r')
 stopwords = stopwords.read()
@@ -1,5 +1,5 @@
-import spacy
 from spacy.matcher import Matcher
+from nlp_profiles import load_profile
 
 
 # Add match ID "HelloWorld" with no callback and one pattern
@@ -135,8 +135,9 @@ pattern5 = [{"TEXT": {"IN": digit_day_list_nozero}, "OP": "?"}, {"IS_PUNCT": Tru
 def initialise_matcher():
     """
     Initalises nlp and matcher from Spacy
+    The patterns only use token text and lexical flags, so the tokenizer-only profile is enough
     """
-    nlp = spacy.load("en_core_web_sm")
+    nlp = load_profile('tokenizer')
     matcher = Matcher(nlp.vocab)
     matcher.add("date", [pattern1])
     matcher.add("date", [pattern2])
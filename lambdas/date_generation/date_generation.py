@@ -3,6 +3,7 @@ import string
 import datetime
 import pandas as pd
 from add_patterns import initialise_matcher
+from resource_cache import get_resource, resource_stats
 from dateutil.relativedelta import relativedelta
 from aws_lambda_powertools.logging.logger import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
@@ -10,9 +11,6 @@ from aws_lambda_powertools.utilities.typing import LambdaContext
 
 logger = Logger()
 
-# Initalise the matcher
-nlp, matcher = initialise_matcher()
-
 
 def preprocess_text(text):
     '''
@@ -60,7 +58,10 @@ def find_date(clean_text):
     param: clean_text: text from preprocess_text function
     returns: date_list: list of dates found from text
     '''
-    doc = nlp(clean_text)
+    # Initalise the matcher
+    nlp, matcher = get_resource('date_matcher', initialise_matcher)
+    # Tokenise only, the pipeline has no components to run
+    doc = nlp.make_doc(clean_text)
     matches = matcher(doc)
 
     candidate_dates = []
@@ -118,5 +119,6 @@ def handler(event, context: LambdaContext):
     date = check_metadata_date_in_doc(
         metadata_date=metadata_date, date_list=date_list)
     logger.info(f'Date published: {date}')
+    logger.info({'resources': resource_stats()})
 
     return {'date_published': date}
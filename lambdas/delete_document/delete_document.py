@@ -1,5 +1,6 @@
 import json
 import os
+import time
 
 import boto3
 from aws_lambda_powertools.logging.logger import Logger
@@ -8,6 +9,9 @@ from typedb.client import SessionType, TransactionType, TypeDB
 
 logger = Logger()
 
+# The LSH index of check_duplicate, kept in the data lake
+LSH_INDEX_PREFIX = os.environ.get('LSH_INDEX_PREFIX', 'lsh-index/')
+
 
 def getUniqueResult(results):
     res = [(i.get_type().get_label().name(), i.get_value())
@@ -74,6 +78,14 @@ def delete_from_s3(bucket: str, object_key: str, s3_client: boto3.client):
     return response
 
 
+def remove_from_lsh_index(bucket: str, uid: str, s3_client: boto3.client):
+    '''Journals the removal of the document from the duplicate detection index, see check_duplicate.lsh_store'''
+    key = f'{LSH_INDEX_PREFIX}journal/{time.time_ns():020d}-{uid}.remove'
+    response = s3_client.put_object(Body=b'', Bucket=bucket, Key=key)
+    logger.info(f'Removed {uid} from the LSH index: {key}')
+    return response
+
+
 @logger.inject_lambda_context(log_event=True)
 def handler(event, context: LambdaContext):
     logger.set_correlation_id(context.aws_request_id)
@@ -106,6 +118,7 @@ def handler(event, context: LambdaContext):
     s3_client = boto3.client('s3')
     delete_from_s3(bucket=DATA_LAKE,
                    object_key=f'processed/{uid}.orpml', s3_client=s3_client)
+    remove_from_lsh_index(bucket=DATA_LAKE, uid=uid, s3_client=s3_client)
 
     if document_format != 'HTML':
         # There are only S3 documents to delete in the upload bucket if the doc is
@@ -1,7 +1,5 @@
 import json
 import os
-import re
-import string
 import xml.etree.ElementTree as ET
 import zipfile
 from datetime import datetime
@@ -11,8 +9,8 @@ import boto3
 import docx
 from aws_lambda_powertools.logging.logger import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from bs4 import BeautifulSoup
-from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from orpml_writer import group_meta_tags, write_orpml
+from text_cleaning import clean_text
 
 logger = Logger()
 
@@ -27,46 +25,6 @@ ROW = WORD_NAMESPACE + 'tr'
 CELL = WORD_NAMESPACE + 'tc'
 
 
-def remove_excess_punctuation(text: str) -> str:
-    '''Removes excess punctuation'''
-
-    text = text.replace(' .', '')
-    for punc in string.punctuation:
-        text = text.replace(punc + punc, '')
-    return text
-
-
-def clean_text(text: str) -> str:
-    '''Clean the text by removing illegal characters and excess whitespace'''
-
-    pattern = re.compile(r'\s+')
-
-    text = str(text).replace('\n', ' ')
-    text = text.replace(' .', '. ')
-    text = re.sub('(\\d+(\\.\\d+)?)', r' \1 .', text)
-    text = re.sub(pattern, ' ', text)
-    text = remove_excess_punctuation(text=text)
-    text = re.sub(ILLEGAL_CHARACTERS_RE, ' ', text)
-
-    # Space out merged words by adding a space before a capital letter
-    # if it appears after a lowercase letter
-    text = re.sub(
-        r'([a-z](?=[A-Z])|[A-Z](?=[A-Z][a-z]))',
-        r'\1 ',
-        text
-    )
-
-    text = text.strip()
-    text = text.replace('\t', ' ')
-    text = text.replace('_x000c_', '')
-    text = text.encode('ascii', 'ignore').decode('utf-8')
-    text = re.sub('\\s+', ' ', text)
-    text = re.sub('<.*?>', '', text)
-    text = re.sub('\\.{4,}', '.', text)
-
-    return text
-
-
 def download_text(s3_client: boto3.client,
                   object_key: str,
                   source_bucket: str) -> BytesIO:
@@ -154,30 +112,9 @@ def extract_docx_text(doc_bytes_io: BytesIO) -> str:
     return cleaned_text
 
 
-def process_orpml(text_body: str, docx_meta_tags: dict, s3_metadata: dict) -> str:
+def process_orpml(text_body: str, docx_meta_tags: dict, s3_metadata: dict) -> bytes:
     '''Builds the ORPML document from the metadata and text extracted from the DOCX'''
 
-    orpml = BeautifulSoup(
-        '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-            <orpml xmlns="http://www.beis.gov.uk/namespaces/orpml">
-              <metadata>
-                <dublinCore>
-                </dublinCore>
-                <dcat>
-                </dcat>
-                <orp>
-                </orp>
-              </metadata>
-              <documentContent>
-                <html>
-                  <body>
-                  </body>
-                </html>
-              </documentContent>
-            </orpml>''',
-        features='xml'
-    )
-
     # Finding the time the object was uploaded
     date_uploaded = datetime.now()
     date_uploaded_formatted = date_uploaded.strftime('%Y-%m-%dT%H:%M:%S')
@@ -200,36 +137,22 @@ def process_orpml(text_body: str, docx_meta_tags: dict, s3_metadata: dict) -> st
 
     meta_tags = {**docx_meta_tags, **s3_meta_tags}
 
-    # Attaching the meta tags to the ORPML header
-    dublinCore = orpml.metadata.dublinCore
-    dcat = orpml.metadata.dcat
-    orp_meta = orpml.metadata.orp
-    for k, v in meta_tags.items():
-        new_meta = orpml.new_tag(k.split(':')[1])
-        new_meta.string = v if v else ''
-        if k.startswith('dc:'):
-            dublinCore.append(new_meta)
-        elif k.startswith('dcat:'):
-            dcat.append(new_meta)
-        elif k.startswith('orp:'):
-            orp_meta.append(new_meta)
-
-    logger.info('Finished attaching metadata to ORPML header')
-
-    body_tag = orpml.find('body')
-    # Create a new HTML tag for the text
-    text_tag = orpml.new_tag('div', attrs={'class': 'text'})
-    text_tag.string = text_body
-    # Append the text tag to the <body>
-    body_tag.append(text_tag)
+    # Writing the header and the text to the <body> tag
+    orpml = BytesIO()
+    write_orpml(
+        output=orpml,
+        header=group_meta_tags(meta_tags),
+        body=[text_body],
+        div_class='text'
+    )
 
-    logger.info('Finished attaching page to ORPML body')
+    logger.info('Finished writing ORPML header and text')
 
-    return str(orpml)
+    return orpml.getvalue()
 
 
 def write_text(s3_client: boto3.client,
-               text: str,
+               text: bytes,
                document_uid: str,
                destination_bucket=DESTINATION_BUCKET) -> None:
     '''Write the extracted text to a .orpml file in the data lake'''
@@ -1,10 +1,8 @@
 from io import BytesIO
 import os
-import re
-import json
-import textwrap
 import boto3
-from bs4 import BeautifulSoup
+from orpml_reader import open_orpml
+from orpml_writer import new_element, write_orpml
 from aws_lambda_powertools.logging.logger import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
@@ -31,41 +29,16 @@ def download_text(s3_client: boto3.client,
     return doc_bytes_io
 
 
-def parse_beautifulsoup_element(metadata_tag: str, orpml: BeautifulSoup) -> dict:
-    '''Takes a parent metadata tag and returns the child elements as a dictionary'''
-
-    metadata_elem = orpml.find(metadata_tag)
-    output_dict = {}
-    for child in metadata_elem.find_all(recursive=False):
-        tag = child.name
-        value = child.text if child.text else ''
-        output_dict[tag] = value
-
-    return output_dict
-
-
 def parse_orpml(doc_bytes_io: BytesIO) -> tuple:
     '''
     Parses the existing ORPML document and returns a dictionary of the 
-    metadata header and the content in the body
+    metadata header and a generator of the content of the body
+    The body is only parsed as the generator is consumed
     '''
 
-    # Reading in the S3 document and parsing it as HTML
-    orpml_doc = doc_bytes_io.read()
-    orpml = BeautifulSoup(orpml_doc, features='xml')
+    orpml_header, orpml_body = open_orpml(doc_bytes_io)
 
-    orpml_body = orpml.find('body')
-    orpml_header = {}
-
-    orpml_header['dublinCore'] = parse_beautifulsoup_element(
-        metadata_tag='dublinCore', orpml=orpml)
-    orpml_header['dcat'] = parse_beautifulsoup_element(
-        metadata_tag='dcat', orpml=orpml)
-    orpml_header['orp'] = parse_beautifulsoup_element(
-        metadata_tag='orp', orpml=orpml)
-
-    logger.info('Parsed the existing ORPML')
-    # logger.info(orpml_body)
+    logger.info('Parsed the existing ORPML header')
 
     return orpml_header, orpml_body
 
@@ -85,6 +58,8 @@ def create_orpml_metadata(orpml_header: dict, enrichments: list) -> dict:
     orpml_header['dublinCore']['title'] = merged_enrichments.get('title')
     orpml_header['dublinCore']['language'] = merged_enrichments.get('lang')
     orpml_header['dcat']['keywords'] = merged_enrichments.get('keywords')
+    # Only kept for the graph, the ORPML header lists the keywords themselves
+    orpml_header['dcat']['keywordNouns'] = merged_enrichments.get('keyword_nouns')
     orpml_header['dcat']['relatedResource'] = merged_enrichments.get(
         'legislative_origins')
     orpml_header['orp']['summary'] = merged_enrichments.get('summary')
@@ -94,88 +69,47 @@ def create_orpml_metadata(orpml_header: dict, enrichments: list) -> dict:
     return orpml_header
 
 
-def create_orpml_document(orpml_metadata: dict, orpml_body: str) -> str:
-    '''Creates the final ORPML document from the newly processed metadata header and body'''
-
-    # logger.info(orpml_body)
-
-    final_orpml = BeautifulSoup(
-        '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-            <orpml xmlns="http://www.beis.gov.uk/namespaces/orpml">
-              <metadata>
-                <dublinCore>
-                </dublinCore>
-                <dcat>
-                </dcat>
-                <orp>
-                </orp>
-              </metadata>
-              <documentContent>
-                <html>
-                </html>
-              </documentContent>
-            </orpml>''',
-        features='xml'
-    )
+def create_orpml_document(orpml_metadata: dict, orpml_body) -> bytes:
+    '''
+    Creates the final ORPML document from the newly processed metadata header and body
+    The body is streamed into the document one item at a time, see write_escaped_body
+    '''
+
+    # Build the keywords from the metadata
+    keywords_element = new_element("keywords")
+    for keyword in orpml_metadata["dcat"]["keywords"] or []:
+        new_element("keyword", text=keyword, parent=keywords_element)
 
-    dublincore_element = final_orpml.find("dublinCore")
-    dcat_element = final_orpml.find("dcat")
-    orp_element = final_orpml.find("orp")
-
-    # Update the dublinCore element with the values from the metadata
-    for key, value in orpml_metadata["dublinCore"].items():
-        element = final_orpml.new_tag(key)
-        element.string = value
-        dublincore_element.append(element)
-
-    # Update the dcat element with the keywords from the metadata
-    keywords_element = final_orpml.new_tag("keywords")
-    dcat_element.append(keywords_element)
-    for keyword in orpml_metadata["dcat"]["keywords"]:
-        keyword_element = final_orpml.new_tag("keyword")
-        keyword_element.string = keyword
-        keywords_element.append(keyword_element)
-
-    # Update the dcat element with the relatedResource from the metadata
-    related_resource_element = final_orpml.new_tag("relatedResource")
-    dcat_element.append(related_resource_element)
+    # Build the relatedResource from the metadata
+    related_resource_element = new_element("relatedResource")
     if orpml_metadata["dcat"]["relatedResource"]:
         for resource in orpml_metadata["dcat"]["relatedResource"]:
-            resource_element = final_orpml.new_tag("legislativeOrigin")
+            resource_element = new_element(
+                "legislativeOrigin", parent=related_resource_element)
             for attr, attr_value in resource.items():
                 if attr != "title":
-                    resource_attr_element = final_orpml.new_tag(attr)
-                    resource_attr_element.string = attr_value
-                    resource_element.append(resource_attr_element)
-            resource_title_element = final_orpml.new_tag("resourceTitle")
-            resource_title_element.string = resource["title"]
-            resource_element.append(resource_title_element)
-            related_resource_element.append(resource_element)
-
-    # Update the orp element with the values from the metadata
-    for key, value in orpml_metadata["orp"].items():
-        element = final_orpml.new_tag(key)
-        element.string = value
-        orp_element.append(element)
-
-    # Prettify and wrap the ORPML body
-    prettified_body = orpml_body.prettify()
-    final_orpml_body = textwrap.fill(prettified_body, width=80)
-
-    # Write the prettified ORPML body
-    body_element = final_orpml.find("html")
-    body_element.string = final_orpml_body
-
-    prettified_orpml = final_orpml.prettify()
-    final_orpml_document = re.sub(r'\n\s*\n', '\n', prettified_orpml)
+                    new_element(attr, text=attr_value, parent=resource_element)
+            new_element("resourceTitle", text=resource["title"], parent=resource_element)
+
+    header = {
+        "dublinCore": orpml_metadata["dublinCore"],
+        "dcat": {
+            "keywords": keywords_element,
+            "relatedResource": related_resource_element
+        },
+        "orp": orpml_metadata["orp"]
+    }
+
+    final_orpml = BytesIO()
+    write_orpml(output=final_orpml, header=header, body=orpml_body, escape_body=True)
 
     logger.info('Created the final ORPML document')
 
-    return final_orpml_document
+    return final_orpml.getvalue()
 
 
 def write_text(s3_client: boto3.client,
-               text: str,
+               text: bytes,
                document_uid: str,
                destination_bucket=DESTINATION_BUCKET) -> None:
     '''Write the processed ORPML to a .orpml file in the data lake'''
@@ -218,6 +152,7 @@ def build_graph_document(orpml_metadata: dict, event: dict) -> dict:
             "legislative_origins": orpml_metadata['dcat'].get('relatedResource')
         },
         "subject_keywords": orpml_metadata['dcat']['keywords'],
+        "subject_keyword_nouns": orpml_metadata['dcat'].get('keywordNouns') or [],
         "title": orpml_metadata['dublinCore']['title'],
         "summary": orpml_metadata['orp']['summary'],
         "language": orpml_metadata['dublinCore']['language']
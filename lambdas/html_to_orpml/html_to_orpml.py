@@ -2,6 +2,7 @@ import json
 import os
 import re
 from datetime import datetime
+from io import BytesIO
 
 import boto3
 import pandas as pd
@@ -11,6 +12,7 @@ from aws_lambda_powertools.utilities.typing import LambdaContext
 from bs4 import BeautifulSoup
 from govuk_extraction import get_content
 from htmldate import find_date
+from orpml_writer import group_meta_tags, write_orpml
 
 logger = Logger()
 
@@ -84,30 +86,9 @@ def get_publication_modification_date(URL: str) -> str:
     return publication_date
 
 
-def process_orpml(text_body: str, metadata: dict) -> str:
+def process_orpml(text_body: str, metadata: dict) -> bytes:
     '''Builds the ORPML document from the metadata and text extracted from the URL'''
 
-    orpml = BeautifulSoup(
-        '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-            <orpml xmlns="http://www.beis.gov.uk/namespaces/orpml">
-              <metadata>
-                <dublinCore>
-                </dublinCore>
-                <dcat>
-                </dcat>
-                <orp>
-                </orp>
-              </metadata>
-              <documentContent>
-                <html>
-                  <body>
-                  </body>
-                </html>
-              </documentContent>
-            </orpml>''',
-        features='xml'
-    )
-
     # Finding the time the object was uploaded
     date_uploaded = datetime.now()
     date_uploaded_formatted = date_uploaded.strftime('%Y-%m-%dT%H:%M:%S')
@@ -136,36 +117,22 @@ def process_orpml(text_body: str, metadata: dict) -> str:
         'dc:issued': metadata.get('date_published'),
     }
 
-    # Attaching the meta tags to the ORPML header
-    dublinCore = orpml.metadata.dublinCore
-    dcat = orpml.metadata.dcat
-    orp_meta = orpml.metadata.orp
-    for k, v in meta_tags.items():
-        new_meta = orpml.new_tag(k.split(':')[1])
-        new_meta.string = v if v else ''
-        if k.startswith('dc:'):
-            dublinCore.append(new_meta)
-        elif k.startswith('dcat:'):
-            dcat.append(new_meta)
-        elif k.startswith('orp:'):
-            orp_meta.append(new_meta)
-
-    logger.info('Finished attaching metadata to ORPML header')
-
-    body_tag = orpml.find('body')
-    # Create a new HTML tag for the text
-    text_tag = orpml.new_tag('div', attrs={'class': 'text'})
-    text_tag.string = text_body
-    # Append the text tag to the <body>
-    body_tag.append(text_tag)
+    # Writing the header and the text to the <body> tag
+    orpml = BytesIO()
+    write_orpml(
+        output=orpml,
+        header=group_meta_tags(meta_tags),
+        body=[text_body],
+        div_class='text'
+    )
 
-    logger.info('Finished attaching page to ORPML body')
+    logger.info('Finished writing ORPML header and text')
 
-    return str(orpml)
+    return orpml.getvalue()
 
 
 def write_text(s3_client: boto3.client,
-               text: str,
+               text: bytes,
                document_uid: str,
                destination_bucket=DESTINATION_BUCKET) -> None:
     '''Write the extracted text to a .orpml file in the data lake'''
@@ -7,6 +7,8 @@ from collections import defaultdict
 from word_forms_loc.lemmatizer import lemmatize
 from sklearn.feature_extraction.text import CountVectorizer
 from bs4 import BeautifulSoup
+from resource_cache import get_resource, resource_stats
+from word_form_tables import compute_noun
 from aws_lambda_powertools.logging.logger import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
@@ -24,6 +26,17 @@ def load_model(
     return model
 
 
+def load_stopwords():
+    '''Reads the stopwords removed before keyword extraction'''
+
+    with open('./stopwords.txt', 'r') as f:
+        stopwords = [i for i in f.read().split('\n')]
+    stopwords.extend(['use', 'uses', 'used', 'www', 'gov',
+                      'uk', 'guidance', 'pubns', 'page'])
+
+    return set(stopwords)
+
+
 def pre_process_tokenization_function(documents: str):
     '''Pre-processes the text ready for keyword extraction'''
 
@@ -32,12 +45,7 @@ def pre_process_tokenization_function(documents: str):
     text = re.sub('[^a-zA-Z]', ' ', text)
 
     # Define stopwords
-    stopwords = open('./stopwords.txt', 'r')
-    stopwords = stopwords.read()
-    stopwords = [i for i in stopwords.split('\n')]
-    stopwords.extend(['use', 'uses', 'used', 'www', 'gov',
-                      'uk', 'guidance', 'pubns', 'page'])
-    remove_stop_words = set(stopwords)
+    remove_stop_words = get_resource('stopwords', load_stopwords)
     text = text.lower()
 
     # Tokenize
@@ -110,7 +118,7 @@ def handler(event, context: LambdaContext):
 
     logger.info('Started initialisation...')
 
-    kw_model = load_model()
+    kw_model = get_resource('keybert', load_model)
     title_keywords = extract_keywords(text=title, kw_model=kw_model, n=2)
     doc_keywords = extract_keywords(text=text, kw_model=kw_model)
     # Combine keywords
@@ -121,6 +129,11 @@ def handler(event, context: LambdaContext):
     logger.info({'doc and title keywords': keywords})
 
     subject_keywords = [i[0] for i in keywords]
+    # Noun forms are stored with the keywords, so searches display them without walking WordNet
+    keyword_nouns = [compute_noun(kw) for kw in subject_keywords]
+    logger.info({'keyword nouns': keyword_nouns})
+    logger.info({'resources': resource_stats()})
 
     return {'keywords': subject_keywords,
+            'keyword_nouns': keyword_nouns,
             'title': title}
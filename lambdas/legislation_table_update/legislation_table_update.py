@@ -1,10 +1,16 @@
 import os
 import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from io import BytesIO
 import pandas as pd
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from SPARQLWrapper import SPARQLWrapper, CSV
+from title_snapshot import open_snapshot_for_update, upsert_titles, content_hashes, finalise_snapshot
 from aws_lambda_powertools.logging.logger import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
@@ -15,6 +21,35 @@ DESTINATION_BUCKET = os.environ['DESTINATION_BUCKET']
 TABLE_NAME = os.environ['TABLE_NAME']
 SECRET_NAME = os.environ['SECRET_NAME']
 
+# Tokenised titles persisted by the legislative origin extraction lambda, rebuilt after every update
+TITLE_MATCHER_BUCKET = os.environ.get('TITLE_MATCHER_BUCKET', DESTINATION_BUCKET)
+# The extraction lambda persists a matcher per snapshot version under this prefix
+TITLE_MATCHER_PREFIX = os.environ.get(
+    'TITLE_MATCHER_PREFIX', 'legislative-origin/title_matcher/')
+# Where the single matcher used to be kept, before it was stamped with the snapshot version
+LEGACY_TITLE_MATCHER_KEY = 'legislative-origin/title_matcher.json.gz'
+
+# Local snapshot of the titles by year, read by the legislative origin extraction lambda
+TITLE_SNAPSHOT_BUCKET = os.environ.get('TITLE_SNAPSHOT_BUCKET', DESTINATION_BUCKET)
+TITLE_SNAPSHOT_KEY = os.environ.get(
+    'TITLE_SNAPSHOT_KEY', 'legislative-origin/title_snapshot.sqlite')
+TITLE_SNAPSHOT_PATH = '/tmp/title_snapshot.sqlite'
+
+# High-water mark of the TNA sync, the actTime of the newest addition already loaded
+SYNC_CURSOR_KEY = os.environ.get(
+    'SYNC_CURSOR_KEY', 'legislative-origin/sync_cursor.json')
+# Additions are re-read this far behind the cursor in case TNA commits them out of order,
+# they cost no writes as their content hashes have not changed
+SYNC_OVERLAP_MINUTES = int(os.environ.get('SYNC_OVERLAP_MINUTES', 60))
+# Window used the first time, before there is a cursor
+INITIAL_SYNC_DAYS = 14
+TNA_PAGE_SIZE = int(os.environ.get('TNA_PAGE_SIZE', 5000))
+
+# Each worker writes its own segment of the items through a batch writer
+WRITE_WORKERS = int(os.environ.get('WRITE_WORKERS', 4))
+# Throttled batch writes are retried by botocore, backing off adaptively
+DYNAMODB_CONFIG = Config(retries={'max_attempts': 10, 'mode': 'adaptive'})
+
 
 def get_secret(secret_name):
     '''Retrieves credentials for TNA from AWS Secrets Manager'''
@@ -25,8 +60,43 @@ def get_secret(secret_name):
     return secret_value
 
 
-def query_tna(username, password, date_cursor):
-    '''Queries TNA for all legislation published since the last run of this script'''
+def load_sync_cursor(bucket=DESTINATION_BUCKET, key=SYNC_CURSOR_KEY):
+    '''Reads the actTime of the newest addition loaded so far, None if the job has never completed'''
+    s3 = boto3.client('s3')
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+    except s3.exceptions.NoSuchKey:
+        return None
+
+    cursor = json.loads(response['Body'].read())
+    return cursor['last_act_time']
+
+
+def save_sync_cursor(last_act_time, rows, bucket=DESTINATION_BUCKET, key=SYNC_CURSOR_KEY):
+    '''Records the high-water mark, only called once the run has succeeded'''
+    cursor = {
+        'last_act_time': last_act_time,
+        'rows': rows,
+        'updated_at': datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    s3 = boto3.client('s3')
+    response = s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(cursor))
+    if response['ResponseMetadata']['HTTPStatusCode'] != 200:
+        raise Exception('Failed to save the sync cursor to S3')
+
+
+def get_date_cursor(last_act_time, overlap_minutes=SYNC_OVERLAP_MINUTES):
+    '''The actTime to query from, a little behind the high-water mark'''
+    if last_act_time is None:
+        date_cursor = datetime.now() - timedelta(days=INITIAL_SYNC_DAYS)
+    else:
+        date_cursor = datetime.strptime(
+            last_act_time[:19], '%Y-%m-%dT%H:%M:%S') - timedelta(minutes=overlap_minutes)
+    return date_cursor.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def query_tna(username, password, date_cursor, limit=TNA_PAGE_SIZE, offset=0):
+    '''Queries TNA for one page of the legislation added since the date cursor, oldest first'''
     sparql = SPARQLWrapper('https://www.legislation.gov.uk/sparql')
     sparql.setCredentials(user=username, passwd=password)
     sparql.setReturnFormat(CSV)
@@ -39,7 +109,7 @@ def query_tna(username, password, date_cursor):
                 prefix sd: <http://www.w3.org/ns/sparql-service-description#>
                 prefix prov: <http://www.w3.org/ns/prov#>
                 prefix leg: <http://www.legislation.gov.uk/def/legislation/>
-                select distinct ?ref ?title ?href ?shorttitle ?citation ?acronymcitation ?year ?number
+                select distinct ?ref ?title ?href ?shorttitle ?citation ?acronymcitation ?year ?number ?actTime
                 where {
                    ?activity prov:endedAtTime ?actTime .
                    ?graph prov:wasInfluencedBy ?activity .
@@ -56,13 +126,32 @@ def query_tna(username, password, date_cursor):
                                    OPTIONAL {?ref   leg:number ?number  } .}
                    FILTER(str(?actTime) > '%s')
                 }
-                ''' % date_cursor)
+                order by ?actTime ?ref
+                limit %d
+                offset %d
+                ''' % (date_cursor, limit, offset))
 
     results = sparql.query().convert()
     df = pd.read_csv(BytesIO(results))
     return df
 
 
+def query_tna_pages(username, password, date_cursor, page_size=TNA_PAGE_SIZE):
+    '''Pages through every addition since the date cursor with LIMIT/OFFSET'''
+    pages = []
+    offset = 0
+    while True:
+        page = query_tna(username=username, password=password,
+                         date_cursor=date_cursor, limit=page_size, offset=offset)
+        pages.append(page)
+        if page.shape[0] < page_size:
+            break
+        offset += page_size
+        logger.info(f'Fetched {offset} results from TNA, requesting the next page')
+
+    return pd.concat(pages, ignore_index=True)
+
+
 def transform_results(df):
     '''Transforms the results into the model we're using in DynamoDB'''
     df['divAbbv'] = df.ref.apply(lambda x: x.split('/')[4])
@@ -82,58 +171,200 @@ def transform_results(df):
     return df
 
 
-def save_to_s3(df):
-    '''Saves the dataframe as a CSV in S3 for backup purposes'''
-    curr_dt = datetime.now().strftime('%Y_%m_%d')
-    s3_filename = f'legislation_data_{curr_dt}.csv'
+def save_to_s3(df, date_cursor):
+    '''
+    Saves the rows added or changed in this run as a delta CSV in S3 for backup purposes,
+    keyed by the run time and the date cursor so several runs on one day each keep theirs
+    '''
+    curr_dt = datetime.now().strftime('%Y_%m_%d_%H%M%S')
+    cursor = date_cursor.replace(':', '').replace('-', '')
+    s3_filename = f'legislation_delta_{curr_dt}_from_{cursor}.csv'
     s3_key = f'legislative-origin/{s3_filename}'
 
     csv_buffer = pd.DataFrame.to_csv(df, index=False)
     s3 = boto3.client('s3')
     response = s3.put_object(Bucket=DESTINATION_BUCKET,
                              Key=s3_key,
-                             Body=csv_buffer)
+                             Body=csv_buffer,
+                             Metadata={'date_cursor': date_cursor})
     if response['ResponseMetadata']['HTTPStatusCode'] != 200:
         raise Exception('Failed to save CSV to S3')
 
 
-def insert_results(df):
-    '''Inserts dataframe of results into DynamoDB'''
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(TABLE_NAME)
-
-    for index, row in df.iterrows():
-        item = row.dropna().to_dict()
+def to_records(df) -> list:
+    '''Converts the dataframe into DynamoDB items without iterating over its rows'''
+    records = []
+    for record in df.to_dict('records'):
+        item = {k: v for k, v in record.items() if pd.notna(v)}
         item['number'] = str(item['number'])
         item['year'] = str(item['year'])
-        response = table.put_item(Item=item)
-        if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-            raise Exception(f'Failed to insert item into DynamoDB: {item}')
-    return df.shape[0]
+        records.append(item)
+    return records
+
+
+def content_hash(item: dict) -> str:
+    '''Hash of the content of an item, independent of the order of its attributes'''
+    content = json.dumps(item, sort_keys=True, default=str)
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def write_segment(items: list) -> int:
+    '''
+    Writes a segment of the items through a batch writer, which groups them into
+    BatchWriteItem requests of 25 and resends any unprocessed items
+    '''
+    # boto3 resources are not thread safe, so every worker has its own session
+    dynamodb = boto3.session.Session().resource('dynamodb', config=DYNAMODB_CONFIG)
+    table = dynamodb.Table(TABLE_NAME)
+    with table.batch_writer(overwrite_by_pkeys=['candidate_titles']) as batch:
+        for item in items:
+            batch.put_item(Item=item)
+    return len(items)
+
+
+def insert_results(items: list, workers=WRITE_WORKERS) -> int:
+    '''Inserts the items into DynamoDB in parallel segments'''
+    segments = [items[i::workers] for i in range(workers) if items[i::workers]]
+    if not segments:
+        return 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+        rows_inserted = sum(executor.map(write_segment, segments))
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        f'Wrote {rows_inserted} items with {len(segments)} workers in {elapsed:.1f}s '
+        f'({rows_inserted / elapsed:.0f} rows/s)')
+    return rows_inserted
+
+
+def scan_titles(table):
+    '''Generator of (candidate_titles, year) for every item in the table'''
+    scan_kwargs = {
+        'ProjectionExpression': 'candidate_titles, #year',
+        'ExpressionAttributeNames': {'#year': 'year'}
+    }
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response['Items']:
+            yield item['candidate_titles'], item['year']
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def fetch_title_snapshot(bucket=TITLE_SNAPSHOT_BUCKET, key=TITLE_SNAPSHOT_KEY,
+                         path=TITLE_SNAPSHOT_PATH):
+    '''
+    Downloads the snapshot ready to be updated
+    The first time, the snapshot is built from a full scan of the table, without content hashes
+    '''
+    s3 = boto3.client('s3')
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        s3.download_file(bucket, key, path)
+        return open_snapshot_for_update(path)
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            raise
+
+    logger.info('No title snapshot found, building it from the table')
+    table = boto3.resource('dynamodb').Table(TABLE_NAME)
+    connection = open_snapshot_for_update(path)
+    upsert_titles(connection, ((title, year, None) for title, year in scan_titles(table)))
+    return connection
+
+
+def upload_title_snapshot(connection, bucket=TITLE_SNAPSHOT_BUCKET, key=TITLE_SNAPSHOT_KEY,
+                          path=TITLE_SNAPSHOT_PATH) -> str:
+    '''
+    Stamps the snapshot with a new version and uploads it
+    returns: the ETag of the uploaded object, which the extraction lambda versions its matcher by
+    '''
+    info = finalise_snapshot(connection)
+    with open(path, 'rb') as f:
+        response = boto3.client('s3').put_object(Body=f, Bucket=bucket, Key=key)
+    etag = response['ETag'].strip('"')
+    logger.info(f'Uploaded title snapshot version {info["version"]} ({etag}) with {info["rows"]} titles')
+    return etag
+
+
+def invalidate_title_matcher(snapshot_version, bucket=TITLE_MATCHER_BUCKET, prefix=TITLE_MATCHER_PREFIX):
+    '''
+    Deletes the title matchers persisted for every other snapshot version, they are never
+    read again as the extraction lambda only loads the matcher of the snapshot it has
+    '''
+    s3 = boto3.client('s3')
+    keys = [LEGACY_TITLE_MATCHER_KEY]
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(item['Key'] for item in page.get('Contents', [])
+                    if item['Key'] != f'{prefix}{snapshot_version}.json.gz')
+    for start in range(0, len(keys), 1000):
+        response = s3.delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in keys[start: start + 1000]], 'Quiet': True})
+        if response.get('Errors'):
+            raise Exception(f'Failed to delete title matchers from S3: {response["Errors"]}')
+    logger.info(f'Deleted {len(keys)} title matchers of previous snapshots')
 
 
 @logger.inject_lambda_context(log_event=True)
 def handler(event, context: LambdaContext):
     logger.set_correlation_id(context.aws_request_id)
 
-    # Runs weekly however it pulls the last 14 days so that it is self-healing
-    date_cursor = datetime.now() - timedelta(days=14)
-    date_cursor_str = date_cursor.strftime('%Y-%m-%dT%H:%M:%S')
+    # Only pulls the additions since the last successful run, a failed run
+    # leaves the cursor where it was so the next run picks its additions up
+    last_act_time = load_sync_cursor()
+    date_cursor_str = get_date_cursor(last_act_time)
+    logger.info(f'Syncing TNA additions since {date_cursor_str}')
 
     credentials = get_secret(secret_name=SECRET_NAME)
     username = credentials['username']
     password = credentials['password']
 
-    df = query_tna(username=username, password=password,
-                   date_cursor=date_cursor_str)
+    df = query_tna_pages(username=username, password=password,
+                         date_cursor=date_cursor_str)
     num_results = df.shape[0]
     logger.info(f'Successfully queried TNA for {num_results} results')
     if num_results == 0:
-        raise Exception('No results found in TNA query')
+        # Recording the run all the same, so updated_at shows the job is still syncing
+        save_sync_cursor(last_act_time=last_act_time, rows=0)
+        return f'No new legislation added to TNA since {date_cursor_str}'
+
+    # The actTime only moves the cursor on, it is not stored against the legislation
+    new_last_act_time = max(df['actTime'].astype(str).max(), last_act_time or '')
+    df = transform_results(df=df.drop(columns='actTime'))
+
+    # Skipping items whose content has not changed since they were last written
+    items = to_records(df=df)
+    hashes = [content_hash(item) for item in items]
+    title_snapshot = fetch_title_snapshot()
+    previous_hashes = content_hashes(
+        title_snapshot, [item['candidate_titles'] for item in items])
+    changed_items = [
+        item for item, item_hash in zip(items, hashes)
+        if previous_hashes.get(item['candidate_titles']) != item_hash
+    ]
+    logger.info(f'Skipping {len(items) - len(changed_items)} unchanged items')
 
-    df = transform_results(df=df)
-    save_to_s3(df=df)
-    rows_inserted = insert_results(df=df)
+    changed_titles = [item['candidate_titles'] for item in changed_items]
+    save_to_s3(df=df[df['candidate_titles'].isin(changed_titles)],
+               date_cursor=date_cursor_str)
+
+    rows_inserted = insert_results(items=changed_items)
     logger.info(f'Inserted {rows_inserted} rows into DynamoDB')
 
+    # Recording the new titles and hashes only once every write has succeeded
+    upsert_titles(title_snapshot, (
+        (item['candidate_titles'], item['year'], item_hash)
+        for item, item_hash in zip(items, hashes)))
+    if changed_items:
+        # A new snapshot version makes every extraction container reload its titles
+        invalidate_title_matcher(upload_title_snapshot(title_snapshot))
+    else:
+        title_snapshot.close()
+    save_sync_cursor(last_act_time=new_last_act_time, rows=rows_inserted)
+
     return f'Inserted {rows_inserted} rows into DynamoDB'
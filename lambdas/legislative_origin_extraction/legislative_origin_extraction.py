@@ -1,9 +1,17 @@
 import os
+import time
+import random
+import shutil
+from bisect import bisect_right
+from datetime import datetime, timezone
 import boto3
 from boto3.dynamodb.conditions import Key
-import spacy
-from spacy.matcher import Matcher, PhraseMatcher
-from spacy.language import Language
+from botocore.exceptions import ClientError
+from spacy.matcher import Matcher
+from resource_cache import get_resource, resource_stats
+from nlp_profiles import load_profile
+from title_matcher import TitleMatcher
+from title_snapshot import TitleSnapshot
 from aws_lambda_powertools.logging.logger import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
@@ -13,44 +21,71 @@ logger = Logger()
 TABLE_NAME = os.environ['TABLE_NAME']
 YEAR_INDEX_NAME = os.environ['YEAR_INDEX_NAME']
 CUTOFF = 0.2
-
-
-@Language.component('custom_sentencizer')
-def custom_sentencizer(doc):
-    '''Look for sentence start tokens by scanning for periods only.'''
-    for i, token in enumerate(doc[:-2]):  # The last token cannot start a sentence
-        if token.text == ".":
-            doc[i + 1].is_sent_start = True
-        else:
-            # Tell the default sentencizer to ignore this token
-            doc[i + 1].is_sent_start = False
-    return doc
-
-
-def NLPsetup():
-    '''Initialises the Spacy models'''
-    nlp = spacy.load(
-        "en_core_web_sm",
-        exclude=[
-            'tok2vec',
-            'senter',
-            'attribute_ruler',
-            'lemmatizer',
-            'ner'])
-    nlp.max_length = 500000
-    nlp.add_pipe('custom_sentencizer', before="parser")
-    return nlp
-
-
-def detect_year_span(nlp_text, nlp):
-    '''Detects mentions of years in the text'''
+MAX_TEXT_LENGTH = 500000
+
+# The tokenised titles are persisted so a cold start does not need to query and tokenise them
+# again, under a key named after the version of the title snapshot they were read from
+TITLE_MATCHER_BUCKET = os.environ.get('TITLE_MATCHER_BUCKET')
+TITLE_MATCHER_PREFIX = os.environ.get(
+    'TITLE_MATCHER_PREFIX', 'legislative-origin/title_matcher/')
+
+# Snapshot of the titles by year written by legislation_table_update, read locally instead of querying the table
+TITLE_SNAPSHOT_BUCKET = os.environ.get('TITLE_SNAPSHOT_BUCKET')
+TITLE_SNAPSHOT_KEY = os.environ.get(
+    'TITLE_SNAPSHOT_KEY', 'legislative-origin/title_snapshot.sqlite')
+TITLE_SNAPSHOT_PATH = '/tmp/title_snapshot.sqlite'
+# How often a warm container checks whether legislation_table_update wrote a new snapshot
+TITLE_SNAPSHOT_CHECK_SECONDS = int(os.environ.get('TITLE_SNAPSHOT_CHECK_SECONDS', 60))
+# Without a snapshot the titles are read from the table, and versioned by the sync cursor
+# legislation_table_update writes to S3 after every run
+SYNC_CURSOR_BUCKET = os.environ.get('SYNC_CURSOR_BUCKET', TITLE_SNAPSHOT_BUCKET)
+SYNC_CURSOR_KEY = os.environ.get(
+    'SYNC_CURSOR_KEY', 'legislative-origin/sync_cursor.json')
+
+# Points the DynamoDB resource at a local stand-in (e.g. DynamoDB Local) for testing
+DYNAMODB_ENDPOINT_URL = os.environ.get('DYNAMODB_ENDPOINT_URL')
+BATCH_GET_LIMIT = 100
+BATCH_GET_MAX_RETRIES = 6
+BATCH_GET_BACKOFF_SECONDS = 0.05
+
+# Legislation items resolved by title, kept across warm invocations
+_legislation_cache = {}
+# Title snapshot and matcher of the container, replaced when the snapshot changes
+_titles = {'version': None, 'snapshot': None, 'matcher': None, 'checked_at': 0.0}
+
+
+def year_matcher_setup(nlp):
+    '''Initialises the matcher for four digit numbers'''
     pattern = [{"SHAPE": "dddd"}]
     dmatcher = Matcher(nlp.vocab)
     dmatcher.add('date matcher', [pattern])
-    dm = dmatcher(nlp_text)
-    dates = [nlp_text[start:end].text for _, start, end in dm]
-    dates = set([int(d) for d in dates if (len(d) == 4) & (d.isdigit())])
-    return dates
+    return dmatcher
+
+
+def detect_year_span(nlp_text, nlp):
+    '''
+    Detects mentions of years in the text
+    returns: the set of years and a dict of sentence number -> years mentioned in
+    that sentence, built from the token offsets of the matches in a single pass
+    '''
+    dmatcher = get_resource('year_matcher', lambda: year_matcher_setup(nlp))
+    sentence_starts = [sentence.start for sentence in nlp_text.sents]
+
+    dates = set()
+    years_by_sentence = {}
+    # Matches come back in token order, so sentences are added in order too
+    for _, start, end in dmatcher(nlp_text):
+        date = nlp_text[start:end].text
+        if len(date) != 4 or not date.isdigit():
+            continue
+        year = int(date)
+        dates.add(year)
+        sentence = bisect_right(sentence_starts, start) - 1
+        years = years_by_sentence.setdefault(sentence, [])
+        if year not in years:
+            years.append(year)
+
+    return dates, years_by_sentence
 
 
 def query_titles_from_years(table, index_name, dates):
@@ -83,62 +118,228 @@ def query_titles_from_years(table, index_name, dates):
     return all_titles
 
 
-def exact_matcher(title, nlp_text, nlp):
+def object_etag(s3_client, bucket, key):
+    '''The ETag of an object in S3, None if there is no such object'''
+    if not bucket:
+        return None
+    try:
+        response = s3_client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+        return None
+    return response['ETag'].strip('"')
+
+
+def table_version(s3_client, bucket=SYNC_CURSOR_BUCKET, key=SYNC_CURSOR_KEY) -> str:
+    '''
+    The version of the titles in the table, the ETag of the sync cursor which changes with
+    every run of legislation_table_update. Without a cursor the titles are read again daily
+    '''
+    etag = object_etag(s3_client, bucket, key)
+    if etag is None:
+        return f"table-{datetime.now(timezone.utc).strftime('%Y-%m-%d')}"
+    return f'table-{etag}'
+
+
+def title_snapshot_version(s3_client, bucket=TITLE_SNAPSHOT_BUCKET, key=TITLE_SNAPSHOT_KEY):
+    '''The version (ETag) of the title snapshot in S3, the table_version if there is none'''
+    return object_etag(s3_client, bucket, key) or table_version(s3_client)
+
+
+def load_title_snapshot(s3_client, bucket=TITLE_SNAPSHOT_BUCKET, key=TITLE_SNAPSHOT_KEY,
+                        path=TITLE_SNAPSHOT_PATH):
+    '''
+    Downloads the title snapshot
+    returns: (version, snapshot): the ETag of the downloaded object, so the version always
+        describes the titles that were read, and the snapshot, None to fall back on the table
+    '''
+    if not bucket:
+        return table_version(s3_client), None
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        logger.info(f'No title snapshot found at {key}')
+        return table_version(s3_client), None
+
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(response['Body'], f)
+    title_snapshot = TitleSnapshot(path)
+    logger.info(
+        f'Loaded title snapshot version {title_snapshot.version} with {title_snapshot.rows} titles')
+    return response['ETag'].strip('"'), title_snapshot
+
+
+def title_matcher_key(version: str, prefix=TITLE_MATCHER_PREFIX) -> str:
+    return f'{prefix}{version}.json.gz'
+
+
+def load_title_matcher(nlp, s3_client, version, bucket=TITLE_MATCHER_BUCKET):
     '''
-    Finds instances of text within a larger piece of text
-    Used for finding references to legislation titles in document
+    Loads the title matcher persisted for a snapshot version, starting an empty one if there
+    is none yet. A matcher stamped with another version is never used
     '''
-    phrase_matcher = PhraseMatcher(nlp.vocab)
-    phrase_list = [nlp(title)]
-    phrase_matcher.add("Text Extractor", None, *phrase_list)
+    if bucket:
+        key = title_matcher_key(version)
+        try:
+            data = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+        except s3_client.exceptions.NoSuchKey:
+            logger.info(f'No title matcher found at {key}')
+        else:
+            title_matcher = TitleMatcher.from_bytes(data, nlp.vocab)
+            if title_matcher.snapshot_version == version:
+                logger.info(
+                    f'Loaded title matcher with {len(title_matcher)} titles from {len(title_matcher.years)} years')
+                return title_matcher
+            logger.warning(f'Ignoring title matcher {key} of snapshot {title_matcher.snapshot_version}')
+
+    return TitleMatcher(nlp.vocab, version)
+
+
+def save_title_matcher(s3_client, title_matcher, bucket=TITLE_MATCHER_BUCKET):
+    '''
+    Uploads the tokenised titles of the title matcher, under the version of its snapshot so a
+    container that has not seen a newer snapshot yet can never replace the matcher of that one
+    '''
+    response = s3_client.put_object(
+        Body=title_matcher.to_bytes(),
+        Bucket=bucket,
+        Key=title_matcher_key(title_matcher.snapshot_version)
+    )
+    logger.info(
+        f'Saved title matcher with {len(title_matcher)} titles of snapshot {title_matcher.snapshot_version}')
+    assert response['ResponseMetadata']['HTTPStatusCode'] == 200, 'Title matcher did not successfully write to S3'
 
-    matched_items = phrase_matcher(nlp_text)
 
-    matched_text = []
-    for _, start, end in matched_items:
-        span = nlp_text[start: end]
-        matched_text.append((span.text, start, end, 100))
-    return matched_text
+def current_titles(nlp, s3_client, check_seconds=TITLE_SNAPSHOT_CHECK_SECONDS) -> tuple:
+    '''
+    The title snapshot and matcher of the container, reloaded (and the years of the matcher
+    dropped) when legislation_table_update has written a new snapshot since they were loaded
+    returns: (title_snapshot, title_matcher)
+    '''
+    now = time.monotonic()
+    if _titles['matcher'] is not None and now - _titles['checked_at'] < check_seconds:
+        return _titles['snapshot'], _titles['matcher']
+
+    _titles['checked_at'] = now
+    if _titles['matcher'] is not None and title_snapshot_version(s3_client) == _titles['version']:
+        return _titles['snapshot'], _titles['matcher']
+
+    if _titles['snapshot'] is not None:
+        logger.info(f'Title snapshot {_titles["version"]} replaced, reloading the titles')
+        _titles['snapshot'].close()
+    version, title_snapshot = load_title_snapshot(s3_client=s3_client)
+    _titles.update({
+        'version': version,
+        'snapshot': title_snapshot,
+        'matcher': load_title_matcher(nlp=nlp, s3_client=s3_client, version=version)
+    })
+    return _titles['snapshot'], _titles['matcher']
+
+
+def update_title_matcher(title_matcher, title_snapshot, table, index_name, dates, nlp) -> bool:
+    '''
+    Adds the titles of every year the matcher has not seen yet
+    The titles come from the local snapshot, or from the table if there is no snapshot
+    returns: True if any year was added
+    '''
+    new_years = [date for date in dates if date not in title_matcher]
+    if not new_years:
+        return False
+
+    if title_snapshot is not None:
+        titles = title_snapshot.titles_for_years(new_years)
+    else:
+        titles = query_titles_from_years(
+            table=table,
+            index_name=index_name,
+            dates=new_years
+        )
+    for year, year_titles in titles.items():
+        title_matcher.add_year(year, year_titles, nlp.tokenizer)
+
+    logger.info(f'Added the titles of {len(new_years)} years to the title matcher')
+    return True
 
 
-def find_legislation_in_text(nlp_text, nlp, titles, dates_in_text):
+def find_legislation_in_text(nlp_text, title_matcher, years_by_sentence):
     '''
     Finds mentions of legislation titles in text
     Returns the first set of results as this is indicative of the legislative origin
     '''
-    sentences = list(nlp_text.sents)
-    results = []
-    for sentence in sentences:
-        years_in_sentence = [
-            year for year in dates_in_text if str(year) in sentence.text]
-        relevant_titles = []
-        for year in years_in_sentence:
-            relevant_titles.extend(titles[str(year)])
-
-        # for every legislation title in the table
-        for title in nlp.pipe(relevant_titles):
-            # detect legislation in the judgement body
-            matches = exact_matcher(title.text, nlp_text, nlp)
-            if matches:
-                results.append(title.text)
-
+    # One pass over the text for the titles of every year
+    titles_found = title_matcher.find(nlp_text)
+    if not titles_found:
+        return []
+
+    # Only sentences that mention a year are visited, in order
+    for years_in_sentence in years_by_sentence.values():
+        results = [
+            title
+            for year in years_in_sentence
+            for title in titles_found.get(str(year), [])
+        ]
         if results:
-            break
-    return results
+            return results
+    return []
 
 
-def extract_legislative_origins(table, title_list):
+def batch_get_legislation(dynamodb, table_name, titles,
+                          max_retries=BATCH_GET_MAX_RETRIES,
+                          backoff_seconds=BATCH_GET_BACKOFF_SECONDS) -> dict:
+    '''
+    Fetches the items of the given titles with BatchGetItem, up to 100 keys per request
+    Unprocessed keys are retried with exponential backoff and full jitter
+    returns: dict of candidate title -> item, titles that are not in the table are left out
+    '''
+    items = {}
+    for start in range(0, len(titles), BATCH_GET_LIMIT):
+        request_items = {
+            table_name: {
+                'Keys': [{'candidate_titles': title}
+                         for title in titles[start: start + BATCH_GET_LIMIT]]
+            }
+        }
+        attempt = 0
+        while request_items:
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            for item in response['Responses'].get(table_name, []):
+                items[item['candidate_titles']] = item
+
+            request_items = response.get('UnprocessedKeys')
+            if request_items:
+                attempt += 1
+                if attempt > max_retries:
+                    raise Exception(
+                        f'BatchGetItem left keys unprocessed after {max_retries} retries')
+                time.sleep(random.uniform(0, backoff_seconds * 2 ** attempt))
+
+    return items
+
+
+def extract_legislative_origins(dynamodb, title_list, table_name=TABLE_NAME,
+                                cache=_legislation_cache):
     '''
     Query the table for the matched legislation in text
     Returns relevant metadata of the legislation and attaches it to document metadata
+    Items are fetched in batches and cached, so titles seen before cost no request at all
     '''
+    missing_titles = [
+        title for title in dict.fromkeys(title_list) if title not in cache]
+    if missing_titles:
+        cache.update(batch_get_legislation(
+            dynamodb=dynamodb,
+            table_name=table_name,
+            titles=missing_titles
+        ))
+        logger.info(f'Fetched {len(missing_titles)} legislation items from DynamoDB')
+
+    legislative_origins = []
     for title in title_list:
-        response = table.get_item(
-            Key={
-                'candidate_titles': title
-            }
-        )
-        item = response['Item']
+        item = cache.get(title)
+        if item is None:
+            logger.warning(f'No legislation item found for {title}')
+            continue
 
         legislative_origin = {
             "href": item["href"],
@@ -148,7 +349,9 @@ def extract_legislative_origins(table, title_list):
             "type": item["legType"],
             "division": item["legDivision"]
         }
-        yield legislative_origin
+        legislative_origins.append(legislative_origin)
+
+    return legislative_origins
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -163,39 +366,48 @@ def handler(event, context: LambdaContext):
     doc_cutoff_point = int(len(text) * CUTOFF)
     top_text = text[:doc_cutoff_point]
 
-    # Intitialising model and text
-    nlp = NLPsetup()
+    # Intitialising model and text, only the tokenizer and the full stop sentencizer are needed
+    nlp = load_profile('sentences', max_length=MAX_TEXT_LENGTH)
     nlp_text = nlp(top_text)
 
     # Find years mentioned in text
-    dates_in_text = detect_year_span(nlp_text, nlp)
+    dates_in_text, years_by_sentence = detect_year_span(nlp_text, nlp)
 
     # Set up the DynamoDB client
-    dynamodb = boto3.resource('dynamodb', region_name='eu-west-2')
+    dynamodb = boto3.resource(
+        'dynamodb', region_name='eu-west-2', endpoint_url=DYNAMODB_ENDPOINT_URL)
     table = dynamodb.Table(TABLE_NAME)
 
-    # Querying table for all titles in matched years
-    titles = query_titles_from_years(
+    # Loading the title matcher once per snapshot and adding the titles of any new years
+    s3_client = boto3.client('s3')
+    title_snapshot, title_matcher = current_titles(nlp=nlp, s3_client=s3_client)
+    years_added = update_title_matcher(
+        title_matcher=title_matcher,
+        title_snapshot=title_snapshot,
         table=table,
         index_name=YEAR_INDEX_NAME,
-        dates=dates_in_text
+        dates=dates_in_text,
+        nlp=nlp
     )
+    if years_added and TITLE_MATCHER_BUCKET:
+        save_title_matcher(s3_client=s3_client, title_matcher=title_matcher)
 
     # Finding legislation referenced in text
     legislative_origins = find_legislation_in_text(
         nlp_text=nlp_text,
-        nlp=nlp,
-        titles=titles,
-        dates_in_text=dates_in_text
+        title_matcher=title_matcher,
+        years_by_sentence=years_by_sentence
     )
 
     # Querying table for metadata of referenced legislation
     legislative_origins_metadata = extract_legislative_origins(
-        table, legislative_origins)
+        dynamodb=dynamodb, title_list=legislative_origins)
 
     # Unpacking and deduping the output of the above function
     unpacked_legislative_origins_metadata = [*legislative_origins_metadata]
     deduped_legislative_origins_metadata = list(
         {frozenset(d.items()): d for d in unpacked_legislative_origins_metadata}.values())
 
+    logger.info({'resources': resource_stats()})
+
     return {'legislative_origins': deduped_legislative_origins_metadata}
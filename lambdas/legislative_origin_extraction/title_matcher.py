@@ -0,0 +1,96 @@
+import gzip
+import json
+from spacy.matcher import PhraseMatcher
+from spacy.tokens import Doc
+
+
+# Version 2 added the version of the title snapshot the titles were read from
+FORMAT_VERSION = 2
+
+
+class TitleMatcher:
+    '''
+    A single PhraseMatcher over the legislation titles of every year loaded so far
+
+    Titles are tokenised and added one year at a time and are kept for the life
+    of the container, so a document is scanned once for every candidate title
+    instead of once per title. The tokenised titles can be serialised, so a cold
+    start can rebuild the matcher without running the tokenizer again.
+    The matcher is stamped with the version of the title snapshot its titles come from.
+    '''
+
+    def __init__(self, vocab, snapshot_version: str = None):
+        self.vocab = vocab
+        self.snapshot_version = snapshot_version
+        self.matcher = PhraseMatcher(vocab)
+        self.patterns = {}
+        self.title_years = {}
+
+    def __len__(self) -> int:
+        return len(self.title_years)
+
+    def __contains__(self, year) -> bool:
+        return str(year) in self.patterns
+
+    @property
+    def years(self) -> list:
+        return list(self.patterns)
+
+    def _add_patterns(self, year: str, patterns) -> None:
+        year_patterns = self.patterns.setdefault(year, [])
+        for title, words in patterns:
+            # Titles are unique in the table, an empty title can never match
+            if not words or title in self.title_years:
+                continue
+            self.matcher.add(title, [Doc(self.vocab, words=words)])
+            self.title_years[title] = year
+            year_patterns.append((title, words))
+
+    def add_year(self, year, titles: list, tokenizer) -> None:
+        '''
+        params: year: the year the titles were published in
+                titles: candidate titles of all legislation from that year
+                tokenizer: the tokenizer of the pipeline the documents are parsed with
+        '''
+        patterns = [
+            (title, [token.text for token in doc])
+            for title, doc in zip(titles, tokenizer.pipe(titles))
+        ]
+        self._add_patterns(str(year), patterns)
+
+    def find(self, doc) -> dict:
+        '''
+        param: doc: parsed document
+        returns: dict of year -> titles found anywhere in the document, in order of first mention
+        '''
+        found = {}
+        for match_id, _, _ in self.matcher(doc):
+            title = self.vocab.strings[match_id]
+            titles = found.setdefault(self.title_years[title], [])
+            if title not in titles:
+                titles.append(title)
+        return found
+
+    def to_bytes(self) -> bytes:
+        '''Serialises the tokenised titles as gzipped JSON'''
+        data = {
+            'version': FORMAT_VERSION,
+            'snapshot_version': self.snapshot_version,
+            'years': {
+                year: [[title, words] for title, words in patterns]
+                for year, patterns in self.patterns.items()
+            }
+        }
+        return gzip.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, data: bytes, vocab) -> 'TitleMatcher':
+        '''Rebuilds a matcher from the output of `to_bytes`'''
+        data = json.loads(gzip.decompress(data))
+        if data.get('version') != FORMAT_VERSION:
+            raise ValueError(f'Unsupported title matcher format version {data.get("version")}')
+
+        title_matcher = cls(vocab, data.get('snapshot_version'))
+        for year, patterns in data['years'].items():
+            title_matcher._add_patterns(year, patterns)
+        return title_matcher
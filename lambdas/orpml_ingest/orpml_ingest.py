@@ -6,7 +6,8 @@ from io import BytesIO
 import boto3
 from aws_lambda_powertools.logging.logger import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from bs4 import BeautifulSoup
+from lxml import etree
+from orpml_writer import attach_meta_tags
 
 logger = Logger()
 
@@ -43,12 +44,12 @@ def get_s3_metadata(s3_client: boto3.client,
     return metadata
 
 
-def process_orpml(doc_bytes_io: BytesIO, metadata: dict) -> str:
+def process_orpml(doc_bytes_io: BytesIO, metadata: dict) -> bytes:
     '''Attaches key metadata to the ORPML header'''
 
-    # Reading in the S3 document and parsing it as HTML
-    orpml_doc = doc_bytes_io.read()
-    orpml = BeautifulSoup(orpml_doc, features='xml')
+    # Parsing the ingested document, huge_tree allows multi-megabyte text nodes
+    parser = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
+    orpml = etree.parse(doc_bytes_io, parser).getroot()
 
     # Finding the time the object was uploaded
     date_uploaded = datetime.now()
@@ -80,26 +81,16 @@ def process_orpml(doc_bytes_io: BytesIO, metadata: dict) -> str:
     }
 
     # Attaching the meta tags to the ORPML header
-    dublinCore = orpml.metadata.dublinCore
-    dcat = orpml.metadata.dcat
-    orp_meta = orpml.metadata.orp
-    for k, v in meta_tags.items():
-        new_meta = orpml.new_tag(k.split(':')[1])
-        new_meta.string = v if v else ''
-        if k.startswith('dc:'):
-            dublinCore.append(new_meta)
-        elif k.startswith('dcat:'):
-            dcat.append(new_meta)
-        elif k.startswith('orp:'):
-            orp_meta.append(new_meta)
+    attach_meta_tags(orpml, meta_tags)
 
     logger.info('Finished attaching metadata to ORPML header')
 
-    return str(orpml)
+    return etree.tostring(
+        orpml, xml_declaration=True, encoding='UTF-8', standalone=True)
 
 
 def write_text(s3_client: boto3.client,
-               text: str,
+               text: bytes,
                document_uid: str,
                destination_bucket=DESTINATION_BUCKET) -> None:
     '''Write the processed ORPML to a .orpml file in the data lake'''
@@ -1,60 +1,23 @@
 import json
 import os
-import re
-import string
 from datetime import datetime
 from io import BytesIO
+from multiprocessing import Pipe, Process
 
 import boto3
 import pdfplumber
 from aws_lambda_powertools.logging.logger import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from bs4 import BeautifulSoup
-from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from orpml_writer import group_meta_tags, write_orpml
+from text_cleaning import clean_text, clean_text_stream
 
 logger = Logger()
 
 DESTINATION_BUCKET = os.environ['DESTINATION_BUCKET']
 
-
-def remove_excess_punctuation(text: str) -> str:
-    '''Removes excess punctuation (obvs lol)'''
-
-    text = text.replace(' .', '')
-    for punc in string.punctuation:
-        text = text.replace(punc + punc, '')
-    return text
-
-
-def clean_text(text: str) -> str:
-    '''Clean the text by removing illegal characters and excess whitespace'''
-
-    pattern = re.compile(r'\s+')
-
-    text = str(text).replace('\n', ' ')
-    text = text.replace(' .', '. ')
-    text = re.sub('(\\d+(\\.\\d+)?)', r' \1 .', text)
-    text = re.sub(pattern, ' ', text)
-    text = remove_excess_punctuation(text=text)
-    text = re.sub(ILLEGAL_CHARACTERS_RE, ' ', text)
-
-    # Space out merged words by adding a space before a capital letter
-    # if it appears after a lowercase letter
-    text = re.sub(
-        r'([a-z](?=[A-Z])|[A-Z](?=[A-Z][a-z]))',
-        r'\1 ',
-        text
-    )
-
-    text = text.strip()
-    text = text.replace('\t', ' ')
-    text = text.replace('_x000c_', '')
-    text = text.encode('ascii', 'ignore').decode('utf-8')
-    text = re.sub('\\s+', ' ', text)
-    text = re.sub('<.*?>', '', text)
-    text = re.sub('\\.{4,}', '.', text)
-
-    return text
+# Documents with at least this many pages are extracted by a pool of worker processes
+PAGE_POOL_THRESHOLD = int(os.environ.get('PDF_PAGE_POOL_THRESHOLD', 40))
+PAGE_WORKERS = int(os.environ.get('PDF_PAGE_WORKERS', os.cpu_count() or 1))
 
 
 def download_text(s3_client: boto3.client,
@@ -89,11 +52,8 @@ def get_s3_metadata(s3_client: boto3.client,
     return metadata
 
 
-def extract_pdf_metadata(doc_bytes_io: BytesIO) -> list:
-    '''Extracts the metadata in the PDF'''
-
-    with pdfplumber.open(doc_bytes_io) as pdf:
-        metadata = pdf.metadata
+def format_pdf_metadata(metadata: dict) -> dict:
+    '''Maps the metadata in the PDF to the ORPML header tags'''
 
     if metadata.get('ModDate'):
         date = datetime.strptime(metadata.get('ModDate')[2:-7], '%Y%m%d%H%M%S')
@@ -121,47 +81,100 @@ def extract_pdf_metadata(doc_bytes_io: BytesIO) -> list:
     return pdf_meta_tags
 
 
-def extract_pdf_text(doc_bytes_io: BytesIO) -> list:
-    '''Extracts the body of the text in the PDF'''
+def extract_page_range(pdf_bytes: bytes, start: int, end: int, conn) -> None:
+    '''Worker process: extracts and cleans a contiguous range of pages and sends them back'''
+
+    try:
+        with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
+            pages = []
+            for page in pdf.pages[start:end]:
+                pages.append(clean_text(text=page.extract_text().strip()))
+                page.flush_cache()
+        conn.send(pages)
+    except Exception as e:
+        conn.send(e)
+    finally:
+        conn.close()
+
+
+def extract_pages_in_pool(pdf_bytes: bytes, num_pages: int, workers: int):
+    '''
+    Splits the pages into one contiguous range per worker and yields the cleaned pages in order
+    Uses Process and Pipe directly as Lambda has no /dev/shm for multiprocessing pools and queues
+    '''
+    range_size = -(-num_pages // workers)
+    jobs = []
+    for start in range(0, num_pages, range_size):
+        parent_conn, child_conn = Pipe(duplex=False)
+        process = Process(
+            target=extract_page_range,
+            args=(pdf_bytes, start, min(start + range_size, num_pages), child_conn))
+        process.start()
+        child_conn.close()
+        jobs.append((process, parent_conn))
+
+    try:
+        for process, parent_conn in jobs:
+            # Receive before joining so a large result cannot block the worker on a full pipe
+            pages = parent_conn.recv()
+            process.join()
+            if isinstance(pages, Exception):
+                raise pages
+            yield from pages
+    finally:
+        for process, parent_conn in jobs:
+            parent_conn.close()
+            if process.is_alive():
+                process.terminate()
+
+
+def iter_raw_pages(pdf):
+    '''Generator of the raw text content of every page'''
+
+    for page in pdf.pages:
+        yield page.extract_text().strip()
+        # Release the parsed layout so memory stays bounded by one page
+        page.flush_cache()
+
+
+def iter_pdf_pages(pdf, doc_bytes_io: BytesIO,
+                   pool_threshold=PAGE_POOL_THRESHOLD, workers=PAGE_WORKERS):
+    '''Generator of the cleaned text of every page, closes the PDF once exhausted'''
+
+    try:
+        num_pages = len(pdf.pages)
+        if num_pages >= pool_threshold and workers > 1:
+            logger.info(f'Extracting {num_pages} pages with {workers} worker processes')
+            yield from extract_pages_in_pool(
+                doc_bytes_io.getvalue(), num_pages, workers)
+        else:
+            yield from clean_text_stream(iter_raw_pages(pdf))
+    finally:
+        pdf.close()
 
-    pages = list()
-    with pdfplumber.open(doc_bytes_io) as pdf:
-        for i, page in enumerate(pdf.pages):
-            # Extract text content from the page
-            page_content = page.extract_text().strip()
+    logger.info('Extracted text from PDF')
 
-            # Remove excess punctuation from the text
-            page_content = clean_text(text=page_content)
-            pages.append(page_content)
 
-    logger.info('Extracted text from PDF')
+def extract_pdf(doc_bytes_io: BytesIO) -> tuple:
+    '''
+    Parses the PDF once and returns its metadata tags and a generator of cleaned pages
+    The pages are extracted lazily as the generator is consumed
+    '''
+    pdf = pdfplumber.open(doc_bytes_io)
+    try:
+        pdf_meta_tags = format_pdf_metadata(pdf.metadata)
+    except Exception:
+        pdf.close()
+        raise
+
+    return pdf_meta_tags, iter_pdf_pages(pdf, doc_bytes_io)
 
-    return pages
-
-
-def process_orpml(pages: dict, pdf_meta_tags: dict, s3_metadata: dict) -> str:
-    '''Builds the ORPML document from the metadata and text extracted from the PDF'''
-
-    orpml = BeautifulSoup(
-        '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-            <orpml xmlns="http://www.beis.gov.uk/namespaces/orpml">
-              <metadata>
-                <dublinCore>
-                </dublinCore>
-                <dcat>
-                </dcat>
-                <orp>
-                </orp>
-              </metadata>
-              <documentContent>
-                <html>
-                  <body>
-                  </body>
-                </html>
-              </documentContent>
-            </orpml>''',
-        features='xml'
-    )
+
+def process_orpml(pages, pdf_meta_tags: dict, s3_metadata: dict) -> bytes:
+    '''
+    Builds the ORPML document from the metadata and text extracted from the PDF
+    Pages are streamed into the document one at a time as the generator is consumed
+    '''
 
     # Finding the time the object was uploaded
     date_uploaded = datetime.now()
@@ -185,39 +198,22 @@ def process_orpml(pages: dict, pdf_meta_tags: dict, s3_metadata: dict) -> str:
 
     meta_tags = {**pdf_meta_tags, **s3_meta_tags}
 
-    # Attaching the meta tags to the ORPML header
-    dublinCore = orpml.metadata.dublinCore
-    dcat = orpml.metadata.dcat
-    orp_meta = orpml.metadata.orp
-    for k, v in meta_tags.items():
-        new_meta = orpml.new_tag(k.split(':')[1])
-        new_meta.string = v if v else ''
-        if k.startswith('dc:'):
-            dublinCore.append(new_meta)
-        elif k.startswith('dcat:'):
-            dcat.append(new_meta)
-        elif k.startswith('orp:'):
-            orp_meta.append(new_meta)
-
-    logger.info('Finished attaching metadata to ORPML header')
-
-    body_tag = orpml.find('body')
-    # Iterate over the pages and append them to the <body> tag
-    for page in pages:
-        # Create a new HTML tag for the page
-        page_tag = orpml.new_tag('div', attrs={'class': 'page'})
-        page_tag.string = page
-
-        # Append the page tag to the HTML
-        body_tag.append(page_tag)
+    # Writing the header and then every page to the <body> tag
+    orpml = BytesIO()
+    write_orpml(
+        output=orpml,
+        header=group_meta_tags(meta_tags),
+        body=pages,
+        div_class='page'
+    )
 
-    logger.info('Finished attaching page to ORPML body')
+    logger.info('Finished writing ORPML header and pages')
 
-    return str(orpml)
+    return orpml.getvalue()
 
 
 def write_text(s3_client: boto3.client,
-               text: str,
+               text: bytes,
                document_uid: str,
                destination_bucket=DESTINATION_BUCKET) -> None:
     '''Write the extracted text to a .orpml file in the data lake'''
@@ -264,9 +260,8 @@ def handler(event: dict, context: LambdaContext) -> dict:
     # Raise an error if there is no UUID in the document's S3 metadata
     assert doc_s3_metadata.get('uuid'), 'Document must have a UUID attached'
 
-    # Extract text and metadata from PDF
-    pdf_meta_tags = extract_pdf_metadata(doc_bytes_io=doc_bytes_io)
-    text_pages = extract_pdf_text(doc_bytes_io=doc_bytes_io)
+    # Extract metadata and a generator of text pages from a single parse of the PDF
+    pdf_meta_tags, text_pages = extract_pdf(doc_bytes_io=doc_bytes_io)
 
     # Build ORPML document (insert header and body)
     orpml_doc = process_orpml(
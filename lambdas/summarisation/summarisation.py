@@ -1,12 +1,27 @@
 import os
+import torch
+from concurrent.futures import ThreadPoolExecutor
 from langdetect import detect
 from transformers import pipeline
-from utils import smart_postprocessor, smart_shortener
+from utils import (smart_postprocessor, smart_shortener, length_sorted_batches,
+                   split_sentences, token_bounded_pieces, token_bounded_chunks)
+from resource_cache import get_resource, resource_stats
 from aws_lambda_powertools.logging.logger import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
 logger = Logger()
 
+BATCH_SIZE = int(os.environ.get('SUMMARY_BATCH_SIZE', 8))
+MAX_SUMMARY_LENGTH = 600
+
+# Long document (map-reduce) mode
+CHUNK_TOKENS = int(os.environ.get('SUMMARY_CHUNK_TOKENS', 900))
+# Each round shrinks the text by about CHUNK_TOKENS / CHUNK_SUMMARY_TOKENS, so three rounds
+# reduce over 200 chunks to one model input
+CHUNK_SUMMARY_TOKENS = int(os.environ.get('SUMMARY_CHUNK_SUMMARY_TOKENS', 150))
+CHUNK_WORKERS = int(os.environ.get('SUMMARY_CHUNK_WORKERS', os.cpu_count() or 1))
+MAX_REDUCE_ROUNDS = 3
+
 
 def validate_env_variable(env_var_name):
     logger.debug(
@@ -26,7 +41,7 @@ def load_model(
     summarizer = pipeline(
         "summarization",
         f"./LLM/{model}",
-        max_length=600,
+        max_length=MAX_SUMMARY_LENGTH,
         truncation=True)
     return summarizer
 
@@ -41,21 +56,144 @@ def detect_language(text):
     return language
 
 
+def chunk_text(text, tokenizer, chunk_tokens=CHUNK_TOKENS):
+    '''
+    param: text: Str document text
+    param: tokenizer: tokenizer of the summarisation model
+    param: chunk_tokens: Int token budget of each chunk
+        returns: List of chunks made of whole sentences, each within the token budget.
+        Sentences longer than the budget on their own are cut on token boundaries
+    '''
+    sentences = split_sentences(text)
+    if not sentences:
+        return []
+    offset_mapping = tokenizer(
+        sentences, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+    pieces = [piece for sentence, offsets in zip(sentences, offset_mapping)
+              for piece in token_bounded_pieces(sentence, offsets, chunk_tokens)]
+    return token_bounded_chunks(
+        [piece for piece, _ in pieces], [length for _, length in pieces], chunk_tokens)
+
+
+def summarise_chunks(chunks, summarizer, workers=CHUNK_WORKERS, max_length=MAX_SUMMARY_LENGTH):
+    '''
+    param: chunks: List of Str, each within the model's input size
+    param: summarizer: summarisation pipeline
+    param: workers: Int number of chunks generated concurrently
+    param: max_length: Int maximum tokens of each summary
+        returns: List of chunk summaries in the same order as chunks
+    Tokenising and decoding stay on the calling thread as the fast tokenizer is not thread safe,
+    only generation runs in the pool. Torch releases the GIL, so the workers run on separate cores
+    '''
+    tokenizer, model = summarizer.tokenizer, summarizer.model
+    inputs = [tokenizer(chunk, truncation=True, return_tensors='pt') for chunk in chunks]
+
+    def generate(encoded):
+        with torch.no_grad():
+            return model.generate(**encoded, max_length=max_length)[0]
+
+    workers = max(1, min(workers, len(inputs)))
+    previous_threads = torch.get_num_threads()
+    # Split the cores between the workers rather than oversubscribing them
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(generate, inputs))
+    finally:
+        torch.set_num_threads(previous_threads)
+
+    return [tokenizer.decode(output, skip_special_tokens=True) for output in outputs]
+
+
+def summarise_long_document(chunks, summarizer, chunk_tokens=CHUNK_TOKENS,
+                            summary_tokens=CHUNK_SUMMARY_TOKENS, workers=CHUNK_WORKERS):
+    '''
+    param: chunks: List of Str, the document split by chunk_text
+    param: summarizer: summarisation pipeline
+        returns: Str summary of the chunk summaries
+    Map: summarise every chunk in parallel, each in at most summary_tokens. Reduce: re-chunk
+    the concatenated summaries and summarise them again, for a bounded number of rounds,
+    until they fit one input
+    '''
+    logger.info(f'Summarising long document in {len(chunks)} chunks with {workers} workers')
+
+    for _ in range(MAX_REDUCE_ROUNDS):
+        combined = ' '.join(summarise_chunks(chunks, summarizer, workers, max_length=summary_tokens))
+        chunks = chunk_text(combined, summarizer.tokenizer, chunk_tokens)
+        if len(chunks) <= 1:
+            break
+    else:
+        logger.warning(
+            f'Chunk summaries still span {len(chunks)} chunks after {MAX_REDUCE_ROUNDS} reduce rounds, '
+            'the final summary is truncated to one model input')
+
+    return summarise_chunks([combined], summarizer, workers=1)[0]
+
+
+def summarise_batch(texts, summarizer, batch_size=BATCH_SIZE):
+    '''
+    param: texts: List of document texts
+    param: summarizer: summarisation pipeline
+    param: batch_size: Int number of documents per padded mini-batch
+        returns: List of {'summary', 'lang'} dictionaries in the same order as texts
+    '''
+    lengths = [len(ids) for ids in summarizer.tokenizer(
+        texts, truncation=True)['input_ids']]
+
+    results = [None] * len(texts)
+    for batch in length_sorted_batches(lengths, batch_size):
+        outputs = summarizer([texts[i] for i in batch], batch_size=len(batch))
+        for i, output in zip(batch, outputs):
+            results[i] = {
+                'summary': smart_postprocessor(output['summary_text']),
+                'lang': detect_language(text=texts[i])
+            }
+
+    return results
+
+
 def handler(event, context: LambdaContext):
     logger.set_correlation_id(context.aws_request_id)
 
     text = event['text']
 
-    summarizer = load_model()
+    summarizer = get_resource('summarizer', load_model)
 
     # Detect language
     lang = detect_language(text=text)
 
+    # Documents longer than one model input are summarised chunk by chunk
+    chunks = chunk_text(text=text, tokenizer=summarizer.tokenizer)
+    if len(chunks) > 1:
+        raw_summary = summarise_long_document(chunks=chunks, summarizer=summarizer)
+    else:
+        raw_summary = summarizer(text)[0]["summary_text"]
+
     # Shorten text after summarising
-    summary = smart_postprocessor(
-        summarizer(text)[0]["summary_text"])
+    summary = smart_postprocessor(raw_summary)
 
     logger.info(f'Langauge: {lang}')
     logger.info(f'Summary: {summary}')
+    logger.info({'resources': resource_stats()})
 
     return {'summary': summary, 'lang': lang}
+
+
+def batch_handler(event, context: LambdaContext):
+    '''Summarises a list of documents, each a dictionary with a document_uid and text'''
+    logger.set_correlation_id(context.aws_request_id)
+
+    documents = event['documents']
+    batch_size = int(event.get('batch_size', BATCH_SIZE))
+
+    summarizer = get_resource('summarizer', load_model)
+    results = summarise_batch(
+        texts=[document['text'] for document in documents],
+        summarizer=summarizer,
+        batch_size=batch_size)
+
+    logger.info(f'Summarised {len(documents)} documents in batches of {batch_size}')
+    logger.info({'resources': resource_stats()})
+
+    return [{'document_uid': document.get('document_uid'), **result}
+            for document, result in zip(documents, results)]
@@ -29,3 +29,58 @@ def smart_postprocessor(sentence):
             return shortened_complete
         else:
             return shortened_complete
+
+
+def length_sorted_batches(lengths, batch_size):
+    '''
+    params: lengths: List of token lengths, one per document
+    params: batch_size: Int maximum number of documents per batch
+    returns: batches: List of lists of document indices
+        Documents of similar length are grouped so each padded batch wastes little compute
+    '''
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[i: i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def split_sentences(text):
+    '''
+    params: text: Str
+    returns: sentences: List of Str split after sentence-ending punctuation
+    '''
+    return [s for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
+
+
+def token_bounded_pieces(sentence, offsets, chunk_tokens):
+    '''
+    params: sentence: Str
+    params: offsets: List of (start, end) character offsets of the tokens of the sentence
+    params: chunk_tokens: Int token budget of each chunk
+    returns: pieces: List of (Str, Int token length), the sentence itself if it fits the budget,
+        otherwise cut at the start of every chunk_tokens-th token
+    '''
+    if len(offsets) <= chunk_tokens:
+        return [(sentence, len(offsets))]
+    starts = [0] + [offsets[i][0] for i in range(chunk_tokens, len(offsets), chunk_tokens)]
+    ends = starts[1:] + [len(sentence)]
+    return [(sentence[start: end].strip(), min(chunk_tokens, len(offsets) - i * chunk_tokens))
+            for i, (start, end) in enumerate(zip(starts, ends))]
+
+
+def token_bounded_chunks(sentences, lengths, chunk_tokens):
+    '''
+    params: sentences: List of Str
+    params: lengths: List of token lengths, one per sentence
+    params: chunk_tokens: Int token budget of each chunk
+    returns: chunks: List of Str, consecutive sentences packed up to the budget
+    '''
+    chunks, current, current_tokens = [], [], 0
+    for sentence, length in zip(sentences, lengths):
+        if current and current_tokens + length > chunk_tokens:
+            chunks.append(' '.join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += length
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
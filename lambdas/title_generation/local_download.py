@@ -1,9 +1,13 @@
+import json
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from title_engine import T5_MODEL_NAME, T5_MODEL_PATH, T5_TOKENIZER_PATH, MODEL_VERSION_FILE
 
-tokenizer = AutoTokenizer.from_pretrained(
-    'fabiochiu/t5-small-medium-title-generation')
-model = AutoModelForSeq2SeqLM.from_pretrained(
-    'fabiochiu/t5-small-medium-title-generation')
+tokenizer = AutoTokenizer.from_pretrained(T5_MODEL_NAME)
+model = AutoModelForSeq2SeqLM.from_pretrained(T5_MODEL_NAME)
 
-model.save_pretrained('./LLM/t5_model')
-tokenizer.save_pretrained('./LLM/t5_tokenizer')
+model.save_pretrained(T5_MODEL_PATH)
+tokenizer.save_pretrained(T5_TOKENIZER_PATH)
+
+# The hub revision the weights were downloaded at, so titles of another build are told apart
+with open(f'{T5_MODEL_PATH}/{MODEL_VERSION_FILE}', 'w') as f:
+    json.dump({'name': T5_MODEL_NAME, 'revision': getattr(model.config, '_commit_hash', None)}, f)
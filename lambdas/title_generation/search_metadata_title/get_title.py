@@ -1,9 +1,13 @@
 import re
-import spacy
+import numpy as np
 from typing import List
+from spacy.attrs import IDX, ORTH
+from nlp_profiles import load_profile
 from preprocess.preprocess_functions import removing_regulator_names
 
 my_pattern = re.compile(r'\s+')
+PUNCTUATION_RE = re.compile(r'[^\w\s]')
+MAX_CANDIDATE_TITLES = 1000
 
 
 # Shorten text for input to title extraction model
@@ -21,6 +25,19 @@ def percentage_shortener(text: str, percentage=0.1) -> str:
     return shortened_complete
 
 
+def candidate_words(metadata_title: str, text: str, padding=0) -> tuple:
+    """
+    param: metadata_title: Str title
+    param: text: Str document text
+    param: padding: int padding around candidate titles
+    returns: words, window_length: words of the shortened text and the number of words
+        in each candidate title, candidate title i is words[i: i + window_length]
+    """
+    text = percentage_shortener(text)
+    window_length = len(metadata_title.split(" ")) + padding
+    return text.split(" "), window_length
+
+
 def rolling_padded_sentence(metadata_title: str, text: str, padding=0) -> List:
     """
     param: metadata_title: Str title
@@ -28,10 +45,8 @@ def rolling_padded_sentence(metadata_title: str, text: str, padding=0) -> List:
     param: padding: int padding around candidate titles
     returns: candidate_titles: List of titles to iterate the metadata title over
     """
-    text = percentage_shortener(text)
+    tokenized_text, padded_title_length = candidate_words(metadata_title, text, padding)
     candidate_titles = []
-    padded_title_length = len(metadata_title.split(" ")) + padding
-    tokenized_text = text.split(" ")
 
     for starting_idx in range(0, len(tokenized_text) - padded_title_length + 1):
         candidate_title = tokenized_text[starting_idx: starting_idx +
@@ -39,37 +54,100 @@ def rolling_padded_sentence(metadata_title: str, text: str, padding=0) -> List:
         candidate_titles.append(" ".join(candidate_title))
 
     # Capping the candidate title list at 1000
-    if len(candidate_titles) > 1000:
-        return candidate_titles[0: 1000]
+    return candidate_titles[0: MAX_CANDIDATE_TITLES]
 
-    else:
-        return candidate_titles
 
+def normalise(text: str) -> str:
+    """Lower case without punctuation, as titles are compared"""
+    return PUNCTUATION_RE.sub('', text.lower())
 
-# Define function to get similarity scores
-def get_similarity_scores(title: str, candidate_titles: List) -> float:
+
+def token_vectors(doc) -> tuple:
     """
-    param: title: Str title
-    param: candidate_titles: List of candidate titles
-    returns: score: highest similarity score of metadata title over list of candidate titles
-        Makes use of a pretrained model to compare embeddings of the title and candidate title
+    param: doc: tokenised text
+    returns: keys, vectors: the vector table key of every token and a (tokens, width)
+        matrix of their static vectors, zeros for tokens without a vector
     """
-    similarity_scores = []
+    table = doc.vocab.vectors
+    keys = doc.to_array(getattr(table, 'attr', ORTH)).reshape(-1)
+    vectors = np.zeros((len(keys), table.shape[1]), dtype=np.float64)
+    if len(keys):
+        rows = np.asarray(table.find(keys=keys))
+        found = rows >= 0
+        vectors[found] = np.asarray(table.data)[rows[found]]
+    return keys, vectors
 
-    nlp = spacy.load("en_core_web_lg")
 
-    title = nlp(re.sub(r'[^\w\s]', '', title.lower()))
+def cosine_scores(title_vector: np.ndarray, window_sums: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of the title against every window, 0 where either has no vector
+    The sums of the token vectors are used instead of their means as the scale cancels out
+    """
+    norms = np.linalg.norm(window_sums, axis=1) * np.linalg.norm(title_vector)
+    dots = window_sums @ title_vector
+    scores = np.zeros(len(window_sums))
+    np.divide(dots, norms, out=scores, where=norms > 0)
+    return scores
 
-    for sent in candidate_titles:
-        score = title.similarity(nlp(re.sub(r'[^\w\s]', '', sent.lower())))
-        similarity_scores.append(score * 100)
 
-    # Get score of match
-    if len(similarity_scores) > 0:
-        score = max(similarity_scores)
-    else:
-        score = 0
+# Define function to get similarity scores
+def get_similarity_scores(title: str, words: List, window_length: int,
+                          max_candidates=MAX_CANDIDATE_TITLES) -> float:
+    """
+    param: title: Str title
+    param: words: List words of the text, split on single spaces
+    param: window_length: int number of words in each candidate title
+    param: max_candidates: int number of candidate titles compared, from the start of the text
+    returns: score: highest similarity score of metadata title over list of candidate titles
+        Compares the mean word vector of the title with that of every window of
+        window_length words, with the same scores as spaCy's Doc.similarity
+        (cosine of the mean static vectors, 1 for identical tokens, 0 without vectors).
+        The text is tokenised once and the vector sum of each window is the
+        difference of two rows of the cumulative sum of the token vectors
+    """
+    num_windows = min(len(words) - window_length + 1, max_candidates)
+    if num_windows <= 0:
+        return 0
+
+    nlp = load_profile('vectors')
+
+    title_keys, title_vectors = token_vectors(nlp.make_doc(normalise(title)))
+    title_vector = title_vectors.sum(axis=0)
+
+    # Windows start at a word and span window_length words, joined by single spaces
+    words = [normalise(word) for word in words[: num_windows + window_length - 1]]
+    text = " ".join(words)
+    word_starts = np.cumsum([0] + [len(word) + 1 for word in words])
+    window_starts = word_starts[:num_windows]
+    window_ends = word_starts[window_length: window_length + num_windows] - 1
+
+    doc = nlp.make_doc(text)
+    keys, vectors = token_vectors(doc)
+    cumulative = np.zeros((len(keys) + 1, vectors.shape[1]))
+    np.cumsum(vectors, axis=0, out=cumulative[1:])
+
+    # Tokens are split at spaces, so the tokens of a window that starts and ends
+    # with a word character are exactly the tokens of the text within its span
+    token_starts = doc.to_array(IDX).reshape(-1)
+    first = np.searchsorted(token_starts, window_starts)
+    last = np.searchsorted(token_starts, window_ends)
+    window_sums = cumulative[last] - cumulative[first]
+    window_keys = [keys[i: j] for i, j in zip(first, last)]
+
+    # Whitespace at the edge of a window (e.g. a word that was only punctuation)
+    # is tokenised differently on its own, those windows are tokenised separately
+    for i, (start, end) in enumerate(zip(window_starts, window_ends)):
+        if start == end or text[start].isspace() or text[end - 1].isspace():
+            window_keys[i], own_vectors = token_vectors(nlp.make_doc(text[start: end]))
+            window_sums[i] = own_vectors.sum(axis=0)
+
+    scores = cosine_scores(title_vector, window_sums)
+    for i, window_key in enumerate(window_keys):
+        if len(window_key) == len(title_keys) and np.array_equal(window_key, title_keys):
+            scores[i] = 1.0
 
+    # Get score of match
+    score = float(scores.max()) * 100
     return score
 
 
@@ -81,7 +159,7 @@ def identify_metadata_title_in_text(metadata_title: str, text: str) -> float:
         Function that brings all predefined functions together
     """
 
-    candidate_titles = rolling_padded_sentence(metadata_title=metadata_title, text=text)
-    score = get_similarity_scores(metadata_title, candidate_titles)
+    words, window_length = candidate_words(metadata_title=metadata_title, text=text)
+    score = get_similarity_scores(metadata_title, words, window_length)
 
     return score
@@ -0,0 +1,121 @@
+import os
+import re
+import json
+import hashlib
+from collections import OrderedDict
+from aws_lambda_powertools.logging.logger import Logger
+
+
+logger = Logger(child=True)
+
+
+FORMAT_VERSION = 1
+# Characters of the normalised text that identify a document
+LEADING_CHARACTERS = 5000
+DEFAULT_CACHE_SIZE = 1024
+
+NON_WORD_RE = re.compile(r'[^\w\s]')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalise(text: str) -> str:
+    '''Lower case words separated by single spaces, without punctuation'''
+    return WHITESPACE_RE.sub(' ', NON_WORD_RE.sub(' ', str(text).lower())).strip()
+
+
+def title_cache_key(metadata_title: str, text: str, model: str, settings: dict = None) -> str:
+    '''
+    param: metadata_title: Str title from the document's metadata
+    param: text: Str document text
+    param: model: Str name, version and quantisation of the title model, so a new model
+        does not serve the titles of the previous one from a shared cache directory
+    param: settings: dict of anything else the title depends on, e.g. the decoding setting
+    returns: Str hash of the normalised metadata title and leading text, so uploads of the
+        same document (or of a template that only differs further in) share a key
+    '''
+    leading = normalise(str(text)[: LEADING_CHARACTERS * 2])[: LEADING_CHARACTERS]
+    content = json.dumps(
+        [FORMAT_VERSION, model, normalise(metadata_title), leading, settings or {}],
+        sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=20).hexdigest()
+
+
+class TitleCache:
+    '''
+    Titles by content key, held in an LRU in memory and optionally in a directory
+
+    The directory (e.g. on EFS) is shared between containers and survives cold starts,
+    each entry is a small JSON file named after its key and written atomically, so
+    concurrent writers of the same key cannot leave a partial file behind.
+    '''
+
+    def __init__(self, size: int = DEFAULT_CACHE_SIZE, directory: str = None):
+        self.size = size
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory:
+            try:
+                os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                logger.warning(f'Title cache directory {directory} is unavailable, using memory only: {e}')
+                self.directory = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def _remember(self, key: str, title: str) -> None:
+        self.entries[key] = title
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def get(self, key: str):
+        '''returns: the cached title, None on a miss'''
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        if self.directory:
+            try:
+                with open(self._path(key), encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = None
+            if entry and entry.get('version') == FORMAT_VERSION:
+                self._remember(key, entry['title'])
+                self.disk_hits += 1
+                return entry['title']
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, title: str) -> None:
+        self._remember(key, title)
+        if not self.directory:
+            return
+
+        # The cache is only an optimisation, a full or read-only store must not fail the request
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary_path = f'{path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': FORMAT_VERSION, 'title': title}, f)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            logger.warning(f'Could not write title cache entry {key}: {e}')
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses
+        }
@@ -0,0 +1,122 @@
+import re
+import json
+import time
+import torch
+import hashlib
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+
+T5_MODEL_NAME = 'fabiochiu/t5-small-medium-title-generation'
+T5_MODEL_PATH = './LLM/t5_model'
+T5_TOKENIZER_PATH = './LLM/t5_tokenizer'
+PROMPT = 'summarize: '
+# Written next to the saved model by local_download.py
+MODEL_VERSION_FILE = 'model_version.json'
+
+# Decoding settings passed to model.generate, full_beam is what titles were always generated with
+DECODING_PRESETS = {
+    'greedy': {'num_beams': 1, 'do_sample': False, 'min_length': 10},
+    'small_beam': {'num_beams': 3, 'do_sample': False, 'min_length': 10, 'early_stopping': True},
+    'full_beam': {'num_beams': 10, 'do_sample': False, 'min_length': 10},
+}
+REFERENCE_PRESET = 'full_beam'
+
+# Upper bound on the characters one input token covers, used to cut the text before it is
+# preprocessed so that only the start of the document that can reach the model is cleaned
+CHARACTERS_PER_TOKEN_BOUND = 20
+
+WORD_RE = re.compile(r'\w+')
+
+
+def load_t5(quantise: bool = False) -> tuple:
+    '''
+    Loads the T5 title generation model and tokenizer from the local path
+    param: quantise: Bool apply dynamic int8 quantisation to the linear layers, for CPU inference
+    returns: model, tokenizer
+    '''
+    t5_model = AutoModelForSeq2SeqLM.from_pretrained(T5_MODEL_PATH)
+    t5_model.eval()
+    if quantise:
+        t5_model = torch.quantization.quantize_dynamic(
+            t5_model, {torch.nn.Linear}, dtype=torch.qint8)
+    t5_tokenizer = AutoTokenizer.from_pretrained(T5_TOKENIZER_PATH)
+    return t5_model, t5_tokenizer
+
+
+def model_version(quantise: bool = False) -> str:
+    '''
+    param: quantise: Bool whether the model is quantised when it is loaded
+    returns: Str name, revision and quantisation of the local model, titles generated by
+        another model (or the same one quantised differently) must not be taken for its own
+    '''
+    try:
+        with open(f'{T5_MODEL_PATH}/{MODEL_VERSION_FILE}') as f:
+            version = json.load(f)
+    except (OSError, ValueError):
+        version = {'name': T5_MODEL_NAME, 'revision': None}
+    if not version.get('revision'):
+        # Images built before the revision was recorded, the config identifies the weights
+        with open(f'{T5_MODEL_PATH}/config.json', 'rb') as f:
+            version['revision'] = hashlib.sha1(f.read()).hexdigest()
+    return f"{version['name']}@{version['revision']}:{'int8' if quantise else 'fp32'}"
+
+
+def input_budget(tokenizer, max_input_tokens: int = None) -> int:
+    '''The number of input tokens the model is given, the tokenizer's own limit if no budget is set'''
+    if max_input_tokens is None:
+        return tokenizer.model_max_length
+    return min(max_input_tokens, tokenizer.model_max_length)
+
+
+def leading_text(text: str, tokenizer, max_input_tokens: int = None) -> str:
+    '''
+    param: text: Str document text
+    returns: the start of the text, long enough to fill the input budget
+    '''
+    return text[: input_budget(tokenizer, max_input_tokens) * CHARACTERS_PER_TOKEN_BOUND]
+
+
+def generate_title(text: str, model, tokenizer, preset: str = REFERENCE_PRESET,
+                   max_input_tokens: int = None) -> tuple:
+    '''
+    param: text: Str preprocessed document text
+    param: preset: Str one of DECODING_PRESETS
+    param: max_input_tokens: Int number of tokens taken from the start of the text
+    returns: decoded, metrics: the raw generated text and a dict of the
+        preset, input and output token counts and latency of the generation
+    '''
+    if preset not in DECODING_PRESETS:
+        raise ValueError(f'Unknown decoding preset {preset}, expected one of {list(DECODING_PRESETS)}')
+
+    start = time.perf_counter()
+    inputs = tokenizer(
+        [PROMPT + text],
+        truncation=True,
+        max_length=input_budget(tokenizer, max_input_tokens),
+        return_tensors='pt')
+    with torch.inference_mode():
+        output = model.generate(**inputs, **DECODING_PRESETS[preset])
+    decoded = tokenizer.batch_decode(output, skip_special_tokens=True)[0]
+
+    metrics = {
+        'preset': preset,
+        'input_tokens': int(inputs['input_ids'].shape[1]),
+        'output_tokens': int(output.shape[1]),
+        'latency_ms': round((time.perf_counter() - start) * 1000, 1)
+    }
+    return decoded, metrics
+
+
+def title_agreement(title: str, reference: str) -> dict:
+    '''
+    param: title: Str title generated with a cheaper setting
+    param: reference: Str title generated with the reference setting
+    returns: dict of whether the titles are identical and the Jaccard overlap of their words
+    '''
+    words = set(WORD_RE.findall(title.lower()))
+    reference_words = set(WORD_RE.findall(reference.lower()))
+    union = words | reference_words
+    return {
+        'exact_match': title == reference,
+        'word_overlap': round(len(words & reference_words) / len(union), 3) if union else 1.0
+    }
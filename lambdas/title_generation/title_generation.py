@@ -1,9 +1,13 @@
 import os
 import re
 import nltk
+import random
 from preprocess.preprocess_functions import preprocess
+from resource_cache import get_resource, resource_stats
 from aws_lambda_powertools.logging.logger import Logger
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from title_cache import TitleCache, title_cache_key
+from title_engine import (DECODING_PRESETS, REFERENCE_PRESET, generate_title, leading_text,
+                          load_t5, model_version, title_agreement)
 from postprocess.postprocess_functions import postprocess_title
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from preprocess.preprocess_functions import removing_regulator_names
@@ -14,41 +18,88 @@ logger = Logger()
 
 NLTK_DATA = os.environ['NLTK_DATA']
 
-# Download models from local path
-t5_tokenizer = AutoTokenizer.from_pretrained(
-    './LLM/t5_tokenizer')
-t5_model = AutoModelForSeq2SeqLM.from_pretrained(
-    './LLM/t5_model')
-
 os.makedirs(NLTK_DATA, exist_ok=True)
 nltk.download('popular', download_dir=NLTK_DATA)
 
+# Decoding setting of the title model, the defaults are the reference setting
+TITLE_DECODING_PRESET = os.environ.get('TITLE_DECODING_PRESET', REFERENCE_PRESET)
+# Tokens taken from the start of the document, 0 keeps the tokenizer's own limit
+TITLE_MAX_INPUT_TOKENS = int(os.environ.get('TITLE_MAX_INPUT_TOKENS', 0)) or None
+TITLE_QUANTISE = os.environ.get('TITLE_QUANTISE', 'false').lower() == 'true'
+# Share of documents also decoded with the reference setting to measure agreement
+TITLE_AGREEMENT_SAMPLE_RATE = float(os.environ.get('TITLE_AGREEMENT_SAMPLE_RATE', 0))
+
+# Titles of documents seen before, by a hash of the metadata title and the leading text.
+# TITLE_CACHE_DIR (e.g. on EFS) keeps them across containers, the LRU only lives in this one
+TITLE_CACHE_SIZE = int(os.environ.get('TITLE_CACHE_SIZE', 1024))
+TITLE_CACHE_DIR = os.environ.get('TITLE_CACHE_DIR')
+
+if TITLE_DECODING_PRESET not in DECODING_PRESETS:
+    raise ValueError(
+        f'Unknown TITLE_DECODING_PRESET {TITLE_DECODING_PRESET}, expected one of {list(DECODING_PRESETS)}')
+
 
-def title_predictor(text: str, model, tokenizer) -> str:
+def load_title_cache() -> TitleCache:
+    '''Creates the title cache, backed by TITLE_CACHE_DIR when it is set'''
+    return TitleCache(size=TITLE_CACHE_SIZE, directory=TITLE_CACHE_DIR)
+
+
+def title_predictor(text: str, model, tokenizer, preset: str = REFERENCE_PRESET,
+                    max_input_tokens: int = None) -> tuple:
     '''
     param: text: Str document text
-    returns: processed_title: Str cleaned predicted title from text from pretrained model
+    param: preset: Str decoding preset, one of DECODING_PRESETS
+    param: max_input_tokens: Int number of tokens taken from the start of the text
+    returns: processed_title, metrics: Str cleaned predicted title from text from pretrained model
+        and a dict of the generation latency and token counts
         Function to predict a title from the document text using a pretrained model
     '''
 
-    # Preprocess the text
+    # The fast presets only preprocess the start of the text, the rest is truncated by the
+    # tokenizer. The reference preprocesses the whole text, as titles always were
+    if preset != REFERENCE_PRESET:
+        text = leading_text(text, tokenizer, max_input_tokens)
     text = preprocess(text)
-    inputs = ['summarize: ' + text]
-    inputs = tokenizer(inputs, truncation=True, return_tensors='pt')
-    output = model.generate(**inputs, num_beams=10,
-                            do_sample=False, min_length=10)
-    decoded_output = tokenizer.batch_decode(
-        output, skip_special_tokens=True)[0]
+    decoded_output, metrics = generate_title(
+        text, model=model, tokenizer=tokenizer, preset=preset, max_input_tokens=max_input_tokens)
     predicted_title = nltk.sent_tokenize(decoded_output.strip())[0]
 
     # Postprocess the text
     processed_title = postprocess_title(predicted_title)
-    return processed_title
+    return processed_title, metrics
 
 
-def get_title(title: str,
-              text: str,
-              threshold: str) -> str:
+def predict_title(text: str) -> str:
+    '''
+    param: text: Str document text
+    returns: title: Str title generated with the configured decoding setting
+        When the setting differs from the reference (full beam, unquantised, whole input),
+        a sample of documents is also decoded with the reference so the latency and
+        agreement of the cheaper setting are logged next to each other
+    '''
+    t5_model, t5_tokenizer = get_resource(
+        't5_int8' if TITLE_QUANTISE else 't5', lambda: load_t5(quantise=TITLE_QUANTISE))
+    title, metrics = title_predictor(
+        text, model=t5_model, tokenizer=t5_tokenizer,
+        preset=TITLE_DECODING_PRESET, max_input_tokens=TITLE_MAX_INPUT_TOKENS)
+    metrics['quantised'] = TITLE_QUANTISE
+
+    is_reference = (TITLE_DECODING_PRESET == REFERENCE_PRESET and not TITLE_QUANTISE
+                    and TITLE_MAX_INPUT_TOKENS is None)
+    if not is_reference and random.random() < TITLE_AGREEMENT_SAMPLE_RATE:
+        reference_model, reference_tokenizer = get_resource('t5', load_t5)
+        reference_title, reference_metrics = title_predictor(
+            text, model=reference_model, tokenizer=reference_tokenizer)
+        metrics['reference_latency_ms'] = reference_metrics['latency_ms']
+        metrics.update(title_agreement(title, reference_title))
+
+    logger.info({'title_generation': metrics})
+    return title
+
+
+def choose_title(title: str,
+                 text: str,
+                 threshold: str) -> str:
     '''
     param: title: Str metadata title extracted from document
     param: text: Str document text
@@ -71,7 +122,7 @@ def get_title(title: str,
 
     # Immediately filter out long metadata titles
     if (len(title.split(' ')) > 40):
-        title = title_predictor(text, model=t5_model, tokenizer=t5_tokenizer)
+        title = predict_title(text)
         return title
 
     else:
@@ -83,17 +134,46 @@ def get_title(title: str,
             re.sub(r'[^\w\s]', ' ', title).split(' '))
 
         if score >= 95 and (length_of_no_punctuation_title <= 2):
-            title = title_predictor(text, model=t5_model, tokenizer=t5_tokenizer)
+            title = predict_title(text)
             return title
 
         elif (score > threshold) and (length_of_no_punctuation_title >= 3):
             return title
 
         else:
-            title = title_predictor(text, model=t5_model, tokenizer=t5_tokenizer)
+            title = predict_title(text)
             return title
 
 
+def get_title(title: str,
+              text: str,
+              threshold: str) -> str:
+    '''
+    param: title: Str metadata title extracted from document
+    param: text: Str document text
+    param: threshold: int similarity score threshold
+    returns: Str title, from the cache when the same metadata title and leading text were
+        seen before, in which case neither the similarity search nor the model is run
+    '''
+    title_cache = get_resource('title_cache', load_title_cache)
+    settings = {
+        'threshold': threshold,
+        'preset': TITLE_DECODING_PRESET,
+        'max_input_tokens': TITLE_MAX_INPUT_TOKENS
+    }
+    model = get_resource('t5_version', lambda: model_version(quantise=TITLE_QUANTISE))
+    key = title_cache_key(title, text, model, settings)
+
+    cached_title = title_cache.get(key)
+    if cached_title is not None:
+        logger.info(f'Title cache hit for {key}')
+        return cached_title
+
+    chosen_title = choose_title(title=title, text=text, threshold=threshold)
+    title_cache.put(key, chosen_title)
+    return chosen_title
+
+
 @logger.inject_lambda_context(log_event=True)
 def handler(event, context: LambdaContext):
     logger.set_correlation_id(context.aws_request_id)
@@ -103,6 +183,8 @@ def handler(event, context: LambdaContext):
 
     title = get_title(title=metadata_title, text=text, threshold=85)
     logger.info(f'Document title is: {title}')
+    logger.info({'resources': resource_stats()})
+    logger.info({'title_cache': get_resource('title_cache', load_title_cache).stats()})
 
     # Needs to also return the text so that the subsequent Keyword Extraction
     # lambda has access to this
@@ -9,8 +9,10 @@ Created on Thu Dec 15 10:15:34 2022
 import json
 import logging
 import os
-from typedb.client import SessionType, TypeDB
 from search_functions import *
+from typedb_connection import get_connection
+from query_templates import latency_histograms, prewarm, timed_match, timed_search
+from word_form_tables import load_tables, word_form_stats
 
 # list of params accepted in a search event
 search_keys = {"id", "keyword", "title", "date_published",
@@ -22,6 +24,11 @@ RET_SIZE = 10
 LOGGER = logging.getLogger()
 LOGGER.setLevel(int(os.environ.get("LOGGING_LEVEL", logging.INFO)))
 
+# Build the query templates of the common search shapes and read the word form tables
+# while the container starts
+prewarm()
+load_tables()
+
 
 ###########################################
 # HELPER FUNCTIONS
@@ -47,9 +54,9 @@ def validate_env_variable(env_var_name):
 def search_module(event, session):
     
         keyset = set(event.keys()) & search_keys
-        page_size = int(event.get('page_size', RET_SIZE))
-        page = int(event.get('page', 0)) * page_size
         order = event.get('order', 'desc')
+        # Search + filters, as opposed to the search by UID and the leg <> reg.doc link search
+        filter_search = not (event.get('id') or event.get('legislation_href'))
 
         if len(keyset) == 0:
             return {
@@ -59,11 +66,31 @@ def search_module(event, session):
 
         else:
             # Build TQL query from search params
-            query = query_builder(event)
+            try:
+                page_size = int(event.get('page_size', RET_SIZE))
+                if filter_search:
+                    page_size = min(page_size, MAX_PAGE_SIZE)
+                page = int(event.get('page', 0)) * page_size
+                if filter_search:
+                    page_shape, page_query, count_shape, count_query = search_queries(
+                        event, offset=page, limit=page_size, asc=order == 'asc')
+                else:
+                    shape, query = query_builder(event)
+            except ValueError as err:
+                LOGGER.info(f"Rejected search parameters: {err}")
+                return {
+                    "status_code": 400,
+                    "status_description": "Bad Request - Invalid search parameter value(s)."
+                }
 
             # Query the graph database for reg. documents
-            ans = matchquery(query, session)
-            num_ret = len(ans)
+            if filter_search:
+                # The database sorts and pages, the total is counted separately
+                ans, num_ret = timed_search(page_shape, page_query, count_shape, count_query, session)
+                ans = page_uids(ans)
+            else:
+                ans = timed_match(shape, query, session)
+                num_ret = len(ans)
 
             LOGGER.info(f"Ret -> {num_ret}")
             if num_ret == 0:
@@ -75,9 +102,9 @@ def search_module(event, session):
                 # search by UID
                 elif event.get('id'):
                     docs = format_doc_results(ans, session, id_search=True)
-                # search + filters
-                else:                    
-                    docs = format_doc_results(ans, session, page=page, page_size=page_size, asc=order=='asc')
+                # search + filters, only the documents of the page are read
+                else:
+                    docs = format_doc_results(ans, session)
 
             LOGGER.info(f"Results: {docs}")
             return {
@@ -97,7 +124,10 @@ def lambda_handler(ev, context):
     TYPEDB_PORT = validate_env_variable('TYPEDB_SERVER_PORT')
     TYPEDB_DATABASE_NAME = validate_env_variable('TYPEDB_DATABASE_NAME')
 
-    client = TypeDB.core_client(TYPEDB_IP + ':' + TYPEDB_PORT)
-    session = client.session(TYPEDB_DATABASE_NAME, SessionType.DATA)
-    result = search_module(event, session)
+    # The client and session are kept open for the next invocations of this container
+    connection = get_connection(TYPEDB_IP + ':' + TYPEDB_PORT, TYPEDB_DATABASE_NAME)
+    result = connection.run(lambda session: search_module(event, session))
+    LOGGER.info(f"TypeDB connection: {connection.stats()}")
+    LOGGER.info(f"Query latency by shape: {latency_histograms()}")
+    LOGGER.info(f"Word forms: {word_form_stats()}")
     return result
@@ -1,8 +1,6 @@
 from typedb.client import TransactionType
 from datetime import datetime
-from pandas import DataFrame
-from word_forms_loc.word_forms_loc import get_word_forms
-from word_forms_loc.lemmatizer import lemmatize
+from word_form_tables import lookup_lemma, lookup_noun
 
 # from word_forms.word_forms import get_word_forms
 # from word_forms.lemmatizer import lemmatize
@@ -11,20 +9,12 @@ import re
 sp_chars = r'"|,|;'
 
 def get_lemma(word):
-    # return word
-    try:
-        return lemmatize(word)
-    except ValueError as err:
-        if 'is not a real word' in err.args[0]:
-            return word
-        else:
-            raise ValueError(err)
+    # Precomputed for the keyword vocabulary, WordNet is only walked for unseen words
+    return lookup_lemma(word)
 
 
 def lemma2noun(lemma):
-    # return lemma
-    nn = list(get_word_forms(lemma).get('n', []))
-    return sorted(nn, key=len)[0] if nn else lemma
+    return lookup_noun(lemma)
 
 
 def clean_text(text):
@@ -48,9 +38,17 @@ def remap(d: dict, mapd: dict): return {
 
 
 def group_attributes(attr):
-    return DataFrame(attr).drop_duplicates().groupby(0)[1].apply(list).apply(
-        lambda x: x[0] if len(x)==1 else x
-        ).to_dict()
+    '''
+    param: attr: list of (attribute name, value) pairs
+    returns: dict of attribute name -> its value, or the list of its distinct values when it
+        has several, with the names in sorted order
+    '''
+    grouped = {}
+    for name, value in attr:
+        # A dict keeps the distinct values in the order they were first seen
+        grouped.setdefault(name, {})[value] = None
+    return {name: next(iter(values)) if len(values) == 1 else list(values)
+            for name, values in sorted(grouped.items())}
 
 
 def getUniqueResult(results):
@@ -60,14 +58,20 @@ def getUniqueResult(results):
 
 
 def group_of_group(results, id='id', grouping='y', attribute='attribute'):
+    '''
+    Groups the answers of each group by a second concept
+    returns: dict of the value of `id` -> list of the grouped attributes of each `grouping`
+        concept, in order of their IIDs
+    '''
     ret = {}
     for res in results:
-        gp1 = res.concept_maps()[0].map()[id].get_value()
         attrs = [i.map() for i in res.concept_maps()]
-        df = DataFrame([(i[grouping].get_iid(),
-                            (i[attribute].get_type().get_label().name(),
-                             i[attribute].get_value())) for i in attrs])
-        ret[gp1] = df.groupby(0)[1].apply(list).apply(group_attributes).to_list()
+        gp1 = attrs[0][id].get_value()
+        grouped = {}
+        for i in attrs:
+            grouped.setdefault(i[grouping].get_iid(), []).append(
+                (i[attribute].get_type().get_label().name(), i[attribute].get_value()))
+        ret[gp1] = [group_attributes(pairs) for _, pairs in sorted(grouped.items())]
     return ret
 
 
@@ -0,0 +1,195 @@
+import time
+import logging
+from bisect import bisect_left
+from datetime import datetime, timezone
+from functools import lru_cache
+from helpers import matchquery
+from typedb.client import TransactionType
+
+LOGGER = logging.getLogger(__name__)
+
+# TypeQL 2 has no bound parameters, so a query is a cached template of its shape
+# (which filters are used, how many keywords) with the values rendered into it as
+# escaped literals. Literal braces of the TypeQL are doubled in the templates.
+NOT_ARCHIVED = 'not {{$x has status "archive";}};'
+
+OR_FILTERS = ('document_type', 'regulator_id', 'status')
+
+REGEX_CLASS_ESCAPED = set('$.|?*+(){}')
+REGEX_BACKSLASH_ESCAPED = set('\\^[]')
+
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+_latencies = {}
+
+
+def typeql_string(value) -> str:
+    '''Quotes a value as a TypeQL string literal, escaping backslashes and double quotes'''
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def regex_literal(value) -> str:
+    '''
+    Escapes a value to match itself in a (Java) regex. Metacharacters become one character
+    classes, e.g. . -> [.], so common values such as URLs need no backslashes in the query
+    '''
+    return ''.join(
+        f'[{c}]' if c in REGEX_CLASS_ESCAPED else f'\\{c}' if c in REGEX_BACKSLASH_ESCAPED else c
+        for c in str(value))
+
+
+def typeql_regex(values) -> str:
+    '''A TypeQL string literal of a regex matching any of the values, each taken literally'''
+    if isinstance(values, str):
+        values = [values]
+    return typeql_string('|'.join(regex_literal(value) for value in values))
+
+
+def typeql_count(value, minimum=0, maximum=None) -> str:
+    '''Renders an offset or limit, raising ValueError when it is not an int within the bounds'''
+    number = int(value)
+    if number < minimum or (maximum is not None and number > maximum):
+        raise ValueError(f'{value} is not between {minimum} and {maximum}')
+    return str(number)
+
+
+def typeql_datetime(value) -> str:
+    '''
+    param: value: ISO 8601 date or datetime, e.g. 2023-01-31 or 2023-01-31T12:00:00Z
+    returns: Str TypeQL datetime literal, in UTC when the value has an offset
+    Raises ValueError for anything else, as datetimes are not quoted
+    '''
+    date = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date.isoformat(timespec='milliseconds' if date.microsecond else 'seconds')
+
+
+def shape_name(shape: tuple) -> str:
+    '''e.g. ('search', ('keyword', 2), 'title') -> search[keyword*2,title]'''
+    kind, *filters = shape
+    if not filters:
+        return kind
+    parts = [f'{f[0]}*{f[1]}' if isinstance(f, tuple) else f for f in filters]
+    return f'{kind}[{",".join(parts)}]'
+
+
+@lru_cache(maxsize=256)
+def template(shape: tuple) -> str:
+    '''
+    param: shape: ('document',), ('legislation',), ('document_attributes',),
+        ('document_legislation',), ('search_page', *filters) or ('search_count', *filters)
+        where a filter is its name or ('keyword', number of keywords)
+    returns: Str query template with a {placeholder} for every value
+    '''
+    kind, *filters = shape
+
+    if kind == 'document':
+        return ('match $x isa regulatoryDocument, has attribute $attribute, has document_uid {id};'
+                + NOT_ARCHIVED + ' group $x;')
+
+    if kind == 'legislation':
+        return ('match $x isa legislation, has URI $id; $id like {hrefs};'
+                ' $regdoc isa regulatoryDocument, has attribute $attribute;'
+                ' not {{$regdoc has status "archive";}};'
+                ' (issuedFor:$x,issued:$regdoc) isa publication; limit 1000; group $x;')
+
+    if kind == 'document_attributes':
+        return ('match $x isa regulatoryDocument, has document_uid $id, has attribute $a;'
+                ' $id like {uids}; group $x;')
+
+    if kind == 'document_legislation':
+        return ('match $x isa regulatoryDocument, has document_uid $id; $id like {uids};'
+                ' $leg isa legislation, has attribute $attribute;'
+                ' (issuedFor:$leg,issued:$x) isa publication; group $x;')
+
+    if kind not in ('search_page', 'search_count'):
+        raise ValueError(f'Unknown query shape {shape}')
+
+    query = 'match $x isa regulatoryDocument, has document_uid $uid, has date_published $dt'
+    constraints = ''
+    for f in filters:
+        if isinstance(f, tuple) and f[0] == 'keyword':
+            query += ''.join(f', has keyword {{keyword_{i}}}' for i in range(f[1]))
+        elif f == 'regulatory_topic':
+            query += ', has regulatory_topic {regulatory_topic}'
+        elif f in OR_FILTERS:
+            query += f', has {f} ${f}'
+            constraints += f'; ${f} like {{{f}}}'
+        elif f == 'start_date':
+            query += ', has date_published >= {start_date}'
+        elif f == 'end_date':
+            query += ', has date_published <= {end_date}'
+        elif f == 'title':
+            query += ', has title $title'
+            constraints += '; $title contains {title}'
+        else:
+            raise ValueError(f'Unknown search filter {f}')
+    query += constraints + ';' + NOT_ARCHIVED
+
+    # Only the requested page is read, in order, and the total comes from a separate count.
+    # A document is sorted by its latest date_published, so it has a single answer and
+    # the offset and limit count documents
+    if kind == 'search_page':
+        return (query + ' not {{$x has date_published $later; $later > $dt;}};'
+                ' get $uid, $dt; sort $dt {order}; offset {offset}; limit {limit};')
+    return query + ' get $uid; count;'
+
+
+def render(shape: tuple, values: dict) -> str:
+    '''Fills the template of a shape with values already rendered as TypeQL literals'''
+    return template(shape).format(**values)
+
+
+def prewarm() -> None:
+    '''Builds the templates of the common shapes, called once when the container starts'''
+    for shape in [('document',), ('legislation',), ('document_attributes',),
+                  ('document_legislation',)]:
+        template(shape)
+
+    for filters in [(), (('keyword', 1),), ('title',), ('regulatory_topic',),
+                    *[(f,) for f in OR_FILTERS]]:
+        template(('search_page', *filters))
+        template(('search_count', *filters))
+
+
+def record_latency(shape: tuple, milliseconds: float) -> None:
+    '''Counts a query duration in the latency histogram of its shape'''
+    counts = _latencies.setdefault(shape_name(shape), [0] * (len(LATENCY_BUCKETS_MS) + 1))
+    counts[bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+
+
+def latency_histograms() -> dict:
+    '''returns: dict of shape name -> {"<=bucket ms": count} for the queries of this container'''
+    labels = [f'<={bucket}ms' for bucket in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+    return {
+        name: {label: count for label, count in zip(labels, counts) if count}
+        for name, counts in _latencies.items()
+    }
+
+
+def timed_search(page_shape: tuple, page_query: str, count_shape: tuple, count_query: str, session):
+    '''
+    Runs the page query of a search and the count of all its results in one read transaction
+    returns: (answers of the page, total number of results)
+    '''
+    with session.transaction(TransactionType.READ) as transaction:
+        start = time.perf_counter()
+        results = list(transaction.query().match(page_query))
+        record_latency(page_shape, (time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        total = transaction.query().match_aggregate(count_query).get().as_int()
+        record_latency(count_shape, (time.perf_counter() - start) * 1000)
+
+    LOGGER.info(f'Search {shape_name(page_shape)}: {len(results)} of {total} results')
+    return results, total
+
+
+def timed_match(shape: tuple, query: str, session, group=True):
+    '''Runs a match query and records its latency under its shape'''
+    start = time.perf_counter()
+    results = matchquery(query, session, group=group)
+    elapsed = (time.perf_counter() - start) * 1000
+    record_latency(shape, elapsed)
+    LOGGER.info(f'Query {shape_name(shape)} took {elapsed:.1f}ms')
+    return results
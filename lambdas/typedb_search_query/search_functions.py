@@ -1,68 +1,111 @@
+import re
 from helpers import *
-from pandas import DataFrame, Timestamp
+from query_templates import (OR_FILTERS, render, timed_match, typeql_count, typeql_datetime,
+                             typeql_regex, typeql_string)
 
 return_vals = ['title', 'summary', 'document_uid', 'regulator_id', "regulatory_topic",
                'document_type', 'keyword', 'uri', 'status', 'language', 'document_format',
                'date_published', 'date_uploaded', 'legislative_origins', 'version']
 leg_vals = ['href', 'title', 'leg_type', 'leg_division']
 
-def query_builder(event):
-    event = {k: clean_text(v) for k, v in event.items()}
-    ### Build TQL query from search params
+# Largest page a search reads, a larger page_size is cut to it so a request never
+# materialises more documents than this
+MAX_PAGE_SIZE = 100
 
+def query_builder(event):
+    '''
+    Build TQL query from search params, for a search the query of its first page
+    returns: (shape, query): the shape of the query, which its template is cached and its
+        latency recorded under, and the query with the values of the event as escaped literals
+    Raises ValueError for a value that cannot be used, e.g. a malformed date
+    '''
     # Document API
     if event.get('id'):
-        query = 'match $x isa regulatoryDocument, has attribute $attribute'
-        query += f', has document_uid "{event["id"].lower()}"'
-        query += ';not {$x has status "archive";};  group $x;'
-        return query
+        shape = ('document',)
+        return shape, render(shape, {'id': typeql_string(event['id'].lower())})
 
     # Related reg docs (links to legislation search)
     elif event.get('legislation_href'):
-        query = 'match $x isa legislation, has URI $id; $id like "'
-        query += '|'.join([leg for leg in event.get('legislation_href', [])])
-        query += '''";  $regdoc isa regulatoryDocument, has attribute $attribute;
-         not {$regdoc has status "archive";};
-            (issuedFor:$x,issued:$regdoc) isa publication; limit 1000;
-            group $x;'''
-        return query
+        shape = ('legislation',)
+        return shape, render(shape, {'hrefs': typeql_regex(event['legislation_href'])})
 
     # Search API
     else:
-        subq = ""
-        query = 'match $x isa regulatoryDocument, has document_uid $uid, has date_published $dt'
-        # simple filters
-        if event.get('regulatory_topic'):
-            query += f', has regulatory_topic "{event["regulatory_topic"]}"'
-
-        # list filters [AND]
-        if event.get('keyword'):
-            query += ''.join(
-                [f', has keyword "{get_lemma(kw.strip().lower())}"' for kw in event['keyword'].split(' ')])
-
-        # list filters [OR]
-        paramOR = {'document_type', 'regulator_id', 'status'}
-        for param in set(event.keys()) & paramOR:
-            query += f', has {param} ${param}'
-            subq += f"; ${param} like \"{'|'.join([i for i in event[param]])}\""
-
-        # compound filters
-        if event.get('date_published'):
-            date = event["date_published"]
-            st = date.get('start_date')
-            ed = date.get('end_date')
-            if st:
-                query += f', has date_published >= {st}'
-            if ed:
-                query += f', has date_published <= {ed}'
-
-        if event.get('title'):
-            query += ', has title $title'
-            subq += f'; $title contains "{event["title"].lower()}"'
-
-        query += subq
-        query += ';not {$x has status "archive";}; get $uid, $dt, $x; limit 10000; group $x;'
-        return query
+        shape, query, _, _ = search_queries(event)
+        return shape, query
+
+
+def search_filters(event):
+    '''
+    returns: (filters, values): the filters of a search, in the order they appear in the
+        query shape, and their values as TypeQL literals
+    '''
+    filters = []
+    values = {}
+
+    # simple filters
+    if event.get('regulatory_topic'):
+        filters.append('regulatory_topic')
+        values['regulatory_topic'] = typeql_string(event['regulatory_topic'])
+
+    # list filters [AND]
+    if event.get('keyword'):
+        keywords = [get_lemma(kw.lower()) for kw in re.split(r'[\s,;"]+', event['keyword']) if kw]
+        filters.append(('keyword', len(keywords)))
+        values.update({f'keyword_{i}': typeql_string(kw) for i, kw in enumerate(keywords)})
+
+    # list filters [OR]
+    for param in OR_FILTERS:
+        if event.get(param):
+            filters.append(param)
+            values[param] = typeql_regex(event[param])
+
+    # compound filters
+    date = event.get('date_published') or {}
+    for bound in ('start_date', 'end_date'):
+        if date.get(bound):
+            filters.append(bound)
+            values[bound] = typeql_datetime(date[bound])
+
+    if event.get('title'):
+        filters.append('title')
+        values['title'] = typeql_string(event['title'].lower())
+
+    return tuple(filters), values
+
+
+def page_uids(ans):
+    '''The UIDs of the answers of a page query, in the order they were sorted in'''
+    return [answer.get('uid').get_value() for answer in ans]
+
+
+def search_queries(event, offset=0, limit=10, asc=False):
+    '''
+    Build the TQL queries of a search, sorted by date_published
+    returns: (page_shape, page_query, count_shape, count_query): the query of the
+        documents from offset to offset + limit and the query of the total count
+    '''
+    filters, values = search_filters(event)
+    page_shape = ('search_page', *filters)
+    count_shape = ('search_count', *filters)
+    page_values = {
+        **values,
+        'order': 'asc' if asc else 'desc',
+        'offset': typeql_count(offset),
+        'limit': typeql_count(limit, minimum=1, maximum=MAX_PAGE_SIZE)
+    }
+    return page_shape, render(page_shape, page_values), count_shape, render(count_shape, values)
+
+
+def stored_keyword_nouns(doc):
+    '''
+    returns: the distinct noun forms of the keywords of a document, stored with them at
+        ingestion, None for a document ingested before they were
+    '''
+    nouns = doc.get('keyword_noun')
+    if nouns is None:
+        return None
+    return list(set(nouns if isinstance(nouns, list) else [nouns]))
 
 
 def search_reg_docs(ans, page_size):
@@ -73,8 +116,10 @@ def search_reg_docs(ans, page_size):
         doc = {'legislation_href': leg}
         data = []
         for rd in regdocs[:page_size]:
-            rd['keyword'] = list(set([lemma2noun(kw)
-                                 for kw in rd.get('keyword', [])]))
+            nouns = stored_keyword_nouns(rd)
+            if nouns is None:
+                nouns = list(set([lemma2noun(kw) for kw in rd.get('keyword', [])]))
+            rd['keyword'] = nouns
             aot = rd.get('assigned_orp_topic')
             if aot:
                 rd['regulatory_topic'] = max(aot, key=lambda x: len(
@@ -85,61 +130,66 @@ def search_reg_docs(ans, page_size):
     return docs
 
 
-def format_doc_results(ans, session, page=0, page_size=10, id_search=False, asc=False):
-    
-    def get_docs_attrs(uid_list):
-        # Query the graph database for document attributes 
-        query = 'match $x isa regulatoryDocument, has document_uid $id, has attribute $a; $id like "'
-        query += '|'.join(uid_list)
-        query += '"; group $x;'
-        ans = matchquery(query, session)
-        res = DataFrame([dict(getUniqueResult(a.concept_maps()))
-                                            for a in ans])
-        return res.sort_values('date_published', ascending=asc)
-
-    def get_docs_legs(uid_list):
-        # Query the graph database for legislative origins
-
-        query = 'match $x isa regulatoryDocument, has document_uid $id; $id like "'
-        query += '|'.join(uid_list)
-        query += '''";  $leg isa legislation, has attribute $attribute;
-            (issuedFor:$leg,issued:$x) isa publication;
-            group $x;'''
-        ans = matchquery(query=query, session=session)
-        legs = DataFrame(
-            group_of_group(
-                ans,
-                grouping='leg').items(),
-            columns=[
-                'document_uid',
-                'legislative_origins'])
-        return legs
-    
-    res = DataFrame([dict(getUniqueResult(a.concept_maps()))
-                        for a in ans])
-    if not id_search: 
-        res = res.dropna(subset=['document_uid']).sort_values('date_published', ascending=asc)
-        res = res.iloc[page:page + page_size]
-        res = get_docs_attrs(res.document_uid)        
-    
-    legs = get_docs_legs(res.document_uid.tolist())
-
-    # Merging leg.orgs info with reg document
-    df = res.merge(legs, on='document_uid', how='left')
+def format_document(doc, legislative_origins):
+    '''
+    param: doc: grouped attributes of a regulatory document
+    param: legislative_origins: grouped attributes of each legislation it was issued for
+    returns: the document as it is returned by the search API
+    '''
+    doc = dict(doc)
     legmap = {'leg_type': 'type', 'leg_division': 'division'}
-    df.legislative_origins = df.legislative_origins.fillna("").apply(list).apply(lambda x: list(
-        filter(None, [remap(get_select_dict(a, leg_vals), legmap) for a in x])))
+    doc['legislative_origins'] = list(filter(
+        None, [remap(get_select_dict(a, leg_vals), legmap) for a in legislative_origins]))
 
     # get noun for keywords
-    df.keyword = df.keyword.apply(lambda x: list(
-        set([lemma2noun(kw) for kw in x]) if type(x)==list else []))
+    keywords = doc.get('keyword')
+    nouns = stored_keyword_nouns(doc)
+    if nouns is None:
+        nouns = list(set([lemma2noun(kw) for kw in keywords])) if isinstance(keywords, list) else []
+    doc['keyword'] = nouns
 
     # get assigned topic
-    if 'assigned_orp_topic' in df.columns:
-        df.regulatory_topic = df.assigned_orp_topic.apply(lambda aot: max(
-            aot, key=lambda x: len(x.split('/'))) if isinstance(aot, list) else aot)
+    aot = doc.get('assigned_orp_topic')
+    if aot is not None:
+        doc['regulatory_topic'] = max(
+            aot, key=lambda x: len(x.split('/'))) if isinstance(aot, list) else aot
+
+    return get_select_dict(doc, return_vals)
 
-    df = df.applymap(lambda x: format_datetime(x) if isinstance(x, Timestamp) else x)
-    return df.fillna('').apply(
-        lambda x: get_select_dict(x, return_vals), axis=1).tolist()
 
+def format_doc_results(ans, session, id_search=False):
+    '''
+    param: ans: grouped answers of a search by UID, otherwise the UIDs of the
+        documents of the requested page, in the order they are returned in
+    returns: list of the documents with their attributes and legislative origins
+    '''
+
+    def get_docs_attrs(uid_list):
+        # Query the graph database for document attributes, of the page only
+        shape = ('document_attributes',)
+        query = render(shape, {'uids': typeql_regex(uid_list)})
+        ans = timed_match(shape, query, session)
+        docs = [getUniqueResult(a.concept_maps()) for a in ans]
+        # Keep the order of the page, which the database sorted
+        position = {uid: i for i, uid in enumerate(uid_list)}
+        docs = [doc for doc in docs if doc.get('document_uid') in position]
+        return sorted(docs, key=lambda doc: position[doc['document_uid']])
+
+    def get_docs_legs(uid_list):
+        # Query the graph database for legislative origins
+        shape = ('document_legislation',)
+        query = render(shape, {'uids': typeql_regex(uid_list)})
+        ans = timed_match(shape, query, session)
+        return group_of_group(ans, grouping='leg')
+
+    if id_search:
+        docs = [getUniqueResult(a.concept_maps()) for a in ans]
+    elif not ans:
+        return []
+    else:
+        docs = get_docs_attrs(list(ans))
+
+    legs = get_docs_legs([doc.get('document_uid') for doc in docs])
+
+    # Merging leg.orgs info with reg document
+    return [format_document(doc, legs.get(doc.get('document_uid'), [])) for doc in docs]
@@ -0,0 +1,100 @@
+"""
+Tokens per second of the trimmed spaCy pipeline profiles against the full pipelines
+the enrichment lambdas used to load, run over the same input text.
+
+Usage (from the root of the repo, with en_core_web_sm and en_core_web_lg installed):
+    python misc/benchmarks/nlp_profiles_benchmark.py [text file]
+
+Without a file a deterministic synthetic regulatory document is used.
+Profiles whose model is not installed are skipped.
+"""
+import os
+import sys
+import time
+import random
+
+import spacy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
+from nlp_profiles import PROFILES, build_profile  # noqa: E402
+
+
+def legacy_sentences_pipeline():
+    '''The pipeline previously loaded by legislative_origin_extraction.NLPsetup'''
+    nlp = spacy.load(
+        "en_core_web_sm",
+        exclude=['tok2vec', 'senter', 'attribute_ruler', 'lemmatizer', 'ner'])
+    nlp.add_pipe('custom_sentencizer', before="parser")
+    return nlp
+
+
+# Profile -> pipeline it replaces
+BASELINES = {
+    'tokenizer': lambda: spacy.load('en_core_web_sm'),
+    'sentences': legacy_sentences_pipeline,
+    'vectors': lambda: spacy.load('en_core_web_lg'),
+}
+
+
+def synthetic_text(num_paragraphs=200, seed=0):
+    '''Guidance-like prose with dates, years and references to legislation'''
+    rng = random.Random(seed)
+    words = ('the operator must ensure that a risk assessment is carried out before '
+             'work starts and reviewed when the permit holder changes the activity').split()
+    extras = ['on 12 March 2019', 'under the Health and Safety at Work etc. Act 1974',
+              'by 01/04/2021', 'in accordance with the Environmental Permitting Regulations 2016',
+              'from 3 Jan 2020']
+    paragraphs = []
+    for _ in range(num_paragraphs):
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            sentence = ' '.join(rng.choice(words) for _ in range(rng.randint(8, 20)))
+            sentences.append(f'{sentence.capitalize()} {rng.choice(extras)}.')
+        paragraphs.append(' '.join(sentences))
+    return '\n\n'.join(paragraphs)
+
+
+def tokens_per_second(nlp, text, repeats=3):
+    '''Best of `repeats` runs over the whole text'''
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        doc = nlp(text)
+        best = min(best, time.perf_counter() - start)
+    return len(doc) / best, doc
+
+
+def load_timed(loader):
+    start = time.perf_counter()
+    nlp = loader()
+    return nlp, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = synthetic_text()
+    print(f'Input: {len(text)} characters')
+
+    for name, profile in PROFILES.items():
+        if not spacy.util.is_package(profile['model']):
+            print(f'{name:>10}: skipped, {profile["model"]} is not installed')
+            continue
+
+        baseline, baseline_load = load_timed(BASELINES[name])
+        trimmed, trimmed_load = load_timed(lambda: build_profile(name))
+        for nlp in (baseline, trimmed):
+            nlp.max_length = max(nlp.max_length, len(text) + 1)
+
+        baseline_rate, baseline_doc = tokens_per_second(baseline, text)
+        trimmed_rate, trimmed_doc = tokens_per_second(trimmed, text)
+
+        print(f'{name:>10}: {profile["model"]} {trimmed.pipe_names}')
+        print(f'{"":>10}  baseline {baseline_rate:12,.0f} tokens/s, loaded in {baseline_load:.2f}s {baseline.pipe_names}')
+        print(f'{"":>10}  profile  {trimmed_rate:12,.0f} tokens/s, loaded in {trimmed_load:.2f}s '
+              f'({trimmed_rate / baseline_rate:.1f}x)')
+        if name == 'sentences':
+            same = [s.start for s in baseline_doc.sents] == [s.start for s in trimmed_doc.sents]
+            print(f'{"":>10}  identical sentence boundaries: {same}')
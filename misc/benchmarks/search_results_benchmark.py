@@ -0,0 +1,237 @@
+"""
+CPU time of assembling a page of search results with the dict based assembler against the
+pandas DataFrame version it replaced, and the import time pandas added to a cold start.
+
+Usage (from the root of the repo, with the requirements of lambdas/typedb_search_query installed,
+and pandas for the previous version):
+    python misc/benchmarks/search_results_benchmark.py [page size] [requests]
+
+The database is replaced by synthetic grouped answers, so only the assembly is measured. Both
+versions are checked to return the same JSON first. Keywords are not lemmatised here, as the
+same lookup is done by both.
+"""
+import os
+import sys
+import json
+import time
+import random
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lambdas', 'typedb_search_query')
+sys.path.insert(0, LAMBDA_DIR)
+import search_functions  # noqa: E402
+from helpers import format_datetime, get_select_dict, remap  # noqa: E402
+from search_functions import format_doc_results, leg_vals, return_vals  # noqa: E402
+
+
+class Label:
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+
+class Type:
+    def __init__(self, name):
+        self.label = Label(name)
+
+    def get_label(self):
+        return self.label
+
+
+class Concept:
+    def __init__(self, iid, name=None, value=None):
+        self.iid = iid
+        self.type = Type(name)
+        self.value = value
+
+    def is_attribute(self):
+        return self.type.label.name() is not None
+
+    def get_iid(self):
+        return self.iid
+
+    def get_type(self):
+        return self.type
+
+    def get_value(self):
+        return self.value
+
+
+class ConceptMap:
+    def __init__(self, concepts):
+        self._map = concepts
+
+    def map(self):
+        return self._map
+
+    def get(self, variable):
+        return self._map[variable]
+
+    def concepts(self):
+        return self._map.values()
+
+
+class ConceptMapGroup:
+    def __init__(self, maps):
+        self.maps = maps
+
+    def concept_maps(self):
+        return self.maps
+
+
+def synthetic_page(page_size, seed=0):
+    '''returns: the answers of the document_attributes and document_legislation queries of a page'''
+    rng = random.Random(seed)
+    words = ['waste', 'water', 'energy', 'safety', 'food', 'transport', 'finance', 'health']
+    attributes, legislation = [], []
+    for d in range(page_size):
+        document = Concept(f'0x{d:04x}')
+        uid = Concept(f'0xa{d:04x}', 'document_uid', f'doc{d:05d}')
+        published = datetime(2020, 1, 1) + timedelta(days=rng.randrange(1000))
+        values = [
+            ('title', f'Guidance on {rng.choice(words)} number {d}'),
+            ('summary', ' '.join(rng.choices(words, k=60))),
+            ('regulator_id', rng.choice(['hse', 'ea', 'fsa'])),
+            ('regulatory_topic', f'/{rng.choice(words)}'),
+            ('document_type', 'GD'),
+            ('uri', f'https://example.org/{d}.pdf'),
+            ('status', 'published'),
+            ('language', 'en'),
+            ('document_format', 'application/pdf'),
+            ('date_published', published),
+            ('date_uploaded', published + timedelta(days=3)),
+            ('version', rng.randrange(1, 4)),
+        ]
+        # One document has a single keyword, the rest several
+        values += [('keyword', kw) for kw in rng.sample(words, 1 if d == 1 else rng.randrange(2, 6))]
+        topics = [f'/{rng.choice(words)}' + '/sub' * i for i in range(rng.randrange(1, 3))]
+        values += [('assigned_orp_topic', topic) for topic in topics]
+
+        maps = []
+        for i, (name, value) in enumerate(values):
+            # The uid is an attribute of every answer, as it is matched in the query
+            maps.append(ConceptMap({'x': document, 'id': uid, 'a': Concept(f'0xb{d:04x}{i:02x}', name, value)}))
+        attributes.append(ConceptMapGroup(maps))
+
+        maps = []
+        for leg in range(d % 3):
+            entity = Concept(f'0xc{d:04x}{leg:02x}')
+            for name, value in [('href', f'https://www.legislation.gov.uk/ukpga/2020/{d}/{leg}'),
+                                ('title', f'Act {d} {leg}'), ('leg_type', 'primary'),
+                                ('leg_division', 'UK')]:
+                maps.append(ConceptMap({'x': document, 'id': uid, 'leg': entity,
+                                        'attribute': Concept(f'0xd{d:04x}{leg:02x}', name, value)}))
+        if maps:
+            legislation.append(ConceptMapGroup(maps))
+    return attributes, legislation
+
+
+def legacy_format_doc_results(ans, session, match, id_search=False):
+    '''The pandas version of search_functions.format_doc_results'''
+    from pandas import DataFrame, Timestamp
+
+    def group_attributes(attr):
+        return DataFrame(attr).drop_duplicates().groupby(0)[1].apply(list).apply(
+            lambda x: x[0] if len(x) == 1 else x
+            ).to_dict()
+
+    def getUniqueResult(results):
+        res = [(i.get_type().get_label().name(), i.get_value())
+               for a in results for i in a.concepts() if i.is_attribute()]
+        return group_attributes(res)
+
+    def group_of_group(results, id='id', grouping='y', attribute='attribute'):
+        ret = {}
+        for res in results:
+            gp1 = res.concept_maps()[0].map()[id].get_value()
+            attrs = [i.map() for i in res.concept_maps()]
+            df = DataFrame([(i[grouping].get_iid(),
+                             (i[attribute].get_type().get_label().name(),
+                              i[attribute].get_value())) for i in attrs])
+            ret[gp1] = df.groupby(0)[1].apply(list).apply(group_attributes).to_list()
+        return ret
+
+    def get_docs_attrs(uid_list):
+        res = DataFrame([dict(getUniqueResult(a.concept_maps()))
+                         for a in match(('document_attributes',), None, session)])
+        position = {uid: i for i, uid in enumerate(uid_list)}
+        return res.sort_values('document_uid', key=lambda uids: uids.map(position))
+
+    def get_docs_legs(uid_list):
+        return DataFrame(
+            group_of_group(match(('document_legislation',), None, session), grouping='leg').items(),
+            columns=['document_uid', 'legislative_origins'])
+
+    res = get_docs_attrs(list(ans))
+    legs = get_docs_legs(res.document_uid.tolist())
+
+    df = res.merge(legs, on='document_uid', how='left')
+    legmap = {'leg_type': 'type', 'leg_division': 'division'}
+    df.legislative_origins = df.legislative_origins.fillna("").apply(list).apply(lambda x: list(
+        filter(None, [remap(get_select_dict(a, leg_vals), legmap) for a in x])))
+
+    df.keyword = df.keyword.apply(lambda x: list(
+        set([search_functions.lemma2noun(kw) for kw in x]) if type(x) == list else []))
+
+    if 'assigned_orp_topic' in df.columns:
+        df.regulatory_topic = df.assigned_orp_topic.apply(lambda aot: max(
+            aot, key=lambda x: len(x.split('/'))) if isinstance(aot, list) else aot)
+
+    # applymap, as pinned (pandas 2.0), is called map from pandas 2.1
+    elementwise = df.map if hasattr(df, 'map') else df.applymap
+    df = elementwise(lambda x: format_datetime(x) if isinstance(x, Timestamp) else x)
+    return df.fillna('').apply(
+        lambda x: get_select_dict(x, return_vals), axis=1).tolist()
+
+
+def cpu_ms(function, requests):
+    times = []
+    for _ in range(requests):
+        start = time.process_time()
+        function()
+        times.append((time.process_time() - start) * 1000)
+    return statistics.median(times), max(times)
+
+
+def import_ms(statement, runs=5):
+    '''Fastest wall time of a fresh interpreter running the import, less an empty interpreter'''
+    def run(code):
+        best = None
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=LAMBDA_DIR, check=True)
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+    return run(statement) - run('pass')
+
+
+if __name__ == '__main__':
+    page_size = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    attributes, legislation = synthetic_page(page_size)
+    page = [f'doc{d:05d}' for d in range(page_size)]
+
+    def match(shape, query, session, group=True):
+        return attributes if shape == ('document_attributes',) else legislation
+
+    search_functions.timed_match = match
+    search_functions.lemma2noun = lambda lemma: lemma
+
+    current = format_doc_results(page, None)
+    legacy = legacy_format_doc_results(page, None, match)
+    same = json.dumps(current, sort_keys=True) == json.dumps(legacy, sort_keys=True)
+    print(f'Page of {page_size} documents, identical JSON: {same}')
+
+    for name, function in [('pandas', lambda: legacy_format_doc_results(page, None, match)),
+                           ('dicts', lambda: format_doc_results(page, None))]:
+        median, worst = cpu_ms(function, requests)
+        print(f'{name:>8}: median {median:7.2f} ms CPU per request, max {worst:7.2f} ms')
+
+    print(f'import pandas: {import_ms("import pandas"):7.0f} ms')
+    print(f'import search_functions: {import_ms("import search_functions"):7.0f} ms')
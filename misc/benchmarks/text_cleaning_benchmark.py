@@ -0,0 +1,113 @@
+"""
+Throughput benchmark of the shared converter text cleaner against the implementation
+previously copy-pasted into the pdf/docx/odf converters.
+
+Usage (from the root of the repo):
+    python misc/benchmarks/text_cleaning_benchmark.py [directory of .txt sample pages]
+
+Without a directory a deterministic synthetic corpus of regulator-style pages is used.
+"""
+import os
+import re
+import sys
+import time
+import random
+import string
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
+from text_cleaning import clean_text  # noqa: E402
+
+LEGACY_ILLEGAL_CHARACTERS_RE = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+
+
+def legacy_remove_excess_punctuation(text: str) -> str:
+    text = text.replace(' .', '')
+    for punc in string.punctuation:
+        text = text.replace(punc + punc, '')
+    return text
+
+
+def legacy_clean_text(text: str) -> str:
+    pattern = re.compile(r'\s+')
+
+    text = str(text).replace('\n', ' ')
+    text = text.replace(' .', '. ')
+    text = re.sub('(\\d+(\\.\\d+)?)', r' \1 .', text)
+    text = re.sub(pattern, ' ', text)
+    text = legacy_remove_excess_punctuation(text=text)
+    text = re.sub(LEGACY_ILLEGAL_CHARACTERS_RE, ' ', text)
+    text = re.sub(
+        r'([a-z](?=[A-Z])|[A-Z](?=[A-Z][a-z]))',
+        r'\1 ',
+        text
+    )
+    text = text.strip()
+    text = text.replace('\t', ' ')
+    text = text.replace('_x000c_', '')
+    text = text.encode('ascii', 'ignore').decode('utf-8')
+    text = re.sub('\\s+', ' ', text)
+    text = re.sub('<.*?>', '', text)
+    text = re.sub('\\.{4,}', '.', text)
+    return text
+
+
+def synthetic_pages(num_pages=400, seed=0):
+    '''Pages of guidance-like prose with numbering, dotted leaders, typography and merged words'''
+    rng = random.Random(seed)
+    words = ('health safety executive regulation guidance operator must ensure that the '
+             'assessment risk control measures workplace employer duty section schedule '
+             'environment permit licence holder compliance inspection').split()
+    pages = []
+    for page_number in range(num_pages):
+        lines = []
+        for line_number in range(45):
+            sentence = ' '.join(rng.choice(words) for _ in range(rng.randint(6, 16)))
+            extras = [f' {page_number}.{line_number}', ' ....... 12', ' ’s', ' ResponsibleOperator',
+                      ' (see  section 3)', '!!', '\t', ' – ']
+            lines.append(sentence.capitalize() + rng.choice(extras) + '.')
+        pages.append('\n'.join(lines))
+    return pages
+
+
+# Punctuation that only cancels out when the pairs are removed in the order of
+# string.punctuation, and control characters, which a single regex pass or a translate
+# table applied at the wrong step would clean differently
+EDGE_CASES = [
+    'foo ;--; bar', 'see (()) above', 'a ..,, b', 'x !??! y', 'Section 1.2 -- ;; applies',
+    'one\x01two\x0bthree\x1f four', 'tab\tand\x0cform feed .', 'dotted ....... 12 leaders',
+]
+
+
+def load_pages(directory):
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.txt'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                pages.append(f.read())
+    return pages
+
+
+def throughput(cleaner, pages, repeats=3):
+    '''Best of `repeats` runs, in MB of input per second'''
+    size_mb = sum(len(page.encode('utf-8')) for page in pages) / 1e6
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for page in pages:
+            cleaner(page)
+        best = min(best, time.perf_counter() - start)
+    return size_mb / best
+
+
+if __name__ == '__main__':
+    pages = (load_pages(sys.argv[1]) if len(sys.argv) > 1 else synthetic_pages()) + EDGE_CASES
+    size_mb = sum(len(page.encode('utf-8')) for page in pages) / 1e6
+
+    legacy = throughput(legacy_clean_text, pages)
+    shared = throughput(clean_text, pages)
+    agreement = sum(legacy_clean_text(page) == clean_text(page) for page in pages) / len(pages)
+
+    print(f'Corpus: {len(pages)} pages, {size_mb:.2f} MB')
+    print(f'Legacy clean_text: {legacy:8.2f} MB/s')
+    print(f'Shared clean_text: {shared:8.2f} MB/s ({shared / legacy:.2f}x)')
+    print(f'Identical output:  {agreement:8.2%} of pages')
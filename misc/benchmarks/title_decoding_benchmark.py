@@ -0,0 +1,77 @@
+"""
+Latency and agreement of the T5 title decoding settings against the reference setting
+(full beam search, unquantised model, the tokenizer's whole input), to choose a cheaper
+operating point for TITLE_DECODING_PRESET, TITLE_MAX_INPUT_TOKENS and TITLE_QUANTISE.
+
+Usage (from the root of the repo, after lambdas/title_generation/local_download.py has
+saved the model to lambdas/title_generation/LLM):
+    python misc/benchmarks/title_decoding_benchmark.py <directory of .txt documents> [budget ...]
+
+Every preset is run with and without int8 quantisation, once per input token budget
+(default: the tokenizer's limit and 256).
+"""
+import os
+import sys
+import statistics
+
+import nltk
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lambdas', 'title_generation')
+sys.path.insert(0, LAMBDA_DIR)
+# The model paths and the regulator name list are relative to the lambda
+os.chdir(LAMBDA_DIR)
+from title_engine import DECODING_PRESETS, REFERENCE_PRESET, generate_title, leading_text, load_t5, title_agreement  # noqa: E402
+from preprocess.preprocess_functions import preprocess  # noqa: E402
+from postprocess.postprocess_functions import postprocess_title  # noqa: E402
+
+
+def predict(text, model, tokenizer, preset, max_input_tokens):
+    '''Same steps as title_generation.title_predictor'''
+    text = preprocess(leading_text(text, tokenizer, max_input_tokens))
+    decoded, metrics = generate_title(text, model, tokenizer, preset, max_input_tokens)
+    return postprocess_title(nltk.sent_tokenize(decoded.strip())[0]), metrics
+
+
+def load_documents(directory):
+    documents = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.txt'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                documents.append(f.read())
+    return documents
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+if __name__ == '__main__':
+    documents = load_documents(sys.argv[1])
+    budgets = [int(budget) for budget in sys.argv[2:]] or [None, 256]
+    nltk.download('punkt', quiet=True)
+    nltk.download('stopwords', quiet=True)
+
+    models = {False: load_t5(), True: load_t5(quantise=True)}
+    reference_model, tokenizer = models[False]
+    references = [predict(document, reference_model, tokenizer, REFERENCE_PRESET, None)
+                  for document in documents]
+    reference_latency = statistics.mean(metrics['latency_ms'] for _, metrics in references)
+    print(f'Documents: {len(documents)}, reference mean latency {reference_latency:.0f} ms')
+
+    print(f'{"preset":>11} {"int8":>5} {"budget":>6} {"mean ms":>8} {"p95 ms":>8} '
+          f'{"speed-up":>8} {"exact":>6} {"overlap":>7}')
+    for preset in DECODING_PRESETS:
+        for quantise, (model, tokenizer) in models.items():
+            for budget in budgets:
+                latencies, exact, overlap = [], [], []
+                for document, (reference_title, _) in zip(documents, references):
+                    title, metrics = predict(document, model, tokenizer, preset, budget)
+                    agreement = title_agreement(title, reference_title)
+                    latencies.append(metrics['latency_ms'])
+                    exact.append(agreement['exact_match'])
+                    overlap.append(agreement['word_overlap'])
+                mean = statistics.mean(latencies)
+                print(f'{preset:>11} {str(quantise):>5} {str(budget or "-"):>6} {mean:8.0f} '
+                      f'{percentile(latencies, 0.95):8.0f} {reference_latency / mean:7.2f}x '
+                      f'{statistics.mean(exact):6.0%} {statistics.mean(overlap):7.2f}')
@@ -0,0 +1,103 @@
+"""
+Migrates an existing database to store the noun form of each keyword (keyword_noun)
+
+    1. defines schema/migrations/001_keyword_noun.tql, which is idempotent
+    2. adds the noun forms of their keywords to the documents that have none
+    3. writes the keywords in the graph to the vocabulary file the search image
+       builds its word form tables from
+
+Usage (with word_forms_loc, from the lambdas' word_forms_loc.tar.gz, and NLTK's WordNet installed):
+    python migrate_keyword_noun.py [-a host] [-p port] [-d database]
+        [-o ../../../lambdas/typedb_search_query/keyword_vocabulary.txt]
+
+Documents ingested after the stream ingester started storing keyword_noun are left as they are.
+"""
+import os
+import sys
+import argparse
+from collections import defaultdict
+from typedb.client import SessionType, TransactionType, TypeDB
+from vars_orp_pbeta import DB_IP, DB_NAME, logger
+
+# Copy shared/word_form_tables.py next to this script to run it outside a checkout of the repo
+try:
+    from word_form_tables import compute_noun
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'shared'))
+    from word_form_tables import compute_noun
+
+MIGRATION_TQL = "schema/migrations/001_keyword_noun.tql"
+VOCABULARY_PATH = "../../../lambdas/typedb_search_query/keyword_vocabulary.txt"
+VOCABULARY_HEADER = """# Keywords in the graph, one per line, which the word form tables are built for at image build.
+# Regenerate before a release with misc/bulk_enrichment/bulk_migration/migrate_keyword_noun.py
+# Words that are not listed are looked up in WordNet on first use. The image is not built
+# while this lists no words.
+"""
+
+
+def migration_parser():
+    parser = argparse.ArgumentParser(description="Add keyword_noun to an existing database.")
+    parser.add_argument("-a", "--host", help=f"Server host address (default: {DB_IP})", default=DB_IP)
+    parser.add_argument("-p", "--port", help="Server port (default: 1729)", default="1729")
+    parser.add_argument("-d", "--database", help=f"Database name (default: {DB_NAME})", default=DB_NAME)
+    parser.add_argument("-c", "--batch_size", type=int,
+                        help="Documents updated per commit (default: 100)", default=100)
+    parser.add_argument("-o", "--output", help=f"Vocabulary file (default: {VOCABULARY_PATH})",
+                        default=VOCABULARY_PATH)
+    return parser
+
+
+def typeql_string(value):
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def documents_without_nouns(session):
+    '''returns: {document_uid: [keyword]} of the documents with keywords and no keyword_noun'''
+    query = ('match $x isa regulatoryDocument, has document_uid $id, has keyword $k;'
+             ' not {$x has keyword_noun $n;}; get $id, $k;')
+    keywords = defaultdict(list)
+    with session.transaction(TransactionType.READ) as transaction:
+        for answer in transaction.query().match(query):
+            keywords[answer.get('id').get_value()].append(answer.get('k').get_value())
+    return keywords
+
+
+def keyword_vocabulary(session):
+    '''returns: the sorted keywords of the graph'''
+    with session.transaction(TransactionType.READ) as transaction:
+        return sorted({answer.get('k').get_value()
+                       for answer in transaction.query().match('match $k isa keyword; get $k;')})
+
+
+def insert_nouns(session, keywords, batch_size):
+    uids = sorted(keywords)
+    for start in range(0, len(uids), batch_size):
+        with session.transaction(TransactionType.WRITE) as transaction:
+            for uid in uids[start: start + batch_size]:
+                nouns = sorted({compute_noun(keyword) for keyword in keywords[uid]})
+                transaction.query().insert(
+                    f'match $x isa regulatoryDocument, has document_uid {typeql_string(uid)};'
+                    ' insert $x ' + ', '.join(f'has keyword_noun {typeql_string(n)}' for n in nouns) + ';')
+            transaction.commit()
+        logger.info(f"Added keyword nouns to {min(start + batch_size, len(uids))}/{len(uids)} documents")
+
+
+if __name__ == "__main__":
+    args = migration_parser().parse_args()
+
+    with TypeDB.core_client(address=f"{args.host}:{args.port}") as client:
+        logger.info(f"Defining [{MIGRATION_TQL}]")
+        with client.session(args.database, SessionType.SCHEMA) as session:
+            with session.transaction(TransactionType.WRITE) as transaction:
+                transaction.query().define(open(MIGRATION_TQL, "r").read())
+                transaction.commit()
+
+        with client.session(args.database, SessionType.DATA) as session:
+            keywords = documents_without_nouns(session)
+            logger.info(f"Documents without keyword nouns: {len(keywords)}")
+            insert_nouns(session, keywords, args.batch_size)
+
+            vocabulary = keyword_vocabulary(session)
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(VOCABULARY_HEADER + "".join(f"{keyword}\n" for keyword in vocabulary))
+            logger.info(f"Wrote {len(vocabulary)} keywords to {args.output}")
@@ -3,11 +3,17 @@ import io
 import torch
 from langdetect import detect
 from smart_open import open
-from summarisation.utils import smart_postprocessor, smart_shortener
+from summarisation.utils import smart_postprocessor, smart_shortener, length_sorted_batches
 
 
 from pyspark import SparkFiles
 MODEL_PATH=  SparkFiles.get('resources')
+BATCH_SIZE = 8
+
+# Loaded once per Python worker rather than once per row
+_summarizer = None
+
+
 def download_model( model_path,
         key='summ.pt'):
     '''Downloads the ML model for summarisation'''
@@ -20,6 +26,14 @@ def download_model( model_path,
         return summarizer
 
 
+def get_summarizer():
+    '''Returns the summarisation model, loading it on first use'''
+    global _summarizer
+    if _summarizer is None:
+        _summarizer = download_model(MODEL_PATH)
+    return _summarizer
+
+
 def detect_language(text):
     """
     Detect language
@@ -33,7 +47,7 @@ def detect_language(text):
 def summarizer(text):
 
 
-    summarizer= download_model(MODEL_PATH)
+    summarizer = get_summarizer()
 
 
     # Detect language
@@ -43,4 +57,24 @@ def summarizer(text):
     summary = smart_postprocessor(
                     summarizer(text))
     summary = summary[0]['summary_text']
-    return summary, lang
\ No newline at end of file
+    return summary, lang
+
+
+def batch_summarizer(texts, batch_size=BATCH_SIZE):
+    """
+    Summarise many documents in padded mini-batches of similar token length
+    param: texts: List of Str
+    param: batch_size: Int number of documents per batch
+        returns: List of (summary, lang) tuples in the same order as texts
+    """
+    summarizer = get_summarizer()
+    lengths = [len(ids) for ids in summarizer.tokenizer(
+        texts, truncation=True)['input_ids']]
+
+    results = [None] * len(texts)
+    for batch in length_sorted_batches(lengths, batch_size):
+        outputs = summarizer([texts[i] for i in batch], batch_size=len(batch))
+        for i, output in zip(batch, outputs):
+            results[i] = (smart_postprocessor(output['summary_text']),
+                          detect_language(text=texts[i]))
+    return results
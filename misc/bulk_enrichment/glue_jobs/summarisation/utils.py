@@ -26,4 +26,15 @@ def smart_postprocessor(sentence):
             shortened_complete = shortened + end_sentence[:res[0] - 1] + '.'
             return shortened_complete
         else:
-            return shortened_complete
\ No newline at end of file
+            return shortened_complete
+
+
+def length_sorted_batches(lengths, batch_size):
+    '''
+    params: lengths: List of token lengths, one per document
+    params: batch_size: Int maximum number of documents per batch
+    returns: batches: List of lists of document indices
+        Documents of similar length are grouped so each padded batch wastes little compute
+    '''
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[i: i + batch_size] for i in range(0, len(order), batch_size)]
@@ -1,6 +1,8 @@
 import kshingle as ks
 from nltk.tokenize import word_tokenize
 from datasketch import MinHash, MinHashLSH
+# shared/hash_signature.py, shipped to the job with --extra-py-files
+from hash_signature import encode_signature
 
 
 lsh = MinHashLSH()
@@ -26,11 +28,11 @@ def getHash(doc, k=5):
 
     return hash.hashvalues
 
+
 def create_hash(text):
     """
     param: text: Str
-    returns: hash_list: list of hashes
+    returns: hash_text: Str encoded hash
     """
     hash_np = getHash(text)
-    hash_list = hash_np.tolist()
-    return '_'.join(map(str, hash_list))
\ No newline at end of file
+    return encode_signature(hash_np)
\ No newline at end of file
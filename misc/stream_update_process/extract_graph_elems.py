@@ -23,6 +23,8 @@ def extractElements(js: dict, dict_thing_attrs: dict):
     doc = flatten(js)
     doc = key_remapper(doc, colmap)
     doc['keyword'] = js.get('subject_keywords', [])
+    # noun forms of the keywords, displayed by the search instead of the keywords
+    doc['keyword_noun'] = js.get('subject_keyword_nouns', [])
     reg_topic = js.get('regulatory_topic', [])
     doc['regulatory_topic'] = reg_topic
     if reg_topic:
@@ -0,0 +1,17 @@
+#! /bin/bash
+# Run script from the root directory of the repo
+# Builds the deployment zip of the stream updater, with the shared modules it imports
+# Usage:
+# sh misc/stream_update_process/package.sh [zip name]
+
+
+output="${1:-stream_update_process.zip}"
+build=$(mktemp -d)
+
+
+cp -r misc/stream_update_process/. $build
+cp shared/hash_signature.py $build
+find $build -name __pycache__ -prune -exec rm -rf {} +
+rm -f $build/package.sh
+python -m zipfile -c $output $build/*
+rm -rf $build
@@ -5,11 +5,13 @@ Created on Wed Aug 24 15:33:34 2022
 @author: imane.hafnaoui
 """
 from utils.tdb_query_helpers import *
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from utils.functions import decode_signature, signature_similarity
 
 
-CHANGES_THRESHOLD = 0.995
+# MinHash estimate of the Jaccard similarity below which a changed document becomes a new
+# version, the same cutoff check_duplicate treats an upload as a version of a document by.
+# With 256 slots the estimate of a trivial edit (J ~0.99) stays well clear of it
+CHANGES_THRESHOLD = 0.95
 # =====
 
 
@@ -26,10 +28,10 @@ def changedAttrs(old: dict, new: dict, attr_type_dict):
 
 
 def sim_hash(in_attr, db_attr):
-    if in_attr.get('hash_text'):
-        in_hash = np.array(in_attr['hash_text'].split('_')).reshape(1, -1)
-        db_hash = np.array(db_attr['hash_text'].split('_')).reshape(1, -1)
-        return cosine_similarity(in_hash, db_hash)
+    '''The MinHash estimate of the Jaccard similarity of the texts, 0 without both hashes'''
+    if in_attr.get('hash_text') and db_attr.get('hash_text'):
+        return signature_similarity(decode_signature(in_attr['hash_text']),
+                                    decode_signature(db_attr['hash_text']))
     else:
         return 0
 
@@ -1,5 +1,15 @@
-from hashlib import shake_256
+import os
 import re
+import sys
+from hashlib import shake_256
+
+# The signature encoding is shared with check_duplicate and the Glue hashing job. package.sh
+# copies it into the deployment zip, a checkout of the repo reads it from shared/
+try:
+    from hash_signature import decode_signature, signature_similarity  # noqa: F401
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'shared'))
+    from hash_signature import decode_signature, signature_similarity  # noqa: F401
 
 
 def hashID(obj:list) -> str :
@@ -11,4 +21,4 @@ def getElements(js, attrs):
     return [(k,v) for k,v in js.items() if k in attrs]
 
 def key_remapper(dictionary, mapper):
-    return {mapper.get(k, k): v for k, v in dictionary.items()}
\ No newline at end of file
+    return {mapper.get(k, k): v for k, v in dictionary.items()}
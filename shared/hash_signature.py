@@ -0,0 +1,44 @@
+import numpy as np
+from base64 import b64decode, b64encode
+
+# Signature encodings for hash_text, anything without a prefix is the legacy '_'.join format
+UINT32_PREFIX = 'u32:'
+UINT64_PREFIX = 'u64:'
+MAX_UINT32 = (1 << 32) - 1
+
+
+def encode_signature(hash_np):
+    '''
+    param: hash_np: numpy MinHash signature
+    returns: hash_text: Str compact base64 encoding of the packed little-endian slots
+    MinHash values from datasketch never exceed 32 bits, so they are packed as uint32
+    unless a slot does not fit, in which case the full uint64 width is kept
+    '''
+    hash_np = np.asarray(hash_np, dtype=np.uint64)
+    if hash_np.size == 0 or int(hash_np.max()) <= MAX_UINT32:
+        return UINT32_PREFIX + b64encode(hash_np.astype('<u4').tobytes()).decode('ascii')
+    return UINT64_PREFIX + b64encode(hash_np.astype('<u8').tobytes()).decode('ascii')
+
+
+def decode_signature(hash_text):
+    '''
+    param: hash_text: Str signature as stored in the graph
+    returns: hash_np: numpy uint64 MinHash signature
+    Reads both the binary encoding and the legacy underscore-joined decimal strings
+    '''
+    if hash_text.startswith(UINT64_PREFIX):
+        return np.frombuffer(b64decode(hash_text[len(UINT64_PREFIX):]), dtype='<u8')
+    elif hash_text.startswith(UINT32_PREFIX):
+        return np.frombuffer(b64decode(hash_text[len(UINT32_PREFIX):]), dtype='<u4').astype(np.uint64)
+    else:
+        return np.array(hash_text.split('_'), dtype='uint64')
+
+
+def signature_similarity(hash_a, hash_b):
+    '''
+    returns: Float MinHash estimate of the Jaccard similarity of two signatures, the fraction
+        of equal slots, 0 for signatures of different sizes
+    '''
+    if hash_a.shape != hash_b.shape or hash_a.size == 0:
+        return 0.0
+    return float(np.count_nonzero(hash_a == hash_b)) / hash_a.size
@@ -0,0 +1,78 @@
+import spacy
+from spacy.language import Language
+from resource_cache import get_resource
+
+
+# Trained components of the en_core_web_* pipelines. None of the enrichment tasks
+# need them: matching runs on token text and lexical flags, sentences are split on
+# full stops and similarity only uses the static word vectors of the vocab.
+# Excluded components are never loaded, so they cost neither memory nor start-up time
+TRAINED_COMPONENTS = [
+    'tok2vec',
+    'tagger',
+    'parser',
+    'senter',
+    'attribute_ruler',
+    'lemmatizer',
+    'ner'
+]
+
+PROFILES = {
+    # Tokens only, enough for Matcher and PhraseMatcher patterns on TEXT, SHAPE, IS_DIGIT, ...
+    'tokenizer': {'model': 'en_core_web_sm', 'pipes': []},
+    # Tokens and sentence boundaries on full stops, without the parser
+    'sentences': {'model': 'en_core_web_sm', 'pipes': ['custom_sentencizer']},
+    # Tokens with the static word vectors used by Doc.similarity
+    'vectors': {'model': 'en_core_web_lg', 'pipes': []},
+}
+
+
+@Language.component('custom_sentencizer')
+def custom_sentencizer(doc):
+    '''Look for sentence start tokens by scanning for periods only.'''
+    for i, token in enumerate(doc[:-2]):  # The last token cannot start a sentence
+        if token.text == ".":
+            doc[i + 1].is_sent_start = True
+        else:
+            # Tell the default sentencizer to ignore this token
+            doc[i + 1].is_sent_start = False
+    # Setting the last token too means a doc too short for the loop still has sentence
+    # boundaries, otherwise Doc.sents raises E030
+    if len(doc) > 1:
+        doc[-1].is_sent_start = False
+    return doc
+
+
+def build_profile(name: str, model: str = None):
+    '''
+    param: name: one of PROFILES
+    param: model: installed spaCy package or path to load instead of the profile's own
+    returns: the pipeline with every trained component excluded and the profile's pipes added
+    '''
+    if name not in PROFILES:
+        raise ValueError(f'Unknown pipeline profile {name}, expected one of {list(PROFILES)}')
+    profile = PROFILES[name]
+
+    nlp = spacy.load(model or profile['model'], exclude=TRAINED_COMPONENTS)
+    for pipe in profile['pipes']:
+        nlp.add_pipe(pipe)
+    return nlp
+
+
+def load_profile(name: str, model: str = None, max_length: int = None):
+    '''
+    Loads a pipeline profile at most once per container
+    param: name: one of PROFILES
+    param: model: installed spaCy package or path to load instead of the profile's own
+    param: max_length: Int maximum number of characters of a text, spaCy's default if None
+    returns: the cached pipeline
+    '''
+    model = model or PROFILES.get(name, {}).get('model')
+
+    def loader():
+        nlp = build_profile(name, model)
+        if max_length is not None:
+            nlp.max_length = max_length
+        return nlp
+
+    return get_resource(f'{model}:{name}', loader)
@@ -0,0 +1,143 @@
+from io import BytesIO
+from lxml import etree
+
+
+HEADER_SECTIONS = ('dublinCore', 'dcat', 'orp')
+
+# Events yielded by iter_orpml
+HEADER = 'header'
+TEXT = 'text'
+ELEMENT = 'element'
+
+
+def local_name(tag) -> str:
+    '''Strips the namespace from a tag name'''
+    return tag.rsplit('}', 1)[-1]
+
+
+def as_source(document):
+    '''Accepts an ORPML document as str, bytes or a binary file-like object'''
+    if isinstance(document, str):
+        return BytesIO(document.encode('utf-8'))
+    if isinstance(document, (bytes, bytearray)):
+        return BytesIO(document)
+    return document
+
+
+def iter_orpml(document):
+    '''
+    Parses an ORPML document incrementally
+
+    Yields (HEADER, {section: {tag: text}}) exactly once, as soon as the <metadata>
+    header has been read, then for the <body> in document order
+    (TEXT, str) for text directly inside it and (ELEMENT, element) for every
+    child element once it is complete. Each element is released as soon as the
+    next one is read, so memory stays bounded by one page however long the
+    document is. Closing the generator early stops the parse, so a caller that
+    only needs the header never reads the body.
+    '''
+    context = etree.iterparse(
+        as_source(document),
+        events=('start', 'end'),
+        resolve_entities=False,
+        no_network=True,
+        huge_tree=True
+    )
+
+    header = {section: {} for section in HEADER_SECTIONS}
+    header_sent = False
+    body = None
+    body_started = False
+
+    for event, element in context:
+        if body is None:
+            name = local_name(element.tag)
+            if event == 'end' and name in HEADER_SECTIONS:
+                header[name] = {
+                    local_name(child.tag): ''.join(child.itertext())
+                    for child in element
+                    if isinstance(child.tag, str)
+                }
+            elif event == 'end' and name == 'metadata':
+                header_sent = True
+                yield HEADER, header
+                element.clear()
+            elif event == 'start' and name == 'body':
+                if not header_sent:
+                    header_sent = True
+                    yield HEADER, header
+                body = element
+            continue
+
+        if event != 'end':
+            continue
+
+        # The text before an element is only complete once the element has been read.
+        # It is the tail of the previous element and of any comments in between,
+        # which are dropped along with the previous element once their text is out
+        if element is body or element.getparent() is body:
+            if not body_started:
+                body_started = True
+                yield TEXT, body.text
+            for node in list(body):
+                if node is element:
+                    break
+                yield TEXT, node.tail
+                body.remove(node)
+            if element is body:
+                break
+            yield ELEMENT, element
+
+    if not header_sent:
+        yield HEADER, header
+
+
+def read_header(document) -> dict:
+    '''Reads only the <metadata> header, stopping before the body is parsed'''
+    events = iter_orpml(document)
+    try:
+        _, header = next(events)
+    finally:
+        events.close()
+    return header
+
+
+def iter_body_strings(events):
+    '''Yields the stripped, non-empty strings of the body in document order'''
+    for kind, item in events:
+        strings = (item,) if kind == TEXT else item.itertext()
+        for string in strings:
+            string = string.strip() if string else ''
+            if string:
+                yield string
+
+
+def iter_body_text(document):
+    '''Generator of the text of the body, one string at a time'''
+    events = iter_orpml(document)
+    next(events)
+    yield from iter_body_strings(events)
+
+
+def read_orpml(document) -> tuple:
+    '''
+    Reads the header and the flat body text in a single parse
+    returns: ({section: {tag: text}}, str) where the body strings are stripped and joined
+    '''
+    events = iter_orpml(document)
+    _, header = next(events)
+    text = ''.join(iter_body_strings(events))
+    return header, text
+
+
+def open_orpml(document) -> tuple:
+    '''
+    Reads the header and returns it with a generator of the body content,
+    the rest of the document is only parsed as the generator is consumed
+    returns: ({section: {tag: text}}, generator of the elements and of the text
+        directly inside the <body>, in document order)
+    '''
+    events = iter_orpml(document)
+    _, header = next(events)
+    content = (item for kind, item in events if kind == ELEMENT or item)
+    return header, content
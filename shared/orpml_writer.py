@@ -0,0 +1,155 @@
+import re
+import copy
+import textwrap
+from xml.sax.saxutils import escape
+from lxml import etree
+
+
+ORPML_NAMESPACE = 'http://www.beis.gov.uk/namespaces/orpml'
+HEADER_SECTIONS = ('dublinCore', 'dcat', 'orp')
+PREFIX_SECTIONS = {'dc': 'dublinCore', 'dcat': 'dcat', 'orp': 'orp'}
+
+# Characters XML 1.0 cannot represent, lxml refuses to write them
+ILLEGAL_XML_CHARACTERS_RE = re.compile(
+    '[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+
+def qualified(tag: str) -> str:
+    '''Puts a tag name in the ORPML namespace'''
+    return f'{{{ORPML_NAMESPACE}}}{tag}'
+
+
+def new_element(tag: str, text=None, parent=None):
+    '''Creates a (small) ORPML element, e.g. a nested header value, with the default namespace'''
+    if parent is None:
+        element = etree.Element(qualified(tag), nsmap={None: ORPML_NAMESPACE})
+    else:
+        element = etree.SubElement(parent, qualified(tag))
+    if text is not None:
+        element.text = xml_text(text)
+    return element
+
+
+def xml_text(value) -> str:
+    '''Turns a metadata value into text that can be written to the document'''
+    if value is None:
+        return ''
+    return ILLEGAL_XML_CHARACTERS_RE.sub('', str(value))
+
+
+def group_meta_tags(meta_tags: dict) -> dict:
+    '''
+    param: meta_tags: dict of prefixed tags, e.g. {'dc:title': ..., 'orp:status': ...}
+    returns: the tags split into the ORPML header sections, without their prefixes
+    '''
+    header = {section: {} for section in HEADER_SECTIONS}
+    for k, v in meta_tags.items():
+        prefix, tag = k.split(':', 1)
+        if prefix in PREFIX_SECTIONS:
+            header[PREFIX_SECTIONS[prefix]][tag] = v
+    return header
+
+
+def write_header(xf, header: dict) -> None:
+    '''
+    Writes the <metadata> header
+    Values are written as the text of a tag, unless they are already an element
+    (e.g. a nested list of keywords) in which case the element is written as it is
+    '''
+    with xf.element(qualified('metadata')):
+        for section in HEADER_SECTIONS:
+            with xf.element(qualified(section)):
+                for tag, value in header.get(section, {}).items():
+                    if etree.iselement(value):
+                        xf.write(value)
+                        continue
+                    with xf.element(qualified(tag)):
+                        xf.write(xml_text(value))
+
+
+def write_body(xf, body, div_class: str) -> None:
+    '''
+    Writes the <documentContent> one item at a time
+    Text items are wrapped in a <div class="{div_class}">, elements are copied as they are
+    '''
+    with xf.element(qualified('documentContent')):
+        with xf.element(qualified('html')):
+            with xf.element(qualified('body')):
+                for item in body:
+                    if etree.iselement(item):
+                        xf.write(item)
+                    else:
+                        with xf.element(qualified('div'), {'class': div_class}):
+                            xf.write(xml_text(item))
+
+
+def local_markup(element) -> str:
+    '''Serialises an element without the ORPML namespace, as it reads inside the <body>'''
+    element = copy.deepcopy(element)
+    element.tail = None
+    for node in element.iter():
+        if isinstance(node.tag, str):
+            node.tag = etree.QName(node).localname
+    etree.cleanup_namespaces(element)
+    return etree.tostring(element, encoding='unicode')
+
+
+def write_escaped_body(xf, body) -> None:
+    '''
+    Writes the <documentContent> with the <body> markup as the escaped text of the <html>
+    element, the format finalised documents have always been stored in. Each item is
+    serialised and wrapped to 80 characters on its own, so the body is still streamed
+    '''
+    with xf.element(qualified('documentContent')):
+        with xf.element(qualified('html')):
+            xf.write('<body>\n')
+            for item in body:
+                if etree.iselement(item):
+                    markup = local_markup(item)
+                else:
+                    markup = escape(xml_text(item))
+                if markup.strip():
+                    xf.write(textwrap.fill(markup, width=80) + '\n')
+            xf.write('</body>')
+
+
+def write_orpml(output, header: dict, body, div_class: str = 'page', escape_body: bool = False) -> None:
+    '''
+    Streams an ORPML document into a binary file-like object
+
+    params: output: writable binary file-like object, e.g. BytesIO
+            header: dict of {section: {tag: value}} for the dublinCore, dcat and orp sections
+            body: iterable of page text or elements, consumed lazily so only
+                  one item needs to be held in memory at a time
+            div_class: class of the <div> each text item is wrapped in
+            escape_body: write the body as escaped text, see write_escaped_body
+    '''
+    with etree.xmlfile(output, encoding='UTF-8') as xf:
+        xf.write_declaration(standalone=True)
+        with xf.element(qualified('orpml'), nsmap={None: ORPML_NAMESPACE}):
+            write_header(xf, header)
+            if escape_body:
+                write_escaped_body(xf, body)
+            else:
+                write_body(xf, body, div_class)
+
+
+def attach_meta_tags(orpml, meta_tags: dict) -> None:
+    '''
+    Appends prefixed meta tags to the header of an already parsed ORPML document
+    New tags take the namespace of the header section they are added to, missing sections are created
+    '''
+    metadata = orpml.find('{*}metadata')
+    if metadata is None:
+        metadata = etree.SubElement(orpml, qualified('metadata'))
+        orpml.insert(0, metadata)
+
+    for section, tags in group_meta_tags(meta_tags).items():
+        section_element = metadata.find(f'{{*}}{section}')
+        if section_element is None:
+            section_element = etree.SubElement(metadata, qualified(section))
+        namespace = etree.QName(section_element).namespace
+        for tag, value in tags.items():
+            element = etree.SubElement(
+                section_element, f'{{{namespace}}}{tag}' if namespace else tag)
+            element.text = xml_text(value)
@@ -0,0 +1,64 @@
+import time
+import threading
+from aws_lambda_powertools.logging.logger import Logger
+
+
+logger = Logger(child=True)
+
+# Resources live at module level so they survive between warm invocations of the container
+_resources = {}
+_load_seconds = {}
+_last_status = {}
+_uses = {}
+# Re-entrant, a loader may itself get another resource (e.g. a matcher built on a cached pipeline)
+_lock = threading.RLock()
+
+
+def get_resource(name: str, loader):
+    '''
+    param: name: Str key of the resource, e.g. the model name
+    param: loader: callable that builds the resource, only called on the first use
+    returns: the resource, loaded at most once per container
+    '''
+    if name in _resources:
+        _last_status[name] = 'warm'
+        _uses[name] += 1
+        return _resources[name]
+
+    with _lock:
+        # Another thread may have loaded it while this one was waiting
+        if name in _resources:
+            _last_status[name] = 'warm'
+            _uses[name] += 1
+            return _resources[name]
+
+        start = time.perf_counter()
+        resource = loader()
+        _load_seconds[name] = round(time.perf_counter() - start, 3)
+        _resources[name] = resource
+        _last_status[name] = 'cold'
+        _uses[name] = 1
+
+    logger.info(f'Cold load of {name} took {_load_seconds[name]}s')
+    return resource
+
+
+def resource_stats() -> dict:
+    '''Reports whether each resource was last served cold or warm and how long it took to load'''
+    return {
+        name: {
+            'status': _last_status[name],
+            'load_seconds': _load_seconds[name],
+            'uses': _uses[name]
+        }
+        for name in _resources
+    }
+
+
+def clear_resources() -> None:
+    '''Drops every cached resource, the next use of each will be a cold load'''
+    with _lock:
+        _resources.clear()
+        _load_seconds.clear()
+        _last_status.clear()
+        _uses.clear()
@@ -0,0 +1,71 @@
+import re
+import string
+
+
+# Control characters that are illegal in XML, same ranges as openpyxl's ILLEGAL_CHARACTERS_RE,
+# replaced by a space. str.translate is only faster than the regex on ASCII text, it
+# loses its fast path on the curly quotes and dashes most documents have
+ILLEGAL_CHARACTERS_RE = re.compile(r'[\000-\010\013\014\016-\037]')
+ILLEGAL_CHARACTERS_TABLE = str.maketrans(dict.fromkeys(
+    [*range(0o000, 0o011), 0o013, 0o014, *range(0o016, 0o040)], ' '))
+WHITESPACE_RE = re.compile(r'\s+')
+NUMBER_RE = re.compile(r'(\d+(\.\d+)?)')
+DOUBLED_PUNCTUATION_RE = re.compile('([' + re.escape(string.punctuation) + r'])\1')
+MERGED_WORDS_RE = re.compile(r'([a-z](?=[A-Z])|[A-Z](?=[A-Z][a-z]))')
+TAG_RE = re.compile(r'<.*?>')
+ELLIPSIS_RE = re.compile(r'\.{4,}')
+
+
+def remove_excess_punctuation(text: str) -> str:
+    '''
+    Removes spaced full stops and doubled punctuation
+    The pairs are removed one punctuation character at a time, in the order of
+    string.punctuation, as removing one pair can join another ('foo ;--; bar' becomes
+    'foo bar'), so a single regex pass would give different text. Text without any
+    doubled punctuation, the usual case, is returned after one scan
+    '''
+
+    text = text.replace(' .', '')
+    if DOUBLED_PUNCTUATION_RE.search(text) is None:
+        return text
+    for punc in string.punctuation:
+        text = text.replace(punc + punc, '')
+    return text
+
+
+def replace_illegal_characters(text: str) -> str:
+    if text.isascii():
+        return text.translate(ILLEGAL_CHARACTERS_TABLE)
+    return ILLEGAL_CHARACTERS_RE.sub(' ', text)
+
+
+def clean_text(text: str) -> str:
+    '''Clean the text by removing illegal characters and excess whitespace'''
+
+    text = str(text).replace('\n', ' ')
+    text = text.replace(' .', '. ')
+    text = NUMBER_RE.sub(r' \1 .', text)
+    text = WHITESPACE_RE.sub(' ', text)
+    text = remove_excess_punctuation(text=text)
+    text = replace_illegal_characters(text)
+
+    # Space out merged words by adding a space before a capital letter
+    # if it appears after a lowercase letter
+    text = MERGED_WORDS_RE.sub(r'\1 ', text)
+
+    # Tabs were already collapsed with the rest of the whitespace above
+    text = text.strip()
+    text = text.replace('_x000c_', '')
+    text = text.encode('ascii', 'ignore').decode('ascii')
+    text = WHITESPACE_RE.sub(' ', text)
+    text = TAG_RE.sub('', text)
+    text = ELLIPSIS_RE.sub('.', text)
+
+    return text
+
+
+def clean_text_stream(chunks):
+    '''Cleans an iterable of text chunks (e.g. pages) lazily, one chunk at a time'''
+
+    for chunk in chunks:
+        yield clean_text(chunk)
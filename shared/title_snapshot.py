@@ -0,0 +1,114 @@
+import os
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+
+
+# Snapshot of the candidate titles of the legislation table, partitioned by year.
+# Only uses SQL supported by the SQLite 3.7 that ships with the Lambda base images
+# (no UPSERT, no WITHOUT ROWID tables): the covering (year, candidate_title) index
+# keeps the titles of a year together so reading a year is a single range scan.
+# Version 2 added the content hash of every item, used to skip unchanged writes.
+FORMAT_VERSION = 2
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS titles (
+        candidate_title TEXT PRIMARY KEY,
+        year TEXT NOT NULL,
+        content_hash TEXT
+    );
+    CREATE INDEX IF NOT EXISTS titles_by_year ON titles (year, candidate_title);
+    CREATE TABLE IF NOT EXISTS snapshot (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+'''
+DEFAULT_CACHE_SIZE = 512
+# Stays under the 999 bound parameters allowed by older SQLite builds
+MAX_QUERY_PARAMETERS = 500
+
+
+def open_snapshot_for_update(path: str) -> sqlite3.Connection:
+    '''Opens (or creates) a snapshot file to add titles to'''
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+
+    # Snapshots written before version 2 have no content hashes
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(titles)')]
+    if 'content_hash' not in columns:
+        connection.execute('ALTER TABLE titles ADD COLUMN content_hash TEXT')
+    return connection
+
+
+def upsert_titles(connection: sqlite3.Connection, rows) -> int:
+    '''
+    param: rows: iterable of (candidate_title, year, content_hash), the hash may be None
+    returns: number of rows written, a title that moved year replaces its old row
+    '''
+    cursor = connection.executemany(
+        'INSERT OR REPLACE INTO titles (candidate_title, year, content_hash) VALUES (?, ?, ?)',
+        ((str(title), str(year), content_hash) for title, year, content_hash in rows))
+    return cursor.rowcount
+
+
+def content_hashes(connection: sqlite3.Connection, titles: list) -> dict:
+    '''
+    param: titles: candidate titles to look up
+    returns: dict of candidate title -> content hash recorded when it was last written
+    '''
+    hashes = {}
+    for start in range(0, len(titles), MAX_QUERY_PARAMETERS):
+        chunk = titles[start: start + MAX_QUERY_PARAMETERS]
+        hashes.update(connection.execute(
+            'SELECT candidate_title, content_hash FROM titles '
+            f'WHERE content_hash IS NOT NULL AND candidate_title IN ({", ".join("?" * len(chunk))})',
+            chunk))
+    return hashes
+
+
+def finalise_snapshot(connection: sqlite3.Connection) -> dict:
+    '''Stamps the snapshot with a new version, compacts it and closes it'''
+    rows = connection.execute('SELECT COUNT(*) FROM titles').fetchone()[0]
+    info = {
+        'format_version': str(FORMAT_VERSION),
+        'version': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S'),
+        'rows': str(rows)
+    }
+    connection.executemany(
+        'INSERT OR REPLACE INTO snapshot (key, value) VALUES (?, ?)', info.items())
+    connection.commit()
+    connection.execute('VACUUM')
+    connection.close()
+    return info
+
+
+class TitleSnapshot:
+    '''Read-only view of a snapshot file, with an LRU of the titles of each year'''
+
+    def __init__(self, path: str, cache_size: int = DEFAULT_CACHE_SIZE):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+
+        info = dict(self.connection.execute('SELECT key, value FROM snapshot'))
+        if not 1 <= int(info.get('format_version', 0)) <= FORMAT_VERSION:
+            raise ValueError(
+                f'Unsupported title snapshot format version {info.get("format_version")}')
+        self.version = info.get('version')
+        self.rows = int(info.get('rows', 0))
+
+        self.titles_for_year = lru_cache(maxsize=cache_size)(self._titles_for_year)
+
+    def _titles_for_year(self, year: str) -> tuple:
+        return tuple(row[0] for row in self.connection.execute(
+            'SELECT candidate_title FROM titles WHERE year = ? ORDER BY candidate_title',
+            (year,)))
+
+    def titles_for_years(self, years) -> dict:
+        '''
+        param: years: iterable of years, as int or str
+        returns: dict of year -> list of the candidate titles from that year
+        '''
+        return {str(year): list(self.titles_for_year(str(year))) for year in years}
+
+    def close(self) -> None:
+        self.connection.close()
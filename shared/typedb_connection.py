@@ -0,0 +1,160 @@
+import os
+import time
+import logging
+import threading
+from typedb.client import SessionType, TransactionType, TypeDB, TypeDBOptions
+from typedb.common.exception import (TypeDBClientException, CLIENT_CLOSED, SESSION_CLOSED,
+                                     TRANSACTION_CLOSED, UNABLE_TO_CONNECT)
+
+
+LOGGER = logging.getLogger(__name__)
+
+# The container is frozen between invocations, so the client cannot keep the session alive.
+# The server closes it after this long without use, which also bounds how long the session of
+# a container that is never invoked again stays open
+SESSION_IDLE_TIMEOUT_MS = int(os.environ.get('TYPEDB_SESSION_IDLE_TIMEOUT_MS', 10 * 60 * 1000))
+# A session idle for longer than this is checked with a round trip before it is used again
+HEALTH_CHECK_AFTER_SECONDS = float(os.environ.get('TYPEDB_HEALTH_CHECK_AFTER_SECONDS', 20))
+
+# Client errors raised because the connection or session is gone, the operation can be repeated
+# on a new session. Any other error, e.g. a TypeQL syntax or validation error, is the query's
+CONNECTION_ERRORS = (CLIENT_CLOSED, SESSION_CLOSED, TRANSACTION_CLOSED, UNABLE_TO_CONNECT)
+# The server only reports a session it no longer has (e.g. closed after its idle timeout) by message
+SESSION_ERROR_CODES = ('[SSN',)
+
+# Connections live at module level so they are shared by warm invocations of the container
+_connections = {}
+_lock = threading.Lock()
+
+
+def is_connection_error(e: TypeDBClientException) -> bool:
+    '''Whether an error is due to the connection or session rather than to the operation'''
+    if e.error_message is not None:
+        return e.error_message in CONNECTION_ERRORS
+    return any(code in str(e) for code in SESSION_ERROR_CODES)
+
+
+class TypeDBConnection:
+    '''
+    A TypeDB client and DATA session, opened on first use and kept for the life of the container
+
+    The session is health-checked after it has been idle and reopened when the check
+    fails or an operation fails on the connection. Connect and query times are recorded, see `stats`.
+    '''
+
+    def __init__(self, address: str, database: str,
+                 session_idle_timeout_ms: int = SESSION_IDLE_TIMEOUT_MS,
+                 health_check_after_seconds: float = HEALTH_CHECK_AFTER_SECONDS):
+        self.address = address
+        self.database = database
+        self.session_idle_timeout_ms = session_idle_timeout_ms
+        self.health_check_after_seconds = health_check_after_seconds
+        self.client = None
+        self._session = None
+        self.last_used = 0.0
+        self.metrics = {
+            'connects': 0,
+            'reconnects': 0,
+            'health_checks': 0,
+            'failures': 0,
+            'queries': 0,
+            'last_connect_ms': None,
+            'connect_ms': 0.0,
+            'last_query_ms': None,
+            'query_ms': 0.0
+        }
+
+    def _open(self) -> None:
+        start = time.perf_counter()
+        options = TypeDBOptions.core()
+        options.session_idle_timeout_millis = self.session_idle_timeout_ms
+        self.client = TypeDB.core_client(self.address)
+        self._session = self.client.session(self.database, SessionType.DATA, options)
+        elapsed = round((time.perf_counter() - start) * 1000, 1)
+
+        self.metrics['connects'] += 1
+        self.metrics['last_connect_ms'] = elapsed
+        self.metrics['connect_ms'] += elapsed
+        self.last_used = time.monotonic()
+        LOGGER.info(f'Opened TypeDB session to {self.address}/{self.database} in {elapsed}ms')
+
+    def _is_healthy(self) -> bool:
+        if self.client is None or self._session is None:
+            return False
+        if not self.client.is_open() or not self._session.is_open():
+            return False
+        if time.monotonic() - self.last_used < self.health_check_after_seconds:
+            return True
+
+        # Idle for a while, the server may have dropped the session while the container was frozen
+        self.metrics['health_checks'] += 1
+        try:
+            self._session.transaction(TransactionType.READ).close()
+            return True
+        except TypeDBClientException as e:
+            LOGGER.warning(f'TypeDB session failed its health check: {e}')
+            return False
+
+    def session(self):
+        '''returns: an open DATA session, (re)connecting if needed'''
+        if not self._is_healthy():
+            if self.client is not None:
+                self.metrics['reconnects'] += 1
+                self.close()
+            self._open()
+        return self._session
+
+    def run(self, operation):
+        '''
+        param: operation: callable taking the session, must be safe to repeat (e.g. read queries)
+        returns: the result of the operation, repeated once on a new session if the connection failed
+        Errors of the operation itself, e.g. of an invalid query, are raised straight away
+        '''
+        for attempt in range(2):
+            session = self.session()
+            start = time.perf_counter()
+            try:
+                result = operation(session)
+            except TypeDBClientException as e:
+                self.metrics['failures'] += 1
+                if attempt or not is_connection_error(e):
+                    raise
+                LOGGER.warning(f'TypeDB operation failed, reopening the session: {e}')
+                self.metrics['reconnects'] += 1
+                self.close()
+                continue
+
+            elapsed = round((time.perf_counter() - start) * 1000, 1)
+            self.metrics['queries'] += 1
+            self.metrics['last_query_ms'] = elapsed
+            self.metrics['query_ms'] += elapsed
+            self.last_used = time.monotonic()
+            return result
+
+    def close(self) -> None:
+        '''Closes the session and client, the next use opens new ones'''
+        for resource in (self._session, self.client):
+            if resource is None:
+                continue
+            try:
+                resource.close()
+            except TypeDBClientException as e:
+                LOGGER.debug(f'Ignoring error while closing TypeDB connection: {e}')
+        self._session = None
+        self.client = None
+
+    def stats(self) -> dict:
+        return {k: round(v, 1) if isinstance(v, float) else v for k, v in self.metrics.items()}
+
+
+def get_connection(address: str, database: str) -> TypeDBConnection:
+    '''
+    param: address: Str host:port of the TypeDB server
+    param: database: Str database name
+    returns: the container's connection to the database, created on first use
+    '''
+    key = (address, database)
+    with _lock:
+        if key not in _connections:
+            _connections[key] = TypeDBConnection(address, database)
+        return _connections[key]
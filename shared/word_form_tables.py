@@ -0,0 +1,141 @@
+import os
+import sys
+import gzip
+import json
+import logging
+from functools import lru_cache
+from word_forms_loc.word_forms_loc import get_word_forms
+
+LOGGER = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+# Written into the image at build time, see the Dockerfile
+TABLES_PATH = os.environ.get('WORD_FORM_TABLES_PATH', './word_form_tables.json.gz')
+# Words missing from the tables are worked out with WordNet once and kept in an LRU
+FALLBACK_CACHE_SIZE = int(os.environ.get('WORD_FORM_CACHE_SIZE', 4096))
+
+_stats = {'table_hits': 0, 'fallbacks': 0}
+
+
+def lemma_from_forms(word, forms: dict) -> str:
+    '''
+    The smallest form that appears first in the dictionary, as word_forms_loc.lemmatize,
+    the word itself if WordNet does not know it
+    '''
+    candidates = sorted(form for pos_forms in forms.values() for form in pos_forms)
+    candidates.sort(key=len)
+    return candidates[0] if candidates else word
+
+
+def noun_from_forms(lemma, forms: dict) -> str:
+    '''
+    The shortest noun form (the first in the dictionary of those), the lemma itself if it has
+    none. Stored with each keyword at ingestion and displayed by the search
+    '''
+    nouns = sorted(forms.get('n', []))
+    return sorted(nouns, key=len)[0] if nouns else lemma
+
+
+@lru_cache(maxsize=FALLBACK_CACHE_SIZE)
+def compute_lemma(word) -> str:
+    return lemma_from_forms(word, get_word_forms(word))
+
+
+@lru_cache(maxsize=FALLBACK_CACHE_SIZE)
+def compute_noun(lemma) -> str:
+    return noun_from_forms(lemma, get_word_forms(lemma))
+
+
+def build_tables(words) -> dict:
+    '''
+    param: words: iterable of the words of the keyword vocabulary
+    returns: dict of the lemma of every word and the noun form of every lemma
+    '''
+    lemmas, nouns = {}, {}
+    for word in words:
+        word = word.strip().lower()
+        if not word or word in lemmas:
+            continue
+        forms = get_word_forms(word)
+        lemma = lemma_from_forms(word, forms)
+        lemmas[word] = lemma
+        if lemma not in nouns:
+            nouns[lemma] = noun_from_forms(lemma, forms if lemma == word else get_word_forms(lemma))
+    return {'version': FORMAT_VERSION, 'lemmas': lemmas, 'nouns': nouns}
+
+
+def write_tables(tables: dict, path: str = TABLES_PATH) -> None:
+    '''Writes the tables as compact gzipped JSON, replacing any previous file atomically'''
+    temporary_path = f'{path}.tmp'
+    with gzip.open(temporary_path, 'wt', encoding='utf-8') as f:
+        json.dump(tables, f, separators=(',', ':'), sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+@lru_cache(maxsize=1)
+def load_tables(path: str = TABLES_PATH) -> dict:
+    '''
+    Reads the tables once per container
+    returns: the tables, empty ones (every word falls back to WordNet) if the file is
+        missing or was written by another version
+    '''
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            tables = json.load(f)
+    except (OSError, ValueError) as e:
+        LOGGER.warning(f'Word form tables unavailable, using WordNet for every word: {e}')
+        tables = {}
+    if tables.get('version') != FORMAT_VERSION:
+        tables = {'version': FORMAT_VERSION, 'lemmas': {}, 'nouns': {}}
+    LOGGER.info(f"Loaded word form tables: {len(tables['lemmas'])} lemmas, {len(tables['nouns'])} nouns")
+    return tables
+
+
+def lookup_lemma(word) -> str:
+    lemma = load_tables()['lemmas'].get(word)
+    if lemma is None:
+        _stats['fallbacks'] += 1
+        return compute_lemma(word)
+    _stats['table_hits'] += 1
+    return lemma
+
+
+def lookup_noun(lemma) -> str:
+    noun = load_tables()['nouns'].get(lemma)
+    if noun is None:
+        _stats['fallbacks'] += 1
+        return compute_noun(lemma)
+    _stats['table_hits'] += 1
+    return noun
+
+
+def word_form_stats() -> dict:
+    return {**_stats,
+            'lemma_cache': compute_lemma.cache_info()._asdict(),
+            'noun_cache': compute_noun.cache_info()._asdict()}
+
+
+def read_vocabulary(names) -> list:
+    '''The words of vocabulary files, one per line, skipping blank lines and # comments'''
+    words = []
+    for name in names:
+        with open(name, encoding='utf-8') as f:
+            words.extend(line for line in f.read().split('\n') if line.strip() and not line.startswith('#'))
+    return words
+
+
+if __name__ == '__main__':
+    # python word_form_tables.py <vocabulary file, one word per line ...>
+    # The vocabulary is the keywords in the graph, written by
+    # misc/bulk_enrichment/bulk_migration/migrate_keyword_noun.py
+    logging.basicConfig(level=logging.INFO)
+    if not sys.argv[1:]:
+        sys.exit('usage: python word_form_tables.py <vocabulary file> [...]')
+    words = read_vocabulary(sys.argv[1:])
+    # Empty tables would send every keyword to WordNet, so the image is not built without them
+    if not words:
+        sys.exit(f'{" ".join(sys.argv[1:])} lists no words, regenerate it with '
+                 'misc/bulk_enrichment/bulk_migration/migrate_keyword_noun.py')
+    tables = build_tables(words)
+    write_tables(tables)
+    LOGGER.info(f"Wrote {TABLES_PATH}: {len(tables['lemmas'])} lemmas, {len(tables['nouns'])} nouns")
@@ -0,0 +1,109 @@
+'''
+Checks the LSH journal and its compaction with two containers sharing one bucket
+
+Run from the root of the repo, with the requirements of lambdas/check_duplicate installed:
+    python -m pytest tests
+'''
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas', 'check_duplicate'))
+import lsh_store  # noqa: E402
+from lsh_index import LSHIndex  # noqa: E402
+from lsh_store import LSHStore  # noqa: E402
+
+
+class MemoryS3:
+    '''The part of the S3 client the LSH store uses, over a dict'''
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+
+    def list_objects_v2(self, Bucket, Prefix, StartAfter='', ContinuationToken=None, MaxKeys=2):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix) and key > StartAfter)
+        start = int(ContinuationToken or 0)
+        page = keys[start: start + MaxKeys]
+        response = {'Contents': [{'Key': key} for key in page], 'IsTruncated': start + MaxKeys < len(keys)}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + MaxKeys)
+        return response
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+
+        class Body:
+            def read(_):
+                return self.objects[Key]
+        return {'Body': Body()}
+
+    def put_object(self, Body, Bucket, Key):
+        self.objects[Key] = Body
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            self.objects.pop(item['Key'], None)
+
+
+def signature(seed):
+    return np.random.default_rng(seed).integers(0, 2 ** 63, 256, dtype=np.uint64)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setattr(lsh_store, 'SETTLE_SECONDS', 0)
+    monkeypatch.setattr(lsh_store, 'COMPACT_AFTER', 2)
+    return MemoryS3()
+
+
+def empty_index():
+    return LSHIndex()
+
+
+def test_container_behind_compaction_reloads(s3):
+    first, second = LSHStore(s3, 'bucket'), LSHStore(s3, 'bucket')
+    first.sync(empty_index)
+    second.sync(empty_index)
+
+    # Two compactions by the first container delete the journal the second has not read
+    for batch in (range(0, 3), range(3, 6)):
+        for n in batch:
+            first.insert(f'doc{n}', signature(n))
+        first.sync(empty_index)
+    assert not any(key.endswith('doc0.insert') for key in s3.objects)
+
+    second.sync(empty_index)
+    for n in range(6):
+        assert second.query(signature(n))[0] == f'doc{n}'
+
+
+def test_removals_reach_other_container(s3):
+    first, second = LSHStore(s3, 'bucket'), LSHStore(s3, 'bucket')
+    first.sync(empty_index)
+    second.sync(empty_index)
+
+    first.insert('doc0', signature(0))
+    second.sync(empty_index)
+    assert second.query(signature(0)) == ['doc0']
+
+    first.remove('doc0')
+    second.sync(empty_index)
+    assert second.query(signature(0)) == []
+
+
+def test_unsettled_entries_are_queried(s3, monkeypatch):
+    monkeypatch.setattr(lsh_store, 'SETTLE_SECONDS', 3600)
+    first, second = LSHStore(s3, 'bucket'), LSHStore(s3, 'bucket')
+    first.sync(empty_index)
+    second.sync(empty_index)
+
+    first.insert('doc0', signature(0))
+    second.sync(empty_index)
+    assert second.query(signature(0)) == ['doc0']
+    assert second.position == lsh_store.START
@@ -0,0 +1,80 @@
+'''
+Checks that ORPML written by orpml_writer reads back the same through orpml_reader
+
+Run from the root of the repo, with lxml installed:
+    python -m pytest tests
+'''
+import os
+import sys
+from io import BytesIO
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+from orpml_reader import open_orpml, read_header, read_orpml  # noqa: E402
+from orpml_writer import group_meta_tags, new_element, write_orpml  # noqa: E402
+
+
+META_TAGS = {
+    'dc:title': 'Guidance on waste & water <draft>',
+    'dc:identifier': 'doc00001',
+    'dc:created': None,
+    'dcat:language': 'en\x0b',
+    'orp:status': 'published',
+}
+PAGES = ['First page, with <markup> & "quotes"', '', 'Second page\x00 text', 'Último página']
+
+
+def written(body, **kwargs) -> bytes:
+    output = BytesIO()
+    write_orpml(output, group_meta_tags(META_TAGS), body, **kwargs)
+    return output.getvalue()
+
+
+def test_header_round_trip():
+    header = read_header(written(PAGES))
+    assert header['dublinCore'] == {
+        'title': 'Guidance on waste & water <draft>', 'identifier': 'doc00001', 'created': ''}
+    # Characters XML cannot hold are dropped rather than failing the document
+    assert header['dcat'] == {'language': 'en'}
+    assert header['orp'] == {'status': 'published'}
+
+
+def test_body_round_trip():
+    header, text = read_orpml(written(iter(PAGES)))
+    assert header == read_header(written(PAGES))
+    assert text == 'First page, with <markup> & "quotes"Second page textÚltimo página'
+
+
+def test_open_orpml_yields_body_in_order():
+    header, content = open_orpml(written(PAGES))
+    items = list(content)
+    assert all(etree.QName(item).localname == 'div' for item in items)
+    assert [item.text for item in items] == [
+        'First page, with <markup> & "quotes"', None, 'Second page text', 'Último página']
+
+
+def test_elements_and_text_are_copied_through():
+    table = new_element('table')
+    new_element('td', 'cell', parent=new_element('tr', parent=table))
+    _, content = open_orpml(written(['before', table, 'after']))
+    items = list(content)
+    assert [etree.QName(item).localname for item in items] == ['div', 'table', 'div']
+    assert ''.join(items[1].itertext()) == 'cell'
+
+    # Text directly inside the body, as the finalised documents are read back
+    document = (b'<orpml><metadata/><documentContent><html><body>lead'
+                b'<p>one</p>between<p>two</p>tail</body></html></documentContent></orpml>')
+    _, content = open_orpml(document)
+    assert [item if isinstance(item, str) else item.text for item in content] == [
+        'lead', 'one', 'between', 'two', 'tail']
+
+
+def test_escaped_body_reads_back_as_markup():
+    _, content = open_orpml(written(PAGES))
+    document = written(content, escape_body=True)
+    html = etree.fromstring(document).find('{*}documentContent/{*}html')
+    body = etree.fromstring(html.text)
+    assert body.tag == 'body'
+    assert [div.text for div in body] == [
+        'First page, with <markup> & "quotes"', None, 'Second page text', 'Último página']
+    assert all(div.get('class') == 'page' for div in body)